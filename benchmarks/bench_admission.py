@@ -0,0 +1,97 @@
+"""
+Нагрузка в 10 раз выше пропускной способности LLM: с допуском и без.
+
+LLM моделируется семафором на max_active одновременных запросов
+с фиксированной задержкой, поэтому пропускная способность равна
+max_active / latency запросов в секунду. Запросы разных пользователей
+приходят равномерно с частотой load * пропускная способность.
+Без допуска очередь растет, и задержка получают все; с допуском
+лишние запросы быстро получают отказ, а p99 обслуженных ограничен
+сроком ожидания в очереди.
+
+Запуск: python benchmarks/bench_admission.py [--load 10] [--duration 5]
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from admission import AdmissionController, Overloaded
+
+
+def percentile(values, fraction: float) -> float:
+    """Перцентиль по отсортированному списку значений."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_round(name: str, admission, max_active: int, latency: float, rate: float, duration: float):
+    llm = asyncio.Semaphore(max_active)
+    latencies = []
+    shed_latencies = []
+    peak_pending = 0
+    tasks = []
+    
+    async def simulated_llm():
+        async with llm:
+            await asyncio.sleep(latency)
+    
+    async def request(user_id: int):
+        started = time.perf_counter()
+        try:
+            if admission is None:
+                await simulated_llm()
+            else:
+                await admission.run(user_id, simulated_llm())
+        except Overloaded:
+            shed_latencies.append(time.perf_counter() - started)
+            return
+        latencies.append(time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    total = int(rate * duration)
+    for user_id in range(total):
+        # Равномерный поток запросов с учетом уже прошедшего времени
+        delay = started + user_id / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(request(user_id)))
+        peak_pending = max(peak_pending, sum(1 for task in tasks if not task.done()))
+    await asyncio.gather(*tasks)
+    
+    print(f"{name:<12} обслужено {len(latencies)}/{total}, отказов {len(shed_latencies)}, "
+          f"ожидающих корутин до {peak_pending}")
+    print(f"{'':<12} задержка обслуженных: p50 {percentile(latencies, 0.5):.2f} с, "
+          f"p99 {percentile(latencies, 0.99):.2f} с, макс {max(latencies):.2f} с")
+    if shed_latencies:
+        print(f"{'':<12} отказ за p99 {percentile(shed_latencies, 0.99) * 1000:.0f} мс")
+
+
+async def run_benchmark(load: float, duration: float, max_active: int, latency: float,
+                        max_queue: int, queue_timeout: float):
+    capacity = max_active / latency
+    rate = capacity * load
+    print(f"Пропускная способность LLM: {capacity:.0f} запросов/с, нагрузка: {rate:.0f} запросов/с "
+          f"({load:.0f}x) в течение {duration:.0f} с")
+    await run_round("Без допуска", None, max_active, latency, rate, duration)
+    admission = AdmissionController(max_active, max_queue, queue_timeout)
+    await run_round("С допуском", admission, max_active, latency, rate, duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--load', type=float, default=10)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--max-active', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--max-queue', type=int, default=30)
+    parser.add_argument('--queue-timeout', type=float, default=2)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.load, args.duration, args.max_active, args.latency,
+                              args.max_queue, args.queue_timeout))
+
+
+if __name__ == '__main__':
+    main()
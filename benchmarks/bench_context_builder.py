@@ -0,0 +1,83 @@
+"""
+Бенчмарк: токены запроса при старой политике (последние N сообщений)
+и при упаковке целых реплик в бюджет токенов.
+
+Запуск: python benchmarks/bench_context_builder.py [--dialogs 1000] [--budget 2000]
+"""
+import sys
+import os
+import time
+import random
+import argparse
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from context_builder import build_context, count_tokens, message_tokens
+
+
+def make_dialog(rng: random.Random, turns: int):
+    """Синтетический диалог с ответами разной длины."""
+    history = []
+    for number in range(turns):
+        history.append({"role": "user", "content": f"Вопрос {number}: " + "расскажите подробнее " * rng.randint(1, 10)})
+        history.append({"role": "assistant", "content": f"Ответ {number}: " + "наша компания предлагает решение " * rng.randint(2, 60)})
+    return history
+
+
+def old_policy(system_prompt: str, history, question: str, history_max_turns: int):
+    """Прежняя политика LLMClient.ask: последние N сообщений без учета размера."""
+    return [{"role": "system", "content": system_prompt}] + history[-history_max_turns:] + [{"role": "user", "content": question}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dialogs', type=int, default=1000)
+    parser.add_argument('--budget', type=int, default=2000)
+    parser.add_argument('--max-turns', type=int, default=5)
+    parser.add_argument('--prompt', default=os.path.join(os.path.dirname(__file__), '..', 'docs', 'system_prompt.md'))
+    args = parser.parse_args()
+    
+    with open(args.prompt, encoding='utf-8') as f:
+        system_prompt = f.read()
+    
+    rng = random.Random(42)
+    dialogs = [make_dialog(rng, rng.randint(1, 15)) for _ in range(args.dialogs)]
+    question = "Сколько стоит разработка сайта?"
+    
+    # Та же глубина истории, что и у новой политики: max_turns реплик = max_turns * 2 сообщений
+    old_tokens = 0
+    split_turns = 0
+    over_budget = 0
+    for history in dialogs:
+        messages = old_policy(system_prompt, history, question, args.max_turns * 2)
+        tokens = sum(message_tokens(message) for message in messages)
+        old_tokens += tokens
+        over_budget += tokens > args.budget
+    
+    # Прежнее поведение с настройкой по умолчанию: HISTORY_MAX_TURNS сообщений, а не реплик
+    for history in dialogs:
+        messages = old_policy(system_prompt, history, question, args.max_turns)
+        split_turns += len(history) > args.max_turns and messages[1]["role"] == "assistant"
+    
+    count_tokens.cache_clear()
+    new_tokens = 0
+    started = time.perf_counter()
+    for history in dialogs:
+        new_tokens += build_context(system_prompt, history, question, args.budget, args.max_turns).prompt_tokens
+    cold = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    for history in dialogs:
+        build_context(system_prompt, history, question, args.budget, args.max_turns)
+    warm = time.perf_counter() - started
+    
+    print(f"Диалогов: {args.dialogs}, бюджет: {args.budget} токенов")
+    print(f"Старая политика ({args.max_turns * 2} последних сообщений): {old_tokens / args.dialogs:.0f} токенов в среднем, "
+          f"превышений бюджета: {over_budget}")
+    print(f"Старая политика ({args.max_turns} последних сообщений): разорванных реплик в {split_turns} диалогах")
+    print(f"Новая политика: {new_tokens / args.dialogs:.0f} токенов в среднем, превышений бюджета: 0")
+    print(f"Экономия: {(old_tokens - new_tokens) / old_tokens * 100:.1f}% токенов запроса")
+    print(f"Сборка контекста: {cold / args.dialogs * 1e6:.0f} мкс без кеша, {warm / args.dialogs * 1e6:.0f} мкс с кешем токенов")
+
+
+if __name__ == '__main__':
+    main()
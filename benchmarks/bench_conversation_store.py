@@ -0,0 +1,68 @@
+"""
+Бенчмарк памяти: 100k чатов в словаре истории и в ConversationStore.
+
+Запуск: python benchmarks/bench_conversation_store.py [--chats 100000] [--turns 20]
+"""
+import sys
+import os
+import time
+import argparse
+import tracemalloc
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from conversation_store import ConversationStore
+
+
+def simulate_dict(chats: int, turns: int) -> dict:
+    """Старое поведение: словарь со всей историей каждого чата."""
+    chat_history = {}
+    for number in range(turns):
+        for chat_id in range(chats):
+            history = chat_history.get(chat_id, [])
+            history.append({"role": "user", "content": f"Вопрос {number} от {chat_id}"})
+            history.append({"role": "assistant", "content": f"Ответ {number} для {chat_id}"})
+            chat_history[chat_id] = history
+    return chat_history
+
+
+def simulate_store(chats: int, turns: int, store: ConversationStore) -> ConversationStore:
+    """Новое поведение: хранится только окно, число чатов и сообщений ограничено."""
+    for number in range(turns):
+        for chat_id in range(chats):
+            store.get(chat_id)
+            store.extend(chat_id, [
+                {"role": "user", "content": f"Вопрос {number} от {chat_id}"},
+                {"role": "assistant", "content": f"Ответ {number} для {chat_id}"}
+            ])
+    return store
+
+
+def measure(name: str, simulation):
+    """Печатает прирост памяти и время выполнения симуляции (время включает накладные расходы tracemalloc)."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = simulation()
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name}: память {current / 1024 / 1024:.1f} МБ (пик {peak / 1024 / 1024:.1f} МБ), время {elapsed:.2f} с")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=100000)
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--window', type=int, default=5)
+    parser.add_argument('--max-chats', type=int, default=10000)
+    parser.add_argument('--max-messages', type=int, default=100000)
+    args = parser.parse_args()
+    
+    measure("dict (без ограничений)", lambda: simulate_dict(args.chats, args.turns))
+    store = ConversationStore(args.window, args.max_chats, args.max_messages, ttl_seconds=86400)
+    measure("ConversationStore", lambda: simulate_store(args.chats, args.turns, store))
+    print(f"Статистика хранилища: {store.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Бенчмарк: доля вопросов, отвеченных из FAQ без LLM, время поиска
+и сэкономленное время ответа на журнале вопросов.
+
+Журнал - JSON лог бота (LOG_FORMAT=json, LOG_BODIES=full): берутся тексты
+сообщений пользователей и время ответов LLM. Без --log используется
+синтетический журнал из перефразированных частых и прочих вопросов.
+
+Запуск: python benchmarks/bench_faq_index.py [--log logs/bot.log] [--threshold 0.75]
+"""
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import statistics
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from faq_index import FaqIndex, load_faq
+
+# Прочие вопросы синтетического журнала: на них должна отвечать LLM
+OTHER_QUESTIONS = [
+    "Меня зовут Ольга, у нас сеть кофеен",
+    "Какие сроки у интернет-магазина?",
+    "Есть ли поддержка после запуска?",
+    "Можно интегрировать CRM с сайтом?",
+    "А сколько стоит?",
+    "Нужен сайт для ресторана",
+    "Работаете с госзаказчиками?",
+    "Спасибо, подумаю",
+    "Мой телефон +7 921 555-44-33",
+    "А если нужно срочно?"
+]
+
+# Перефразировки частых вопросов, которых нет в файле FAQ дословно
+FAQ_PARAPHRASES = [
+    "какие услуги оказываете",
+    "Сколько стоит разработать сайт?",
+    "сколько стоит сделать сайт",
+    "дайте ваш телефон",
+    "как с вами можно связаться?",
+    "Вы делаете мобильные приложения?",
+    "нужно приложение под андроид и iOS, сделаете?",
+    "чем вы занимаетесь?",
+    "где ваш офис?"
+]
+
+# Оценка времени ответа LLM, если в журнале нет записей о времени ответов
+DEFAULT_LLM_LATENCY = 2.5
+
+
+def read_replay_log(path: str):
+    """Вопросы пользователей и средняя задержка ответа LLM из JSON лога бота."""
+    questions = []
+    latencies = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            body = entry.get('body')
+            message = entry.get('message', '')
+            if 'отправил сообщение' in message and body and not body.startswith('<'):
+                questions.append(body)
+            elif message.startswith('LLM ответ') and entry.get('latency_ms'):
+                latencies.append(entry['latency_ms'] / 1000)
+    return questions, (statistics.mean(latencies) if latencies else None)
+
+
+def synthetic_replay(size: int, faq_share: float):
+    """Вопросы синтетического журнала и множество тех, на которые верен ответ из FAQ."""
+    rng = random.Random(7)
+    questions = [rng.choice(FAQ_PARAPHRASES) if rng.random() < faq_share else rng.choice(OTHER_QUESTIONS)
+                 for _ in range(size)]
+    return questions, set(FAQ_PARAPHRASES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', help='JSON лог бота для воспроизведения')
+    parser.add_argument('--faq', default=os.path.join(os.path.dirname(__file__), '..', 'docs', 'faq.md'))
+    parser.add_argument('--threshold', type=float, default=0.75)
+    parser.add_argument('--size', type=int, default=5000, help='Размер синтетического журнала')
+    parser.add_argument('--faq-share', type=float, default=0.4, help='Доля частых вопросов в синтетическом журнале')
+    args = parser.parse_args()
+
+    llm_latency = None
+    expected = None
+    if args.log:
+        questions, llm_latency = read_replay_log(args.log)
+        print(f"Журнал {args.log}: {len(questions)} вопросов")
+    else:
+        questions, expected = synthetic_replay(args.size, args.faq_share)
+        print(f"Синтетический журнал: {len(questions)} вопросов, частых {args.faq_share:.0%}")
+    if not questions:
+        print("В журнале нет вопросов пользователей (нужны LOG_FORMAT=json и LOG_BODIES=full)")
+        return
+    llm_latency = llm_latency or DEFAULT_LLM_LATENCY
+
+    started = time.perf_counter()
+    index = FaqIndex(load_faq(args.faq), args.threshold)
+    build = time.perf_counter() - started
+
+    durations = []
+    hits = 0
+    false_hits = 0
+    for question in questions:
+        started = time.perf_counter()
+        match = index.search(question)
+        accepted = match is not None and index.accepts(question, match)
+        durations.append(time.perf_counter() - started)
+        if accepted:
+            hits += 1
+            false_hits += expected is not None and question not in expected
+    durations.sort()
+
+    print(f"Индекс: {len(index)} разделов, построен за {build * 1000:.1f} мс, порог {args.threshold}")
+    print(f"Поиск: медиана {statistics.median(durations) * 1e6:.0f} мкс, "
+          f"p99 {durations[int(len(durations) * 0.99)] * 1e6:.0f} мкс")
+    print(f"Ответов из FAQ: {hits} из {len(questions)} ({hits / len(questions):.0%})")
+    if expected is not None:
+        faq_questions = sum(question in expected for question in questions)
+        print(f"Из них ошибочных (вопрос не из FAQ): {false_hits}; "
+              f"частых вопросов отвечено из FAQ: {(hits - false_hits) / faq_questions:.0%}")
+    saved = hits - false_hits
+    print(f"Сэкономлено запросов к LLM: {saved}, времени ответа ~{saved * llm_latency:.0f} с "
+          f"(по {llm_latency:.2f} с на ответ LLM)")
+
+
+if __name__ == '__main__':
+    main()
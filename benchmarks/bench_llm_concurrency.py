@@ -0,0 +1,54 @@
+"""
+Бенчмарк: N одновременных чатов против заглушки OpenRouter.
+
+Показывает, что N параллельных запросов LLMClient.ask завершаются
+примерно за время одного запроса.
+
+Запуск: python benchmarks/bench_llm_concurrency.py [--chats 20] [--latency 0.5]
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fake_openrouter import run_fake_openrouter
+
+
+async def run_benchmark(chats: int, latency: float):
+    """Измеряет время одного запроса и N одновременных."""
+    async with run_fake_openrouter(latency=latency) as server:
+        os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'bench_token')
+        os.environ.setdefault('OPENROUTER_API_KEY', 'bench_key')
+        os.environ['OPENROUTER_API_URL'] = server.base_url
+        os.environ.setdefault('LLM_MAX_CONCURRENCY', str(chats))
+        from llm_client import LLMClient
+        client = LLMClient()
+        
+        started = time.perf_counter()
+        await client.ask("Один чат")
+        single = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        answers = await asyncio.gather(*(client.ask(f"Чат {i}") for i in range(chats)))
+        concurrent = time.perf_counter() - started
+        
+        await client.close()
+        
+    failed = sum(1 for answer in answers if answer is None)
+    print(f"Один запрос: {single:.3f} с")
+    print(f"{chats} одновременных чатов: {concurrent:.3f} с (ошибок: {failed})")
+    print(f"Отношение: {concurrent / single:.2f}x (последовательно было бы ~{chats}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.5)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.chats, args.latency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Бенчмарк задержек event loop при логировании: синхронный FileHandler
+против очереди с фоновой записью (log_pipeline).
+
+Сообщения поступают с постоянной частотой, на каждое пишутся две записи
+с текстом. Замеряется время вызовов логгера в потоке event loop и опоздание
+корутины-пульса, которая просыпается каждую миллисекунду.
+
+Запуск: python benchmarks/bench_logging.py [--rate 500] [--seconds 3] [--disk-delay-ms 0.5]
+"""
+import sys
+import os
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from log_pipeline import TEXT_FORMAT, setup_logging
+
+PULSE_INTERVAL = 0.001
+
+
+class SlowStream:
+    """Файл, каждая запись в который занимает delay секунд (медленный или занятый диск)."""
+    
+    def __init__(self, stream, delay: float):
+        self.stream = stream
+        self.delay = delay
+        
+    def write(self, text: str):
+        time.sleep(self.delay)
+        return self.stream.write(text)
+    
+    def __getattr__(self, name: str):
+        return getattr(self.stream, name)
+
+
+def slow_down(handler: logging.StreamHandler, delay: float):
+    if delay:
+        handler.stream = SlowStream(handler.stream, delay)
+
+
+def setup_sync_logging(log_file: str, delay: float) -> logging.Handler:
+    """Старое поведение: FileHandler на корневом логгере, запись в потоке event loop."""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.FileHandler(log_file, encoding='utf-8')
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    slow_down(handler, delay)
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    return handler
+
+
+async def pulse(stalls: list, stop: asyncio.Event):
+    """Фиксирует, на сколько event loop опоздал разбудить задачу."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + PULSE_INTERVAL
+        await asyncio.sleep(PULSE_INTERVAL)
+        stalls.append(max(0.0, loop.time() - expected))
+
+
+async def produce(rate: int, seconds: float, body: str, call_times: list):
+    """Имитирует поток сообщений: rate сообщений в секунду, на каждое две записи с текстом."""
+    logger = logging.getLogger("handlers")
+    
+    async def handle(number: int):
+        started = time.perf_counter()
+        logger.info("Пользователь %s отправил сообщение", number, extra={'chat_id': number, 'body': body})
+        logger.info("LLM ответ для пользователя %s", number, extra={'chat_id': number, 'latency_ms': 1, 'body': body})
+        call_times.append(time.perf_counter() - started)
+        
+    tasks = []
+    interval = 1.0 / rate
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for number in range(int(rate * seconds)):
+        delay = started + number * interval - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(handle(number)))
+    await asyncio.gather(*tasks)
+
+
+def percentile(values: list, share: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+async def run(rate: int, seconds: float, body: str) -> dict:
+    stalls = []
+    call_times = []
+    stop = asyncio.Event()
+    pulse_task = asyncio.create_task(pulse(stalls, stop))
+    await produce(rate, seconds, body, call_times)
+    stop.set()
+    await pulse_task
+    
+    stalls.sort()
+    call_times.sort()
+    return {
+        'call_p99_us': percentile(call_times, 0.99) * 1e6,
+        'call_total_ms': sum(call_times) * 1000,
+        'stall_p99_ms': percentile(stalls, 0.99) * 1000,
+        'stall_max_ms': stalls[-1] * 1000 if stalls else 0.0
+    }
+
+
+def report(name: str, result: dict):
+    print(f"  {name}: вызовы логгера p99 {result['call_p99_us']:.0f} мкс, суммарно {result['call_total_ms']:.0f} мс; "
+          f"опоздание loop p99 {result['stall_p99_ms']:.1f} мс, максимум {result['stall_max_ms']:.1f} мс")
+
+
+def compare(args, body: str, delay: float):
+    with tempfile.TemporaryDirectory() as directory:
+        handler = setup_sync_logging(os.path.join(directory, 'sync.log'), delay)
+        report("FileHandler в event loop", asyncio.run(run(args.rate, args.seconds, body)))
+        handler.close()
+        
+        config = {
+            'LOG_FILE': os.path.join(directory, 'queue.log'),
+            'LOG_LEVEL': 'INFO',
+            'LOG_FORMAT': 'json',
+            'LOG_ROTATION': 'size',
+            'LOG_MAX_BYTES': 50 * 1024 * 1024,
+            'LOG_ROTATE_WHEN': 'midnight',
+            'LOG_BACKUP_COUNT': 1,
+            'LOG_BODIES': 'truncate',
+            'LOG_BODY_MAX_CHARS': 100,
+            'LOG_BODY_SAMPLE_RATE': 1.0
+        }
+        listener = setup_logging(config, console=False)
+        for queued_handler in listener.handlers:
+            slow_down(queued_handler, delay)
+        report("QueueHandler + фоновый поток", asyncio.run(run(args.rate, args.seconds, body)))
+        listener.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=int, default=500, help="сообщений в секунду")
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--body-size', type=int, default=500)
+    parser.add_argument('--disk-delay-ms', type=float, default=0.5, help="задержка записи для сценария медленного диска")
+    args = parser.parse_args()
+    body = ("Текст сообщения пользователя " * args.body_size)[:args.body_size]
+    
+    print("Быстрый диск:")
+    compare(args, body, 0.0)
+    print(f"Медленный диск ({args.disk_delay_ms} мс на запись):")
+    compare(args, body, args.disk_delay_ms / 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Бенчмарк хвостовых задержек LLMClient при сбоях основной модели.
+
+Основная модель отвечает за latency, но часть ответов задерживается
+на slow-latency секунд, а часть завершается ошибкой. Сравнивается
+одна модель и пул с резервной моделью, резервными запросами и
+автоматами отключения.
+
+Запуск: python benchmarks/bench_model_router.py [--requests 300] [--slow-rate 0.1] [--error-rate 0.05]
+"""
+import sys
+import os
+import time
+import asyncio
+import logging
+import argparse
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fake_openrouter import ModelFault, run_fake_openrouter
+
+PRIMARY_MODEL = "primary/model"
+BACKUP_MODEL = "backup/model"
+
+
+def percentile(values: list, share: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def run_scenario(base_url: str, requests: int, concurrency: int, fallback: str) -> dict:
+    """Отправляет запросы с ограниченной параллельностью и собирает задержки."""
+    os.environ['OPENROUTER_API_URL'] = base_url
+    os.environ['LLM_MODEL_NAME'] = PRIMARY_MODEL
+    os.environ['LLM_FALLBACK_MODELS'] = fallback
+    from llm_client import LLMClient
+    client = LLMClient()
+    
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def one(number: int):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            answer = await client.ask(f"Вопрос {number}")
+            latencies.append(time.perf_counter() - started)
+            if answer is None:
+                failures += 1
+                
+    await asyncio.gather(*(one(number) for number in range(requests)))
+    await client.close()
+    
+    latencies.sort()
+    return {
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1],
+        'failures': failures,
+        'hedged': client.router.hedged_requests
+    }
+
+
+def report(name: str, result: dict):
+    print(f"{name}: p50 {result['p50']:.3f} с, p95 {result['p95']:.3f} с, p99 {result['p99']:.3f} с, "
+          f"максимум {result['max']:.3f} с, ошибок {result['failures']}, резервных запросов {result['hedged']}")
+
+
+async def run_benchmark(args):
+    faults = {
+        PRIMARY_MODEL: ModelFault(latency=args.latency, slow_rate=args.slow_rate,
+                                  slow_latency=args.slow_latency, error_rate=args.error_rate),
+        BACKUP_MODEL: ModelFault(latency=args.latency * 1.5)
+    }
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'bench_token')
+    os.environ.setdefault('OPENROUTER_API_KEY', 'bench_key')
+    os.environ.setdefault('LLM_MAX_CONCURRENCY', str(args.concurrency * 2))
+    os.environ.setdefault('LLM_HEDGE_MIN_DELAY', str(args.latency))
+    os.environ.setdefault('LLM_HEDGE_MAX_DELAY', str(args.latency * 5))
+    
+    async with run_fake_openrouter(faults=faults) as server:
+        report("Одна модель", await run_scenario(server.base_url, args.requests, args.concurrency, ""))
+        report("Пул с резервной моделью", await run_scenario(server.base_url, args.requests, args.concurrency, BACKUP_MODEL))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--slow-rate', type=float, default=0.1)
+    parser.add_argument('--slow-latency', type=float, default=2.0)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    args = parser.parse_args()
+    # Ошибки моделей ожидаемы, в выводе нужны только итоги
+    logging.basicConfig(level=logging.CRITICAL)
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == '__main__':
+    main()
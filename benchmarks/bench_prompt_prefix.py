@@ -0,0 +1,69 @@
+"""
+Бенчмарк: время до первого фрагмента ответа и токены из кеша промта
+с отметкой системного промта для кеширования у провайдера и без нее.
+
+Заглушка OpenRouter тратит prefill-delay секунд на каждые 1000 символов
+промта, не взятых из кеша, и кеширует только отмеченный системный промт.
+
+Запуск: python benchmarks/bench_prompt_prefix.py [--requests 20] [--prefill-delay 0.05]
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+import statistics
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fake_openrouter import run_fake_openrouter
+
+
+async def measure(base_url: str, cache_mode: str, model: str, requests: int):
+    """Последовательные потоковые запросы: медиана времени до первого фрагмента и токены из кеша."""
+    os.environ['OPENROUTER_API_URL'] = base_url
+    os.environ['LLM_MODEL_NAME'] = model
+    os.environ['LLM_PROMPT_CACHE'] = cache_mode
+    from llm_client import LLMClient
+    from metrics import LLM_TOKENS
+    client = LLMClient()
+
+    cached_before = LLM_TOKENS.labels("cached").value
+    prompt_before = LLM_TOKENS.labels("prompt").value
+    first_fragment = []
+    for number in range(requests):
+        started = time.perf_counter()
+        async for _ in client.ask_stream(f"Вопрос {number}: сколько стоит разработка сайта?"):
+            if len(first_fragment) == number:
+                first_fragment.append(time.perf_counter() - started)
+    await client.close()
+
+    cached = LLM_TOKENS.labels("cached").value - cached_before
+    prompt = LLM_TOKENS.labels("prompt").value - prompt_before
+    return statistics.median(first_fragment), cached, prompt
+
+
+async def run_benchmark(requests: int, prefill_delay: float, model: str):
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'bench_token')
+    os.environ.setdefault('OPENROUTER_API_KEY', 'bench_key')
+
+    print(f"Модель {model}, {requests} запросов, обработка промта {prefill_delay} с на 1000 символов")
+    for cache_mode in ('off', 'auto'):
+        # Свежая заглушка на каждый режим: кеш провайдера начинается пустым
+        async with run_fake_openrouter(prefill_delay=prefill_delay) as server:
+            first_fragment, cached, prompt = await measure(server.base_url, cache_mode, model, requests)
+        share = cached / prompt * 100 if prompt else 0.0
+        print(f"LLM_PROMPT_CACHE={cache_mode:<4}: первый фрагмент (медиана) {first_fragment * 1000:.0f} мс, "
+              f"токенов из кеша {cached:.0f} из {prompt:.0f} ({share:.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--prefill-delay', type=float, default=0.05)
+    parser.add_argument('--model', default='anthropic/claude-3.5-haiku')
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.requests, args.prefill_delay, args.model))
+
+
+if __name__ == '__main__':
+    main()
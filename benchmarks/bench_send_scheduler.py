@@ -0,0 +1,82 @@
+"""
+Отправка пиковой нагрузки в Telegram напрямую и через планировщик.
+
+Заглушка Telegram отвечает 429, если запросов больше global_limit в секунду
+всего или chat_limit в секунду в один чат. Прямая отправка теряет сообщения
+на ошибках 429, планировщик держит частоту ниже лимитов. Печатает
+доставленные сообщения, число ответов 429 и пропускную способность.
+
+Запуск: python benchmarks/bench_send_scheduler.py [--messages 300] [--chats 100]
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+
+from fake_telegram import run_fake_telegram
+from send_scheduler import SendScheduler
+
+# Лимиты заглушки, близкие к лимитам Telegram
+GLOBAL_LIMIT = 30
+CHAT_LIMIT = 2
+
+
+def make_bot(base_url: str) -> Bot:
+    return Bot(token='123456:BENCH', session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+
+
+async def send_direct(bot: Bot, messages):
+    """Все сообщения отправляются сразу, ошибки 429 не повторяются."""
+    async def send(chat_id, text):
+        try:
+            await bot.send_message(chat_id, text)
+        except TelegramRetryAfter:
+            pass
+    await asyncio.gather(*(send(chat_id, text) for chat_id, text in messages))
+
+
+async def send_scheduled(bot: Bot, messages, global_rate: float):
+    scheduler = SendScheduler(global_rate=global_rate, chat_rate=1.0, chat_burst=1, max_retries=5)
+    jobs = [scheduler.submit(chat_id, lambda chat_id=chat_id, text=text: bot.send_message(chat_id, text))
+            for chat_id, text in messages]
+    await asyncio.gather(*jobs, return_exceptions=True)
+    await scheduler.close()
+
+
+async def run_round(name: str, messages, send):
+    async with run_fake_telegram(global_limit=GLOBAL_LIMIT, chat_limit=CHAT_LIMIT) as telegram:
+        bot = make_bot(telegram.base_url)
+        started = time.perf_counter()
+        await send(bot, messages)
+        elapsed = time.perf_counter() - started
+        await bot.session.close()
+        delivered = len(telegram.answers)
+        print(f"{name:<12} доставлено {delivered}/{len(messages)}, ответов 429: {telegram.rejected}, "
+              f"{elapsed:.2f} с, {delivered / elapsed:.1f} сообщений/с")
+
+
+async def run_benchmark(count: int, chats: int, global_rate: float):
+    messages = [(1000 + index % chats, f"сообщение {index}") for index in range(count)]
+    print(f"Сообщений: {count}, чатов: {chats}, лимиты заглушки: {GLOBAL_LIMIT}/с всего, {CHAT_LIMIT}/с в чат")
+    await run_round("Напрямую", messages, send_direct)
+    await run_round("Планировщик", messages, lambda bot, items: send_scheduled(bot, items, global_rate))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=300)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--global-rate', type=float, default=25)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.messages, args.chats, args.global_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Бенчмарк холодного запуска: время импорта модулей бота по python -X importtime
+и время создания диспетчера с сервисами обработчиков.
+
+Каждый замер выполняется в отдельном процессе с пустым окружением: импорт
+не должен требовать секретов, а кеш модулей не должен искажать результат.
+
+Запуск: python benchmarks/bench_startup.py [--repeat 3] [--top 10]
+"""
+import sys
+import os
+import json
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Set
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Модули бота в порядке зависимостей: от настроек до точки входа
+MODULES = ['config', 'metrics', 'faq_index', 'lead_extraction', 'llm_client', 'services', 'handlers', 'bot']
+
+# Создание диспетчера с фиктивными секретами: сервисы не обращаются к сети до запуска
+DISPATCHER_SCRIPT = """
+import json, time
+started = time.perf_counter()
+from bot import create_dispatcher
+imported = time.perf_counter()
+create_dispatcher()
+created = time.perf_counter()
+print(json.dumps({'import': imported - started, 'dispatcher': created - imported}))
+"""
+
+
+class ImportRecord(NamedTuple):
+    """Строка вывода -X importtime: модуль, собственное и накопленное время в секундах."""
+    module: str
+    self_time: float
+    cumulative: float
+
+
+def clean_environment(**overrides: str) -> Dict[str, str]:
+    """Окружение без настроек бота: только то, что нужно интерпретатору."""
+    environment = {key: os.environ[key] for key in ('PATH', 'HOME', 'SYSTEMROOT') if key in os.environ}
+    environment['PYTHONPATH'] = SRC_DIR
+    environment.update(overrides)
+    return environment
+
+
+def parse_importtime(output: str) -> List[ImportRecord]:
+    """
+    Разбирает вывод python -X importtime.
+
+    Args:
+        output: stderr процесса
+
+    Returns:
+        Записи об импортированных модулях в порядке завершения импорта
+    """
+    records = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        records.append(ImportRecord(name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return records
+
+
+def measure_import(module: str) -> List[ImportRecord]:
+    """Импортирует модуль в новом процессе с пустым окружением и возвращает записи importtime."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(SRC_DIR), env=clean_environment(), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Импорт {module} завершился ошибкой:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def import_total(records: List[ImportRecord], module: str) -> float:
+    """Накопленное время импорта модуля верхнего уровня."""
+    return next(record.cumulative for record in records if record.module == module)
+
+
+def own_modules() -> Set[str]:
+    """Модули бота из src."""
+    return {name[:-3] for name in os.listdir(SRC_DIR) if name.endswith('.py')}
+
+
+def own_import_time(records: List[ImportRecord]) -> float:
+    """Собственное время импорта модулей бота без сторонних пакетов."""
+    own = own_modules()
+    return sum(record.self_time for record in records if record.module in own)
+
+
+def third_party_packages(records: List[ImportRecord]) -> Set[str]:
+    """
+    Сторонние пакеты верхнего уровня, которые пытался импортировать процесс.
+
+    Стандартная библиотека, модули бота, служебные модули интерпретатора
+    (с "_" в начале) и хуки site не учитываются. В записи importtime попадают
+    и неудавшиеся необязательные импорты внутри try.
+    """
+    own = own_modules()
+    packages = {record.module.split('.')[0] for record in records}
+    return {package for package in packages
+            if package not in sys.stdlib_module_names and package not in own
+            and not package.startswith('_') and package not in ('sitecustomize', 'usercustomize')}
+
+
+def top_packages(records: List[ImportRecord], limit: int) -> List[tuple]:
+    """Пакеты верхнего уровня с наибольшим собственным временем импорта."""
+    totals = defaultdict(float)
+    for record in records:
+        totals[record.module.split('.')[0]] += record.self_time
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def measure_dispatcher() -> Dict[str, float]:
+    """Время импорта bot и создания диспетчера с сервисами в новом процессе."""
+    environment = clean_environment(
+        TELEGRAM_BOT_TOKEN='123456:TEST', OPENROUTER_API_KEY='test',
+        HISTORY_BACKEND='memory', LEAD_EXTRACTION='false', METRICS_ENABLED='false'
+    )
+    result = subprocess.run([sys.executable, '-c', DISPATCHER_SCRIPT], cwd=os.path.dirname(SRC_DIR),
+                            env=environment, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Создание диспетчера завершилось ошибкой:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов каждого замера, берется медиана')
+    parser.add_argument('--top', type=int, default=10, help='Сколько самых медленных пакетов показать')
+    args = parser.parse_args()
+
+    print(f"{'Модуль':<18}{'импорт, мс':>12}{'свой код, мс':>15}")
+    slowest = None
+    for module in MODULES:
+        runs = [measure_import(module) for _ in range(args.repeat)]
+        total = statistics.median(import_total(records, module) for records in runs)
+        own = statistics.median(own_import_time(records) for records in runs)
+        print(f"{module:<18}{total * 1000:>12.1f}{own * 1000:>15.1f}")
+        slowest = runs[-1]
+
+    print(f"\nСамые медленные пакеты при импорте {MODULES[-1]} (собственное время):")
+    for package, seconds in top_packages(slowest, args.top):
+        print(f"  {package:<24}{seconds * 1000:>8.1f} мс")
+
+    runs = [measure_dispatcher() for _ in range(args.repeat)]
+    print(f"\nЗапуск: импорт bot {statistics.median(run['import'] for run in runs) * 1000:.0f} мс, "
+          f"создание диспетчера и сервисов {statistics.median(run['dispatcher'] for run in runs) * 1000:.0f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Нагрузочный тест webhook: синтетические обновления на локальный сервер.
+
+Обработчик имитирует работу бота паузой, сервер подтверждает запрос
+сразу. Печатает пропускную способность приема и задержку подтверждения.
+
+Запуск: python benchmarks/bench_webhook.py [--updates 5000] [--concurrency 100]
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+import statistics
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher, Router, types
+
+from fake_telegram import make_message_update
+from webhook import create_webhook_app
+
+SECRET = 'bench_secret'
+
+
+def percentile(values, fraction: float) -> float:
+    """Перцентиль по отсортированному списку значений."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_benchmark(updates: int, concurrency: int, handler_delay: float):
+    handled = 0
+    router = Router()
+    
+    @router.message()
+    async def simulated_handler(message: types.Message):
+        nonlocal handled
+        await asyncio.sleep(handler_delay)
+        handled += 1
+    
+    dp = Dispatcher()
+    dp.include_router(router)
+    app = create_webhook_app(Bot(token='123456:BENCH'), dp, {'WEBHOOK_SECRET': SECRET, 'WEBHOOK_PATH': '/webhook'})
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = f"http://{host}:{port}/webhook"
+    
+    latencies = []
+    queue = asyncio.Queue()
+    for update_id in range(updates):
+        queue.put_nowait(make_message_update(update_id, update_id % 1000, f"сообщение {update_id}"))
+    
+    async def sender(session: aiohttp.ClientSession):
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}) as response:
+                await response.read()
+                assert response.status == 200
+            latencies.append(time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    
+    # Остановка сервера дожидается обработки всех принятых обновлений
+    await runner.cleanup()
+    drained = time.perf_counter() - started
+    
+    print(f"Обновлений: {updates}, параллельных отправителей: {concurrency}, обработчик: {handler_delay * 1000:.0f} мс")
+    print(f"Прием: {updates / elapsed:.0f} обновлений/с за {elapsed:.2f} с")
+    print(f"Подтверждение: p50 {statistics.median(latencies) * 1000:.1f} мс, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} мс")
+    print(f"Обработано: {handled}, все обработаны к {drained:.2f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--handler-delay', type=float, default=0.5)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.updates, args.concurrency, args.handler_delay))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Пропускная способность многопроцессного режима в зависимости от числа процессов.
+
+Для каждого числа процессов супервизор получает синтетические обновления
+из заглушки Telegram, рабочие процессы отвечают через заглушку OpenRouter.
+Печатает время до последнего ответа и число ответов в секунду.
+
+Каждое обновление приходит из своего чата: сообщения одного чата
+объединяются в один ответ, и число ответов было бы непредсказуемым.
+
+Запуск: python benchmarks/bench_workers.py [--workers 1,2,4] [--updates 2000]
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fake_openrouter import run_fake_openrouter
+from fake_telegram import make_message_update, run_fake_telegram
+from supervisor import Supervisor, serve_supervisor
+
+
+def set_environment(telegram_url: str, openrouter_url: str, workers: int, log_dir: str):
+    """Окружение наследуется рабочими процессами, поэтому настройки задаются через него."""
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:BENCH',
+        'OPENROUTER_API_KEY': 'bench_api_key',
+        'TELEGRAM_API_URL': telegram_url,
+        'OPENROUTER_API_URL': openrouter_url,
+        'BOT_MODE': 'polling',
+        'BOT_WORKERS': str(workers),
+        'CHAT_DEBOUNCE_SECONDS': '0',
+        # Заглушка не ограничивает частоту, измеряется обработка, а не лимиты Telegram
+        'TELEGRAM_GLOBAL_RATE': '100000',
+        'TELEGRAM_CHAT_RATE': '100000',
+        'METRICS_ENABLED': 'false',
+        'LOG_LEVEL': 'WARNING',
+        'LOG_FILE': os.path.join(log_dir, 'bot.log'),
+        'LEAD_DB_PATH': os.path.join(log_dir, 'leads.db')
+    })
+
+
+async def run_round(workers: int, updates: int, llm_latency: float, log_dir: str) -> float:
+    """Обрабатывает updates обновлений заданным числом процессов и возвращает время в секундах."""
+    async with run_fake_openrouter(latency=llm_latency) as llm, run_fake_telegram() as telegram:
+        set_environment(telegram.base_url, llm.base_url, workers, log_dir)
+        from config import get_config
+        config = get_config()
+        supervisor = Supervisor(config, workers)
+        stop = asyncio.Event()
+        serving = asyncio.create_task(serve_supervisor(supervisor, config, stop))
+        
+        # Пока процесс запускается, время его активности выставлено в будущее;
+        # замер начинается, когда все процессы отметились сами
+        while any(worker['heartbeat_age'] < 0 for worker in supervisor.health()['workers']):
+            await asyncio.sleep(0.05)
+        
+        started = time.perf_counter()
+        for update_id in range(updates):
+            telegram.push(make_message_update(update_id, 1000 + update_id, f"вопрос {update_id}"))
+        while len(telegram.answers) < updates:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        
+        stop.set()
+        await serving
+        return elapsed
+
+
+async def run_benchmark(worker_counts, updates: int, llm_latency: float):
+    print(f"Обновлений: {updates}, задержка LLM: {llm_latency * 1000:.0f} мс")
+    with tempfile.TemporaryDirectory() as log_dir:
+        for workers in worker_counts:
+            elapsed = await run_round(workers, updates, llm_latency, log_dir)
+            print(f"Процессов: {workers:>2}: {elapsed:.2f} с, {updates / elapsed:.0f} ответов/с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--llm-latency', type=float, default=0.05)
+    args = parser.parse_args()
+    worker_counts = [int(value) for value in args.workers.split(',')]
+    asyncio.run(run_benchmark(worker_counts, args.updates, args.llm_latency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Локальная заглушка OpenRouter API для тестов и бенчмарков.
+
+Эмулирует эндпоинт /chat/completions с настраиваемой задержкой,
+в том числе потоковый режим (stream=true, Server-Sent Events).
+Для отдельных моделей можно задать сбои: задержку, долю медленных
+ответов и долю ошибок; потоковый ответ можно оборвать на середине.
+Можно эмулировать кеш префикса промта у провайдера: обработка промта
+занимает время пропорционально его длине, а системное сообщение
+с отметкой cache_control при повторе берется из кеша.
+"""
+import asyncio
+import json
+import random
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+
+from aiohttp import web
+
+
+@dataclass
+class FakeOpenRouter:
+    """Запущенная заглушка: адрес и принятые запросы."""
+    base_url: str = ""
+    requests: List[Dict] = field(default_factory=list)
+
+
+@dataclass
+class ModelFault:
+    """Сбои одной модели: постоянная задержка, редкие медленные ответы и ошибки."""
+    latency: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    error_rate: float = 0.0
+
+
+# Приблизительное число символов на токен в usage эмуляции кеша промта
+CHARS_PER_TOKEN = 3
+
+
+def message_text(message: Dict) -> str:
+    """Текст сообщения: строка или части содержимого, как у отмеченного для кеширования промта."""
+    content = message.get("content") or ""
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content)
+
+
+def is_cache_marked(message: Dict) -> bool:
+    """Отмечено ли сообщение для кеширования префикса (cache_control в частях содержимого)."""
+    content = message.get("content")
+    return isinstance(content, list) and any("cache_control" in part for part in content)
+
+
+def create_fake_openrouter_app(server: FakeOpenRouter, latency: float = 0.0,
+                               answer: str = "Ответ заглушки", token_delay: float = 0.0,
+                               faults: Optional[Dict[str, ModelFault]] = None,
+                               prefill_delay: float = 0.0, stream_cut_after: Optional[int] = None) -> web.Application:
+    """
+    Создает aiohttp приложение, отвечающее как OpenRouter.
+    
+    Args:
+        server: Состояние заглушки, куда записываются принятые запросы
+        latency: Задержка перед ответом в секундах
+        answer: Текст ответа модели
+        token_delay: Пауза между фрагментами потокового ответа в секундах
+        faults: Сбои по именам моделей
+        prefill_delay: Обработка промта, секунды на 1000 символов не из кеша; если задана,
+            usage считается по длине промта и включает cached_tokens
+        stream_cut_after: Обрыв соединения после этого числа фрагментов потокового ответа
+        
+    Returns:
+        aiohttp приложение заглушки
+    """
+    cached_prefixes = set()
+    
+    async def prefill(payload: dict) -> Dict:
+        """Эмулирует обработку промта и возвращает usage запроса."""
+        if not prefill_delay:
+            return {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+        messages = payload.get("messages") or []
+        total_chars = sum(len(message_text(message)) for message in messages)
+        cached_chars = 0
+        if messages and is_cache_marked(messages[0]):
+            prefix = (payload.get("model"), message_text(messages[0]))
+            if prefix in cached_prefixes:
+                cached_chars = len(prefix[1])
+            cached_prefixes.add(prefix)
+        await asyncio.sleep(prefill_delay * (total_chars - cached_chars) / 1000)
+        prompt_tokens = total_chars // CHARS_PER_TOKEN
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": 5,
+            "total_tokens": prompt_tokens + 5,
+            "prompt_tokens_details": {"cached_tokens": cached_chars // CHARS_PER_TOKEN}
+        }
+    
+    async def chat_completions(request: web.Request) -> web.Response:
+        payload = await request.json()
+        server.requests.append(payload)
+        await asyncio.sleep(latency)
+        
+        fault = (faults or {}).get(payload.get("model"))
+        if fault is not None:
+            delay = fault.latency
+            if random.random() < fault.slow_rate:
+                delay += fault.slow_latency
+            await asyncio.sleep(delay)
+            if random.random() < fault.error_rate:
+                return web.json_response({"error": {"message": "Injected failure", "code": 502}}, status=502)
+        
+        usage = await prefill(payload)
+        if payload.get("stream"):
+            return await stream_answer(request, payload, usage)
+        return web.json_response({
+            "id": "fake-completion",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": usage
+        })
+        
+    async def stream_answer(request: web.Request, payload: dict, usage: Dict) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b": OPENROUTER PROCESSING\n\n")
+        for index, word in enumerate(answer.split(" ")):
+            if index == stream_cut_after:
+                request.transport.close()
+                return response
+            content = word if index == 0 else " " + word
+            chunk = {"choices": [{"index": 0, "delta": {"content": content}}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            await asyncio.sleep(token_delay)
+        if payload.get("usage", {}).get("include"):
+            chunk = {"choices": [{"index": 0, "delta": {}}], "usage": usage}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+    
+    app = web.Application()
+    app.router.add_post('/chat/completions', chat_completions)
+    return app
+
+
+@asynccontextmanager
+async def run_fake_openrouter(**options) -> AsyncIterator[FakeOpenRouter]:
+    """
+    Запускает заглушку на свободном локальном порту.
+    
+    Args:
+        **options: Параметры create_fake_openrouter_app
+        
+    Yields:
+        Заглушка; server.base_url — значение для OPENROUTER_API_URL
+    """
+    server = FakeOpenRouter()
+    runner = web.AppRunner(create_fake_openrouter_app(server, **options))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    server.base_url = f"http://{host}:{port}"
+    try:
+        yield server
+    finally:
+        await runner.cleanup()
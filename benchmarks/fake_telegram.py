@@ -0,0 +1,188 @@
+"""
+Синтетические обновления и заглушка Telegram Bot API для тестов и бенчмарков.
+"""
+import asyncio
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional
+
+from aiohttp import web
+
+
+def make_message_update(update_id: int, chat_id: int, text: str) -> Dict:
+    """
+    Создает обновление Telegram с текстовым сообщением из личного чата.
+    
+    Args:
+        update_id: Идентификатор обновления
+        chat_id: Идентификатор чата (совпадает с идентификатором пользователя)
+        text: Текст сообщения
+        
+    Returns:
+        Обновление в формате Bot API
+    """
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": f"user{chat_id}"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            "text": text
+        }
+    }
+
+
+# Служебное сообщение, которое бот отправляет до ответа LLM
+PLACEHOLDER_TEXT = "Думаю..."
+
+# Максимальное ожидание новых обновлений в getUpdates, секунды
+MAX_POLL_WAIT = 0.5
+
+# Методы, к которым применяются лимиты частоты
+LIMITED_METHODS = {'sendMessage', 'editMessageText', 'deleteMessage'}
+
+
+@dataclass
+class FakeTelegram:
+    """
+    Запущенная заглушка Bot API: очередь обновлений и вызванные методы.
+    
+    Если заданы global_limit или chat_limit, запросы сверх этого числа
+    за последнюю секунду (всего или в один чат) получают ответ 429.
+    Функции из listeners вызываются для каждого записанного вызова.
+    """
+    base_url: str = ""
+    updates: List[Dict] = field(default_factory=list)
+    calls: List[Dict] = field(default_factory=list)
+    next_message_id: int = 1_000_000
+    global_limit: int = 0
+    chat_limit: int = 0
+    retry_after: int = 1
+    rejected: int = 0
+    recent: Deque[float] = field(default_factory=deque)
+    recent_by_chat: Dict[int, Deque[float]] = field(default_factory=lambda: defaultdict(deque))
+    listeners: List[Callable[[Dict], None]] = field(default_factory=list)
+    
+    def push(self, update: Dict):
+        """Добавляет обновление, которое бот получит через getUpdates."""
+        self.updates.append(update)
+    
+    def over_limit(self, chat_id: int) -> bool:
+        """Учитывает запрос в чат и проверяет, превышен ли лимит частоты."""
+        now = time.monotonic()
+        windows = [(self.recent, self.global_limit), (self.recent_by_chat[chat_id], self.chat_limit)]
+        for window, _ in windows:
+            while window and now - window[0] > 1.0:
+                window.popleft()
+        if any(limit and len(window) >= limit for window, limit in windows):
+            self.rejected += 1
+            return True
+        for window, _ in windows:
+            window.append(now)
+        return False
+    
+    @property
+    def answers(self) -> List[Dict]:
+        """Отправленные ботом ответы без служебного сообщения "Думаю..."."""
+        return [call for call in self.calls if call['method'] == 'sendMessage' and call.get('text') != PLACEHOLDER_TEXT]
+
+
+def create_fake_telegram_app(server: FakeTelegram) -> web.Application:
+    """
+    Создает aiohttp приложение, отвечающее как Telegram Bot API.
+    
+    getUpdates отдает обновления из server.updates с учетом offset,
+    sendMessage и editMessageText возвращают сообщение, остальные
+    методы - true. Все вызовы записываются в server.calls.
+    
+    Args:
+        server: Состояние заглушки
+        
+    Returns:
+        aiohttp приложение заглушки
+    """
+    async def read_params(request: web.Request) -> Dict:
+        # aiogram отправляет параметры формой, другие клиенты - JSON
+        if request.content_type == 'application/json':
+            return await request.json()
+        params = dict(request.query)
+        params.update(await request.post())
+        return params
+    
+    async def get_updates(params: Dict) -> List[Dict]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + min(float(params.get('timeout') or 0), MAX_POLL_WAIT)
+        while True:
+            # Подтвержденные обновления (update_id < offset) удаляются, как в Bot API
+            server.updates[:] = [update for update in server.updates if update['update_id'] >= offset]
+            if server.updates or time.monotonic() >= deadline:
+                return server.updates[:limit]
+            await asyncio.sleep(0.01)
+    
+    def make_message(params: Dict) -> Dict:
+        server.next_message_id += 1
+        return {
+            "message_id": int(params.get('message_id') or server.next_message_id),
+            "date": int(time.time()),
+            "chat": {"id": int(params['chat_id']), "type": "private"},
+            "text": params.get('text', "")
+        }
+    
+    async def handle_method(request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = await read_params(request)
+        if method in LIMITED_METHODS and server.over_limit(int(params['chat_id'])):
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {server.retry_after}",
+                "parameters": {"retry_after": server.retry_after}
+            }, status=429)
+        call = {'method': method, **params}
+        server.calls.append(call)
+        for listener in server.listeners:
+            listener(call)
+        
+        if method == 'getUpdates':
+            result = await get_updates(params)
+        elif method in ('sendMessage', 'editMessageText'):
+            result = make_message(params)
+        elif method == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+    
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', handle_method)
+    app.router.add_get('/bot{token}/{method}', handle_method)
+    return app
+
+
+@asynccontextmanager
+async def run_fake_telegram(updates: Optional[List[Dict]] = None, **limits) -> AsyncIterator[FakeTelegram]:
+    """
+    Запускает заглушку Bot API на свободном локальном порту.
+    
+    Args:
+        updates: Обновления, доступные через getUpdates сразу после запуска
+        **limits: global_limit, chat_limit и retry_after заглушки
+        
+    Yields:
+        Заглушка; server.base_url — значение для TELEGRAM_API_URL
+    """
+    server = FakeTelegram(updates=list(updates or []), **limits)
+    runner = web.AppRunner(create_fake_telegram_app(server), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    server.base_url = f"http://{host}:{port}"
+    try:
+        yield server
+    finally:
+        await runner.cleanup()
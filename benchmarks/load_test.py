@@ -0,0 +1,353 @@
+"""
+Нагрузочный тест бота целиком: обработчики, LLM клиент и отправка в Telegram.
+
+Бот работает в этом процессе в режиме polling против заглушки Telegram
+Bot API и заглушки OpenRouter. Сценарий задает популяцию пользователей:
+каждый пользователь пишет сообщение, ждет ответа, думает и пишет снова.
+Отчет: пропускная способность, задержка от сообщения до ответа
+(p50/p95/p99), рост истории в памяти (chat_history) и задержка
+event loop. Результат сохраняется в JSON, чтобы сравнивать коммиты.
+
+В потоковом режиме ответом считается первая правка "Думаю...".
+
+Запуск: python benchmarks/load_test.py [--population steady] [--llm-latency 0.2]
+        [--output results.json] [--compare benchmarks/results/steady-abc1234.json]
+"""
+import sys
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import subprocess
+import tempfile
+import tracemalloc
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fake_openrouter import ModelFault, run_fake_openrouter
+from fake_telegram import PLACEHOLDER_TEXT, make_message_update, run_fake_telegram
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# Модель, к которой применяется доля ошибок заглушки
+MODEL_NAME = 'load-test/model'
+
+# Интервал проверки задержки event loop, секунды
+LOOP_PROBE_INTERVAL = 0.05
+
+QUESTIONS = [
+    "Сколько стоит разработка сайта?",
+    "Какие услуги вы оказываете?",
+    "Сделаете мобильное приложение под iOS и Android?",
+    "Какие сроки у интернет-магазина?",
+    "Есть ли поддержка после запуска?",
+    "Можно интегрировать CRM с сайтом?"
+]
+
+
+@dataclass
+class Population:
+    """Сценарий нагрузки: пользователи, их сообщения и паузы."""
+    users: int
+    messages_per_user: int
+    think_time: float
+    ramp_up: float
+    description: str
+
+
+POPULATIONS = {
+    'steady': Population(50, 5, 1.0, 5.0, "Равномерный поток пользователей с паузами"),
+    'burst': Population(300, 1, 0.0, 0.0, "Всплеск: все пользователи пишут одновременно"),
+    'chatty': Population(20, 30, 0.1, 1.0, "Длинные диалоги с короткими паузами, рост истории"),
+    'smoke': Population(3, 2, 0.0, 0.0, "Проверка работы теста")
+}
+
+
+def percentile(values, fraction: float) -> float:
+    """Перцентиль по отсортированному списку значений."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(values: List[float], scale: float = 1.0) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    return {
+        'p50': round(percentile(values, 0.50) * scale, 4),
+        'p95': round(percentile(values, 0.95) * scale, 4),
+        'p99': round(percentile(values, 0.99) * scale, 4),
+        'max': round(max(values) * scale, 4)
+    }
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def set_environment(telegram_url: str, openrouter_url: str, args):
+    """Настройки бота читаются из окружения при импорте обработчиков."""
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:LOAD',
+        'OPENROUTER_API_KEY': 'load_test_key',
+        'TELEGRAM_API_URL': telegram_url,
+        'OPENROUTER_API_URL': openrouter_url,
+        'LLM_MODEL_NAME': MODEL_NAME,
+        'LLM_FALLBACK_MODELS': '',
+        'LLM_STREAMING': 'true' if args.streaming else 'false',
+        'LLM_MAX_CONCURRENCY': str(args.llm_concurrency),
+        'ADMISSION_MAX_ACTIVE': str(args.llm_concurrency),
+        'TELEGRAM_GLOBAL_RATE': str(args.telegram_rate),
+        'TELEGRAM_CHAT_RATE': str(args.telegram_rate),
+        'CHAT_DEBOUNCE_SECONDS': '0',
+        'HISTORY_BACKEND': 'memory',
+        # Вопросы нагрузки совпадают с FAQ - без этого они не дошли бы до LLM
+        'FAQ_ENABLED': 'false',
+        # Извлечение контактов работает как в бою, но его записи не нужны после прогона
+        'LEAD_DB_PATH': os.path.join(tempfile.gettempdir(), f'load_test_leads_{os.getpid()}.db'),
+        'METRICS_ENABLED': 'false'
+    })
+
+
+class LoopLagProbe:
+    """Измеряет, насколько позже запланированного просыпается задача в event loop."""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+    
+    def stop(self):
+        self._task.cancel()
+    
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - started - self.interval))
+
+
+class AnswerWaiter:
+    """Сопоставляет ответы бота в заглушке Telegram с ожидающими пользователями."""
+    
+    def __init__(self):
+        self._waiting: Dict[int, asyncio.Future] = {}
+    
+    def expect(self, chat_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[chat_id] = future
+        return future
+    
+    def on_call(self, call: Dict):
+        if call['method'] not in ('sendMessage', 'editMessageText'):
+            return
+        if call['method'] == 'sendMessage' and call.get('text') == PLACEHOLDER_TEXT:
+            return
+        future = self._waiting.pop(int(call['chat_id']), None)
+        if future is not None and not future.done():
+            future.set_result((time.perf_counter(), call.get('text', "")))
+
+
+async def run_user(chat_id: int, population: Population, telegram, waiter: AnswerWaiter,
+                   update_ids, outcomes: Dict[str, int], latencies: List[float],
+                   answer_timeout: float, messages: Dict[str, str]):
+    await asyncio.sleep(random.uniform(0, population.ramp_up))
+    for _ in range(population.messages_per_user):
+        answer = waiter.expect(chat_id)
+        sent = time.perf_counter()
+        telegram.push(make_message_update(next(update_ids), chat_id, random.choice(QUESTIONS)))
+        try:
+            answered, text = await asyncio.wait_for(answer, answer_timeout)
+        except asyncio.TimeoutError:
+            outcomes['timeout'] += 1
+            return
+        
+        if text == messages['error']:
+            outcomes['error'] += 1
+        elif text == messages['shed']:
+            outcomes['shed'] += 1
+        else:
+            outcomes['ok'] += 1
+            latencies.append(answered - sent)
+        await asyncio.sleep(random.expovariate(1 / population.think_time) if population.think_time else 0)
+
+
+async def run_load_test(population: Population, args) -> Dict:
+    faults = {MODEL_NAME: ModelFault(error_rate=args.error_rate)}
+    async with run_fake_openrouter(latency=args.llm_latency, token_delay=args.token_delay, faults=faults) as llm, \
+            run_fake_telegram() as telegram:
+        set_environment(telegram.base_url, llm.base_url, args)
+        if args.trace_memory:
+            tracemalloc.start()
+        
+        from bot import create_bot, create_dispatcher
+        from config import get_config
+        import handlers
+        
+        bot = create_bot(get_config())
+        dp = create_dispatcher()
+        services = dp["services"]
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+        
+        waiter = AnswerWaiter()
+        telegram.listeners.append(waiter.on_call)
+        probe = LoopLagProbe(LOOP_PROBE_INTERVAL)
+        outcomes = {'ok': 0, 'error': 0, 'shed': 0, 'timeout': 0}
+        latencies: List[float] = []
+        update_ids = iter(range(1, 10 ** 9))
+        messages = {'error': handlers.ERROR_MESSAGE, 'shed': handlers.OVERLOAD_MESSAGE}
+        
+        memory_before = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+        probe.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            run_user(1000 + index, population, telegram, waiter, update_ids, outcomes, latencies,
+                     args.answer_timeout, messages)
+            for index in range(population.users)
+        ))
+        duration = time.perf_counter() - started
+        probe.stop()
+        
+        memory = None
+        if args.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            memory = {'growth_mb': round((current - memory_before) / 2 ** 20, 2), 'peak_mb': round(peak / 2 ** 20, 2)}
+            tracemalloc.stop()
+        history = {'chats': len(services.chat_history), 'messages': services.chat_history.total_messages}
+        
+        await dp.stop_polling()
+        await polling
+    
+    total = population.users * population.messages_per_user
+    return {
+        'messages': total,
+        'outcomes': outcomes,
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(outcomes['ok'] / duration, 2),
+        'latency_s': summarize(latencies),
+        'loop_lag_ms': summarize(probe.lags, scale=1000),
+        'chat_history': history,
+        'memory': memory
+    }
+
+
+def print_report(result: Dict):
+    results = result['results']
+    outcomes = results['outcomes']
+    scenario = result['scenario']
+    print(f"Сценарий {result['population']}: {scenario['description']}, пользователей {scenario['users']} "
+          f"по {scenario['messages_per_user']} сообщений")
+    print(f"Сообщений: {results['messages']}, ответов: {outcomes['ok']}, ошибок: {outcomes['error']}, "
+          f"отказов: {outcomes['shed']}, без ответа: {outcomes['timeout']}")
+    print(f"Пропускная способность: {results['throughput_rps']} ответов/с за {results['duration_s']} с")
+    if results['latency_s']:
+        latency = results['latency_s']
+        print(f"Задержка ответа: p50 {latency['p50']:.3f} с, p95 {latency['p95']:.3f} с, "
+              f"p99 {latency['p99']:.3f} с, максимум {latency['max']:.3f} с")
+    if results['loop_lag_ms']:
+        lag = results['loop_lag_ms']
+        print(f"Задержка event loop: p50 {lag['p50']:.1f} мс, p99 {lag['p99']:.1f} мс, максимум {lag['max']:.1f} мс")
+    print(f"История в памяти: чатов {results['chat_history']['chats']}, сообщений {results['chat_history']['messages']}")
+    if results['memory']:
+        print(f"Память Python: прирост {results['memory']['growth_mb']} МБ, пик {results['memory']['peak_mb']} МБ")
+
+
+# Показатели для сравнения: путь в results и лучше ли большее значение
+COMPARED_METRICS = [
+    (('throughput_rps',), True),
+    (('latency_s', 'p50'), False),
+    (('latency_s', 'p95'), False),
+    (('latency_s', 'p99'), False),
+    (('loop_lag_ms', 'p99'), False),
+    (('chat_history', 'messages'), False),
+    (('memory', 'growth_mb'), False)
+]
+
+
+def lookup(results: Dict, path) -> Optional[float]:
+    for key in path:
+        if not isinstance(results, dict):
+            return None
+        results = results.get(key)
+    return results
+
+
+def print_comparison(baseline: Dict, result: Dict):
+    print(f"Сравнение с {baseline.get('commit') or 'базовым'} ({baseline.get('created')}):")
+    for path, higher_is_better in COMPARED_METRICS:
+        before, after = lookup(baseline['results'], path), lookup(result['results'], path)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        worse = change < 0 if higher_is_better else change > 0
+        mark = " (хуже)" if worse and abs(change) >= 10 else ""
+        print(f"  {'.'.join(path):<22} {before:>10} -> {after:<10} {change:+.1f}%{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--population', choices=sorted(POPULATIONS), default='steady')
+    parser.add_argument('--users', type=int, help="Переопределить число пользователей сценария")
+    parser.add_argument('--messages', type=int, help="Переопределить число сообщений на пользователя")
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--token-delay', type=float, default=0.01, help="Пауза между фрагментами потокового ответа")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Доля ответов заглушки OpenRouter с ошибкой 502")
+    parser.add_argument('--streaming', action='store_true')
+    parser.add_argument('--llm-concurrency', type=int, default=50)
+    parser.add_argument('--telegram-rate', type=float, default=100000, help="Лимит отправки в Telegram, запросов/с")
+    parser.add_argument('--answer-timeout', type=float, default=60)
+    parser.add_argument('--trace-memory', action='store_true', help="Измерять память через tracemalloc (медленнее)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='CRITICAL')
+    parser.add_argument('--output', help="Файл результата, по умолчанию benchmarks/results/<сценарий>-<коммит>.json")
+    parser.add_argument('--compare', help="JSON предыдущего запуска для сравнения")
+    args = parser.parse_args()
+    
+    random.seed(args.seed)
+    logging.basicConfig(level=getattr(logging, args.log_level))
+    population = POPULATIONS[args.population]
+    if args.users:
+        population = replace(population, users=args.users)
+    if args.messages:
+        population = replace(population, messages_per_user=args.messages)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    
+    commit = current_commit()
+    scenario = {**asdict(population), 'llm_latency': args.llm_latency, 'token_delay': args.token_delay,
+                'error_rate': args.error_rate, 'streaming': args.streaming,
+                'llm_concurrency': args.llm_concurrency, 'telegram_rate': args.telegram_rate}
+    result = {
+        'population': args.population,
+        'commit': commit,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'scenario': scenario,
+        'results': asyncio.run(run_load_test(population, args))
+    }
+    print_report(result)
+    
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.population}-{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Результат сохранен в {output}")
+    
+    if baseline is not None:
+        print_comparison(baseline, result)
+
+
+if __name__ == '__main__':
+    main()
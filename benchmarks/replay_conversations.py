@@ -0,0 +1,369 @@
+"""
+Офлайн анализ журнала диалогов (CONVERSATION_LOG=true): статистика,
+воспроизведение с другими настройками контекста и сжатие журнала.
+
+  stats   - число реплик, токены вопросов и ответов, время ответа по источникам (llm, faq)
+  replay  - собирает запрос к LLM для каждого ответа LLM из журнала по каждой политике
+            контекста (HISTORY_MAX_TURNS, LLM_CONTEXT_TOKEN_BUDGET, LLM_CONTEXT_SUMMARY)
+            и, если задано, отправляет его в заглушку OpenRouter или настоящую LLM
+  compact - переписывает журналы в один файл без оборванных записей и записей старше срока
+
+Журналы читаются потоком через mmap, распределения считаются по логарифмическим
+корзинам, история при воспроизведении ограничена --history-turns репликами
+и --max-chats чатами: память не зависит от размера журнала. Журналы рабочих
+процессов (*.workerN) передаются вместе: чат всегда обрабатывается одним процессом.
+
+Запуск: python benchmarks/replay_conversations.py stats data/conversations.log
+        python benchmarks/replay_conversations.py replay data/conversations.log \\
+            --policy turns=5,budget=3000 --policy turns=2,budget=1500,summary=1 [--llm stub]
+        python benchmarks/replay_conversations.py compact data/conversations*.log --output compact.log --since-days 30
+"""
+import sys
+import os
+import math
+import time
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from context_builder import build_context, count_tokens
+from conversation_log import ConversationRecord, iter_records, write_records
+from conversation_store import ConversationStore
+
+# Шаг логарифмических корзин распределений: относительная погрешность квантилей
+BUCKET_GROWTH = 1.05
+
+
+class Distribution:
+    """Распределение неотрицательных значений в постоянной памяти: квантили с точностью до шага корзины."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self._zeros = 0
+        self._buckets: Dict[int, int] = {}
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+        if value <= 0:
+            self._zeros += 1
+            return
+        bucket = math.floor(math.log(value, BUCKET_GROWTH))
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля: середина корзины, в которую он попадает."""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self._zeros
+        if rank < seen:
+            return 0.0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if rank < seen:
+                return min(BUCKET_GROWTH ** (bucket + 0.5), self.maximum)
+        return self.maximum
+
+    def describe(self, unit: str = "") -> str:
+        return (f"среднее {self.mean:.0f}{unit}, p50 {self.quantile(0.5):.0f}{unit}, "
+                f"p95 {self.quantile(0.95):.0f}{unit}, макс {self.maximum:.0f}{unit}")
+
+
+@dataclass
+class LogStats:
+    """Статистика журналов."""
+    records: int = 0
+    turns: int = 0
+    clears: int = 0
+    first_timestamp: Optional[float] = None
+    last_timestamp: Optional[float] = None
+    question_tokens: Distribution = field(default_factory=Distribution)
+    answer_tokens: Distribution = field(default_factory=Distribution)
+    latency_ms: Dict[str, Distribution] = field(default_factory=dict)
+
+
+@dataclass
+class ContextPolicy:
+    """Настройки сборки контекста, с которыми воспроизводится журнал."""
+    max_turns: int
+    token_budget: int
+    summarize: bool = False
+
+    @property
+    def name(self) -> str:
+        return f"turns={self.max_turns},budget={self.token_budget},summary={int(self.summarize)}"
+
+
+@dataclass
+class PolicyStats:
+    """Результат воспроизведения по одной политике контекста."""
+    policy: ContextPolicy
+    requests: int = 0
+    truncated: int = 0
+    prompt_tokens: Distribution = field(default_factory=Distribution)
+    dropped_turns: Distribution = field(default_factory=Distribution)
+    latency_ms: Distribution = field(default_factory=Distribution)
+    answer_tokens: Distribution = field(default_factory=Distribution)
+    errors: int = 0
+
+
+def parse_policy(text: str) -> ContextPolicy:
+    """
+    Разбирает политику вида turns=5,budget=3000,summary=1.
+
+    Args:
+        text: Описание политики
+
+    Returns:
+        Политика контекста
+    """
+    values = dict(item.split('=', 1) for item in text.split(',') if item)
+    unknown = set(values) - {'turns', 'budget', 'summary'}
+    if unknown or 'turns' not in values or 'budget' not in values:
+        raise argparse.ArgumentTypeError(f"Политика {text!r}: ожидается turns=N,budget=N[,summary=0|1]")
+    return ContextPolicy(int(values['turns']), int(values['budget']), values.get('summary', '0') in ('1', 'true'))
+
+
+def read_logs(paths: List[str], with_text: bool = True) -> Iterator[ConversationRecord]:
+    """Записи журналов подряд, файл за файлом."""
+    for path in paths:
+        yield from iter_records(path, with_text=with_text)
+
+
+def collect_stats(paths: List[str]) -> LogStats:
+    """
+    Считает статистику журналов без декодирования текстов.
+
+    Args:
+        paths: Файлы журналов
+
+    Returns:
+        Статистика
+    """
+    stats = LogStats()
+    for record in read_logs(paths, with_text=False):
+        stats.records += 1
+        if stats.first_timestamp is None:
+            stats.first_timestamp = record.timestamp
+        stats.last_timestamp = record.timestamp
+        if record.kind == 'user':
+            stats.question_tokens.observe(record.tokens)
+        elif record.kind == 'assistant':
+            stats.turns += 1
+            stats.answer_tokens.observe(record.tokens)
+            stats.latency_ms.setdefault(record.source, Distribution()).observe(record.latency_ms)
+        else:
+            stats.clears += 1
+    return stats
+
+
+async def replay(paths: List[str], policies: List[ContextPolicy], system_message: Dict,
+                 client=None, limit: Optional[int] = None, concurrency: int = 8,
+                 history_turns: int = 20, max_chats: int = 2000, on_batch=None) -> List[PolicyStats]:
+    """
+    Воспроизводит ответы LLM из журналов: по каждой политике собирает запрос
+    из истории чата, восстановленной по журналу, и, если задан клиент, отправляет его.
+
+    История строится из ответов журнала, а не из новых ответов модели, поэтому
+    политики сравниваются на одних и тех же диалогах.
+
+    Args:
+        paths: Файлы журналов
+        policies: Политики контекста
+        system_message: Системное сообщение запросов
+        client: LLM клиент с complete_messages или None - только сборка запросов
+        limit: Сколько ответов отправить в LLM по каждой политике
+        concurrency: Одновременных запросов к LLM
+        history_turns: Сколько последних реплик чата хранить, чтобы видеть, что политика отбрасывает
+        max_chats: Сколько чатов держать в памяти; вытесненный чат продолжится без истории
+        on_batch: Вызывается после каждого ожидания запросов (например, чтобы очистить заглушку)
+
+    Returns:
+        Результат по каждой политике
+    """
+    window = max([history_turns] + [policy.max_turns + 1 for policy in policies]) * 2
+    history = ConversationStore(window=window, max_chats=max_chats,
+                                max_messages=max_chats * window, ttl_seconds=math.inf)
+    results = [PolicyStats(policy) for policy in policies]
+    questions: Dict[int, str] = {}
+    in_flight = set()
+
+    async def send(stats: PolicyStats, messages: List[Dict]):
+        started = time.perf_counter()
+        answer = await client.complete_messages(messages)
+        stats.latency_ms.observe((time.perf_counter() - started) * 1000)
+        if answer is None:
+            stats.errors += 1
+        else:
+            stats.answer_tokens.observe(count_tokens(answer))
+
+    for record in read_logs(paths):
+        if record.kind == 'clear':
+            history.clear(record.chat_id)
+            questions.pop(record.chat_id, None)
+            continue
+        if record.kind == 'user':
+            questions[record.chat_id] = record.text
+            continue
+        question = questions.pop(record.chat_id, None)
+        if question is None:
+            continue
+
+        previous = history.get(record.chat_id)
+        if record.source == 'llm':
+            for stats in results:
+                policy = stats.policy
+                context = build_context(system_message, previous, question, policy.token_budget,
+                                        policy.max_turns, policy.summarize)
+                stats.requests += 1
+                stats.prompt_tokens.observe(context.prompt_tokens)
+                stats.dropped_turns.observe(context.turns_dropped)
+                stats.truncated += context.turns_dropped > 0
+                if client is not None and (limit is None or stats.requests <= limit):
+                    if len(in_flight) >= concurrency:
+                        _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                        if on_batch is not None:
+                            on_batch()
+                    in_flight.add(asyncio.ensure_future(send(stats, context.messages)))
+        history.extend(record.chat_id, [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": record.text}
+        ])
+
+    if in_flight:
+        await asyncio.wait(in_flight)
+    return results
+
+
+def compact(paths: List[str], output: str, since: Optional[float] = None) -> int:
+    """
+    Переписывает журналы в один файл без оборванных записей и записей старше since.
+
+    Args:
+        paths: Исходные журналы
+        output: Новый файл журнала
+        since: Время (unix), записи до которого отбрасываются
+
+    Returns:
+        Число записей в новом файле
+    """
+    records = read_logs(paths)
+    if since is not None:
+        records = (record for record in records if record.timestamp >= since)
+    return write_records(output, records)
+
+
+def print_stats(stats: LogStats):
+    if not stats.records:
+        print("Журнал пуст")
+        return
+    hours = (stats.last_timestamp - stats.first_timestamp) / 3600
+    print(f"Записей: {stats.records}, ответов: {stats.turns}, очисток истории: {stats.clears}, за {hours:.1f} ч")
+    print(f"Токены вопроса: {stats.question_tokens.describe()}")
+    print(f"Токены ответа: {stats.answer_tokens.describe()}")
+    for source, latency in sorted(stats.latency_ms.items()):
+        print(f"Время ответа ({source or '?'}, {latency.count} ответов): {latency.describe(' мс')}")
+
+
+def print_replay(results: List[PolicyStats], sent: bool):
+    for stats in results:
+        print(f"\n{stats.policy.name}: запросов {stats.requests}, "
+              f"с вытесненной историей {stats.truncated / max(stats.requests, 1):.0%}")
+        print(f"  Токены запроса: {stats.prompt_tokens.describe()}, всего {stats.prompt_tokens.total:.0f}")
+        print(f"  Вытеснено реплик: в среднем {stats.dropped_turns.mean:.1f}, макс {stats.dropped_turns.maximum:.0f}")
+        if sent:
+            print(f"  LLM: {stats.latency_ms.count} запросов, ошибок {stats.errors}, "
+                  f"время ответа {stats.latency_ms.describe(' мс')}")
+            print(f"  Токены ответа: {stats.answer_tokens.describe()}")
+
+
+async def run_replay(args):
+    from config import get_config
+    from prompt_prefix import PromptPrefix
+
+    config = dict(get_config())
+    if args.system_prompt:
+        config['SYSTEM_PROMPT_PATH'] = args.system_prompt
+    config['SYSTEM_PROMPT_RELOAD_INTERVAL'] = 0
+    policies = args.policy or [ContextPolicy(config['HISTORY_MAX_TURNS'], config['LLM_CONTEXT_TOKEN_BUDGET'],
+                                             config['LLM_CONTEXT_SUMMARY'])]
+    options = dict(limit=args.limit, concurrency=args.concurrency, history_turns=args.history_turns,
+                   max_chats=args.max_chats)
+
+    if args.llm == 'none':
+        prefix = PromptPrefix(config['SYSTEM_PROMPT_PATH'], reload_interval=0, cache_mode=config['LLM_PROMPT_CACHE'])
+        print_replay(await replay(args.logs, policies, prefix.message, **options), sent=False)
+        return
+
+    from llm_client import LLMClient
+    if args.llm == 'real':
+        client = LLMClient(config)
+        try:
+            results = await replay(args.logs, policies, client.prompt_prefix.message, client, **options)
+        finally:
+            await client.close()
+        print_replay(results, sent=True)
+        return
+
+    from fake_openrouter import run_fake_openrouter
+    async with run_fake_openrouter(latency=args.stub_latency) as llm:
+        config['OPENROUTER_API_URL'] = llm.base_url
+        client = LLMClient(config)
+        try:
+            # Заглушка хранит принятые запросы - очищаем их, чтобы память не росла с журналом
+            results = await replay(args.logs, policies, client.prompt_prefix.message, client,
+                                   on_batch=llm.requests.clear, **options)
+        finally:
+            await client.close()
+    print_replay(results, sent=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    stats_parser = commands.add_parser('stats', help='Статистика журнала')
+    stats_parser.add_argument('logs', nargs='+')
+
+    replay_parser = commands.add_parser('replay', help='Воспроизведение с политиками контекста')
+    replay_parser.add_argument('logs', nargs='+')
+    replay_parser.add_argument('--policy', type=parse_policy, action='append',
+                               help='turns=N,budget=N[,summary=0|1]; по умолчанию - настройки из окружения')
+    replay_parser.add_argument('--system-prompt', help='Файл системного промта вместо SYSTEM_PROMPT_PATH')
+    replay_parser.add_argument('--llm', choices=['none', 'stub', 'real'], default='none',
+                               help='none - только сборка запросов, stub - заглушка OpenRouter, real - OPENROUTER_API_URL')
+    replay_parser.add_argument('--stub-latency', type=float, default=0.05)
+    replay_parser.add_argument('--limit', type=int, help='Сколько ответов отправить в LLM по каждой политике')
+    replay_parser.add_argument('--concurrency', type=int, default=8)
+    replay_parser.add_argument('--history-turns', type=int, default=20, help='Реплик истории чата в памяти')
+    replay_parser.add_argument('--max-chats', type=int, default=2000, help='Чатов с историей в памяти')
+
+    compact_parser = commands.add_parser('compact', help='Сжатие журналов в один файл')
+    compact_parser.add_argument('logs', nargs='+')
+    compact_parser.add_argument('--output', required=True)
+    compact_parser.add_argument('--since-days', type=float, help='Отбросить записи старше N дней')
+
+    args = parser.parse_args()
+    if args.command == 'stats':
+        print_stats(collect_stats(args.logs))
+    elif args.command == 'replay':
+        asyncio.run(run_replay(args))
+    else:
+        since = time.time() - args.since_days * 86400 if args.since_days is not None else None
+        before = sum(os.path.getsize(path) for path in args.logs)
+        count = compact(args.logs, args.output, since)
+        print(f"Записей: {count}, размер {before / 2 ** 20:.1f} МБ -> {os.path.getsize(args.output) / 2 ** 20:.1f} МБ")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Допуск запросов к LLM при перегрузке.
+
+Одновременно выполняется не больше max_active генераций, остальные ждут
+в ограниченной очереди. У пользователя не больше одной выполняемой
+генерации: пока она идет, его следующий запрос пропускает вперед других.
+Запрос отклоняется сразу, если очередь заполнена, или после queue_timeout
+секунд ожидания - пользователь получает короткий ответ без обращения
+к LLM, а остальные пользователи получают ответы быстро.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Hashable, List, Set, Tuple
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_SHED = registry.counter(
+    "admission_shed", "Запросы, отклоненные из-за перегрузки", ["reason"])
+ADMISSION_WAIT = registry.histogram(
+    "admission_wait_seconds", "Время ожидания допуска к LLM")
+
+
+class Overloaded(Exception):
+    """Запрос отклонен: очередь заполнена (queue_full) или истек срок ожидания (timeout)."""
+    
+    def __init__(self, reason: str):
+        super().__init__(f"Запрос отклонен из-за перегрузки: {reason}")
+        self.reason = reason
+
+
+class AdmissionController:
+    """Ограничение числа генераций с очередью, сроком ожидания и одной генерацией на пользователя."""
+    
+    def __init__(self, max_active: int, max_queue: int, queue_timeout: float):
+        """
+        Args:
+            max_active: Максимум одновременно выполняемых генераций
+            max_queue: Максимум запросов, ожидающих допуска
+            queue_timeout: Сколько секунд запрос может ждать допуска
+        """
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        
+        self.active = 0
+        self._active_users: Set[Hashable] = set()
+        self._waiters: List[Tuple[Hashable, asyncio.Future]] = []
+        
+        self.shed = 0
+    
+    @property
+    def queue_depth(self) -> int:
+        """Число запросов, ожидающих допуска."""
+        return len(self._waiters)
+    
+    def has_free_slot(self, user_id: Hashable) -> bool:
+        """Будет ли запрос пользователя допущен сразу, без очереди и не в обход ждущих запросов."""
+        return not self._waiters and self._can_admit(user_id)
+    
+    async def run(self, user_id: Hashable, coroutine: Awaitable) -> Any:
+        """
+        Выполняет генерацию после допуска.
+        
+        Args:
+            user_id: Пользователь, от имени которого выполняется генерация
+            coroutine: Корутина генерации; если запрос отклонен, она закрывается без выполнения
+        
+        Returns:
+            Результат корутины
+        
+        Raises:
+            Overloaded: Запрос отклонен
+        """
+        try:
+            await self.acquire(user_id)
+        except BaseException:
+            coroutine.close()
+            raise
+        
+        try:
+            return await coroutine
+        finally:
+            self.release(user_id)
+    
+    async def acquire(self, user_id: Hashable):
+        """
+        Ждет допуска. После допуска обязательно вызвать release.
+        
+        Raises:
+            Overloaded: Очередь заполнена или истек срок ожидания
+        """
+        if self._can_admit(user_id):
+            # Свободный слот при непустой очереди означает, что её пользователи уже генерируют
+            self._admit(user_id)
+            ADMISSION_WAIT.observe(0.0)
+            return
+        
+        if len(self._waiters) >= self.max_queue:
+            self._shed('queue_full')
+        
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((user_id, waiter))
+        admitted = False
+        try:
+            await asyncio.wait((waiter,), timeout=self.queue_timeout)
+            admitted = waiter.done()
+        finally:
+            if not admitted:
+                if waiter.done():
+                    # Допуск пришел одновременно с отменой ожидания
+                    self.release(user_id)
+                else:
+                    waiter.cancel()
+                    self._waiters.remove((user_id, waiter))
+        
+        ADMISSION_WAIT.observe(time.monotonic() - started)
+        if not admitted:
+            self._shed('timeout')
+    
+    def release(self, user_id: Hashable):
+        """Освобождает слот и допускает следующие запросы из очереди."""
+        self.active -= 1
+        self._active_users.discard(user_id)
+        
+        for waiting_user, waiter in list(self._waiters):
+            if self.active >= self.max_active:
+                break
+            if self._can_admit(waiting_user):
+                self._waiters.remove((waiting_user, waiter))
+                self._admit(waiting_user)
+                waiter.set_result(None)
+    
+    def _can_admit(self, user_id: Hashable) -> bool:
+        return self.active < self.max_active and user_id not in self._active_users
+    
+    def _admit(self, user_id: Hashable):
+        self.active += 1
+        self._active_users.add(user_id)
+    
+    def _shed(self, reason: str):
+        self.shed += 1
+        ADMISSION_SHED.labels(reason).inc()
+        # Под перегрузкой отказов много: они видны в admission_shed_total, а не в логе
+        logger.debug(f"Запрос отклонен из-за перегрузки ({reason}): выполняется {self.active}, в очереди {len(self._waiters)}")
+        raise Overloaded(reason)
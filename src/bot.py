@@ -3,60 +3,109 @@
 """
 import logging
 import asyncio
+import time
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import get_config
-from handlers import register_handlers
+from config import get_config, validate_config
+from log_pipeline import setup_logging as setup_log_pipeline
+from metrics import ERRORS, TELEGRAM_LATENCY
+from supervisor import run_supervisor
+from webhook import run_webhook
 
+# Методы Telegram API, которые не считаются отправкой (long polling висит до таймаута)
+UNTIMED_TELEGRAM_METHODS = {'getUpdates'}
 
-def setup_logging():
-    """Настройка логирования."""
-    config = get_config()
-    
-    # Создаем директорию для логов если её нет
-    import os
-    os.makedirs(os.path.dirname(config['LOG_FILE']), exist_ok=True)
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Измеряет время запросов к Telegram Bot API и считает их ошибки."""
     
-    logging.basicConfig(
-        level=getattr(logging, config['LOG_LEVEL']),
-        format='%(asctime)s %(levelname)s %(name)s: %(message)s',
-        handlers=[
-            logging.FileHandler(config['LOG_FILE'], encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        if api_method in UNTIMED_TELEGRAM_METHODS:
+            return await make_request(bot, method)
+            
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            ERRORS.labels("telegram").inc()
+            raise
+        finally:
+            TELEGRAM_LATENCY.labels(api_method).observe(time.perf_counter() - started)
+
+
+def setup_logging(config: dict):
+    """Настройка логирования: запись в файл и консоль идет в фоновом потоке."""
+    listener = setup_log_pipeline(config)
     
     logger = logging.getLogger(__name__)
     logger.info("Логирование настроено")
+    return listener
+
+
+def create_bot(config: dict) -> Bot:
+    """Создает бота: адрес Bot API из TELEGRAM_API_URL, запросы к нему попадают в метрики."""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(config['TELEGRAM_API_URL']))
+    bot = Bot(token=config['TELEGRAM_BOT_TOKEN'], session=session)
+    bot.session.middleware(TelegramMetricsMiddleware())
+    return bot
+
+
+def create_dispatcher() -> Dispatcher:
+    """Создает диспетчер с обработчиками бота."""
+    # Обработчики импортируют aiogram целиком и нужны только процессу, который их выполняет
+    from handlers import register_handlers
+    
+    dp = Dispatcher(storage=MemoryStorage())
+    register_handlers(dp)
+    return dp
 
 
 def main():
     """Главная функция запуска бота."""
+    listener = None
     try:
+        # Загрузка конфигурации: один раз на процесс, дальше get_config отдает кеш
+        config = get_config()
+        
         # Настройка логирования
-        setup_logging()
+        listener = setup_logging(config)
         logger = logging.getLogger(__name__)
         
-        # Загрузка конфигурации
-        config = get_config()
+        # Проверка настроек до запуска: импорт модулей бота их не требует
+        validate_config(config)
         logger.info("Конфигурация загружена")
         
-        # Создание бота и диспетчера
-        bot = Bot(token=config['TELEGRAM_BOT_TOKEN'])
-        dp = Dispatcher(storage=MemoryStorage())
-        
-        # Регистрация обработчиков
-        register_handlers(dp)
+        # Несколько рабочих процессов: обновления распределяет супервизор
+        if config['BOT_WORKERS'] > 1:
+            logger.info(f"Бот запущен в режиме {config['BOT_WORKERS']} рабочих процессов")
+            run_supervisor(config)
+            return
+            
+        # Создание бота и диспетчера с обработчиками
+        bot = create_bot(config)
+        dp = create_dispatcher()
         logger.info("Обработчики зарегистрированы")
         
         # Запуск бота
-        logger.info("Бот запущен")
-        asyncio.run(dp.start_polling(bot))
+        if config['BOT_MODE'] == 'webhook':
+            logger.info("Бот запущен в режиме webhook")
+            run_webhook(bot, dp, config)
+        else:
+            logger.info("Бот запущен")
+            asyncio.run(dp.start_polling(bot))
         
     except Exception as e:
         logging.error(f"Ошибка при запуске бота: {e}")
         raise
+    finally:
+        # Дописываем записи, оставшиеся в очереди лога
+        if listener is not None:
+            listener.stop()
 
 
 if __name__ == '__main__':
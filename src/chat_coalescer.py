@@ -0,0 +1,189 @@
+"""
+Последовательная обработка сообщений одного чата.
+
+Сообщения, пришедшие подряд в течение короткого окна, объединяются
+в один запрос к LLM. Пакеты одного чата обрабатываются строго по
+очереди, поэтому записи в историю упорядочены. Новое сообщение может
+отменить еще идущую генерацию ответа - тогда её сообщения
+присоединяются к следующему пакету. Команды чата (/start, /reset)
+выполняются между пакетами, под той же блокировкой.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationSuperseded(Exception):
+    """Генерация ответа отменена более новым сообщением того же чата."""
+
+
+class ChatState:
+    """Очередь и задачи обработки одного чата."""
+    
+    __slots__ = ('pending', 'batch', 'timer', 'generation', 'lock', 'commands')
+    
+    def __init__(self):
+        self.pending: List[Any] = []
+        self.batch: List[Any] = []
+        self.timer: Optional[asyncio.Task] = None
+        self.generation: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.commands = 0
+
+
+class ChatCoalescer:
+    """Объединение, сериализация и отмена обработки сообщений по чатам."""
+    
+    def __init__(self, process: Callable[[int, List[Any]], Awaitable[None]],
+                 debounce_seconds: float, cancel_inflight: bool):
+        """
+        Args:
+            process: Обработчик пакета сообщений чата: process(chat_id, messages)
+            debounce_seconds: Сколько ждать следующего сообщения перед обработкой пакета
+            cancel_inflight: Отменять ли идущую генерацию при новом сообщении
+        """
+        self.process = process
+        self.debounce_seconds = debounce_seconds
+        self.cancel_inflight = cancel_inflight
+        
+        self._chats: Dict[int, ChatState] = {}
+        self._tasks = set()
+        
+        self.merged_messages = 0
+        self.cancelled_generations = 0
+    
+    def submit(self, chat_id: int, message: Any):
+        """
+        Ставит сообщение в очередь чата. Не ждет обработки.
+        
+        Args:
+            chat_id: Идентификатор чата
+            message: Сообщение пользователя
+        """
+        state = self._state(chat_id)
+        state.pending.append(message)
+        
+        if self.cancel_inflight and state.generation is not None and not state.generation.done():
+            # Сообщения отменяемого пакета уйдут в LLM вместе с новым
+            state.generation.cancel()
+            state.pending[:0] = state.batch
+            state.batch = []
+            self.cancelled_generations += 1
+            logger.info(f"Генерация ответа для чата {chat_id} отменена новым сообщением")
+            
+        if state.timer is not None:
+            state.timer.cancel()
+        state.timer = self._start(self._debounce(chat_id, state))
+    
+    async def run_cancellable(self, chat_id: int, coroutine: Awaitable) -> Any:
+        """
+        Выполняет генерацию ответа так, чтобы её могло отменить новое сообщение чата.
+        
+        Args:
+            chat_id: Идентификатор чата
+            coroutine: Корутина генерации ответа
+            
+        Returns:
+            Результат корутины
+            
+        Raises:
+            GenerationSuperseded: Генерация отменена новым сообщением
+        """
+        task = asyncio.ensure_future(coroutine)
+        state = self._chats.get(chat_id)
+        if state is not None:
+            state.generation = task
+            
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            raise GenerationSuperseded()
+        finally:
+            if state is not None:
+                state.generation = None
+    
+    async def run_exclusive(self, chat_id: int, command: Callable[[], Awaitable], cancel_generation: bool = False) -> Any:
+        """
+        Выполняет команду чата между пакетами сообщений, под блокировкой чата.
+        
+        Args:
+            chat_id: Идентификатор чата
+            command: Функция без аргументов, возвращающая корутину команды
+            cancel_generation: Отменить идущую генерацию ответа: её ответ больше не нужен
+                (например, /reset - иначе ответ вернет в историю старый вопрос)
+        
+        Returns:
+            Результат команды
+        """
+        state = self._state(chat_id)
+        if cancel_generation and state.generation is not None and not state.generation.done():
+            # Сообщения отмененного пакета не возвращаются в очередь
+            state.generation.cancel()
+            self.cancelled_generations += 1
+            logger.info(f"Генерация ответа для чата {chat_id} отменена командой")
+            
+        state.commands += 1
+        try:
+            async with state.lock:
+                return await command()
+        finally:
+            state.commands -= 1
+            self._forget_if_idle(chat_id, state)
+    
+    async def drain(self):
+        """Дожидается обработки всех поставленных в очередь сообщений."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+    
+    def __len__(self) -> int:
+        """Число чатов с сообщениями в обработке."""
+        return len(self._chats)
+    
+    async def _debounce(self, chat_id: int, state: ChatState):
+        try:
+            await asyncio.sleep(self.debounce_seconds)
+        except asyncio.CancelledError:
+            # Окно продлено новым сообщением
+            return
+        state.timer = None
+        
+        async with state.lock:
+            await self._run_batch(chat_id, state)
+    
+    async def _run_batch(self, chat_id: int, state: ChatState):
+        if state.pending:
+            state.batch, state.pending = state.pending, []
+            if len(state.batch) > 1:
+                self.merged_messages += len(state.batch) - 1
+                logger.info(f"Объединено {len(state.batch)} сообщений чата {chat_id} в один запрос")
+                
+            try:
+                await self.process(chat_id, list(state.batch))
+            except Exception as e:
+                logger.error(f"Ошибка обработки сообщений чата {chat_id}: {e}")
+            finally:
+                state.batch = []
+                
+        self._forget_if_idle(chat_id, state)
+    
+    def _state(self, chat_id: int) -> ChatState:
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = ChatState()
+            self._chats[chat_id] = state
+        return state
+    
+    def _forget_if_idle(self, chat_id: int, state: ChatState):
+        # Чат без очереди, ожидающего таймера и команд больше не нужен
+        if not state.pending and state.timer is None and not state.commands and self._chats.get(chat_id) is state:
+            del self._chats[chat_id]
+    
+    def _start(self, coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
@@ -1,41 +1,277 @@
 """
 Конфигурация приложения.
 Загружает настройки из переменных окружения.
+
+Настройки читаются один раз и кешируются: повторные вызовы get_config
+возвращают тот же объект, пока не изменится окружение процесса.
+Обязательные секреты и допустимые значения проверяет validate_config
+при запуске бота, поэтому импорт модулей и утилиты работают без них.
 """
 import os
+from typing import Dict, List, Optional, Tuple, TypedDict
 from dotenv import load_dotenv
 
-# Загружаем переменные из .env файла
-load_dotenv()
 
+class Config(TypedDict):
+    """Настройки приложения; ключи совпадают с именами переменных окружения."""
+    TELEGRAM_BOT_TOKEN: Optional[str]
+    TELEGRAM_API_URL: str
+    BOT_WORKERS: int
+    WORKER_HEARTBEAT_INTERVAL: float
+    WORKER_HEARTBEAT_TIMEOUT: float
+    TELEGRAM_GLOBAL_RATE: float
+    TELEGRAM_CHAT_RATE: float
+    TELEGRAM_CHAT_BURST: int
+    TELEGRAM_SEND_RETRIES: int
+    BOT_MODE: str
+    WEBHOOK_URL: Optional[str]
+    WEBHOOK_PATH: str
+    WEBHOOK_HOST: str
+    WEBHOOK_PORT: int
+    WEBHOOK_SECRET: Optional[str]
+    LOG_LEVEL: str
+    LOG_FILE: str
+    LOG_FORMAT: str
+    LOG_ROTATION: str
+    LOG_MAX_BYTES: int
+    LOG_ROTATE_WHEN: str
+    LOG_BACKUP_COUNT: int
+    LOG_BODIES: str
+    LOG_BODY_MAX_CHARS: int
+    LOG_BODY_SAMPLE_RATE: float
+    OPENROUTER_API_KEY: Optional[str]
+    OPENROUTER_API_URL: str
+    LLM_MODEL_NAME: str
+    LLM_TEMPERATURE: float
+    LLM_MAX_TOKENS: int
+    LLM_FALLBACK_MODELS: List[str]
+    LLM_HEDGE_ENABLED: bool
+    LLM_HEDGE_PERCENTILE: float
+    LLM_HEDGE_MIN_DELAY: float
+    LLM_HEDGE_MAX_DELAY: float
+    LLM_ROUTER_WINDOW: int
+    LLM_CIRCUIT_FAILURES: int
+    LLM_CIRCUIT_RESET: float
+    LLM_MAX_CONCURRENCY: int
+    LLM_REQUEST_TIMEOUT: float
+    ADMISSION_MAX_ACTIVE: int
+    ADMISSION_MAX_QUEUE: int
+    ADMISSION_QUEUE_TIMEOUT: float
+    METRICS_ENABLED: bool
+    METRICS_HOST: str
+    METRICS_PORT: int
+    CHAT_DEBOUNCE_SECONDS: float
+    CHAT_CANCEL_INFLIGHT: bool
+    LLM_CACHE_MAX_ENTRIES: int
+    LLM_CACHE_TTL: float
+    LLM_CACHE_VARIANTS: int
+    LLM_CACHE_REFRESH_AFTER: float
+    LLM_CACHE_PREFILL: bool
+    LLM_CACHE_FAQ: bool
+    FAQ_ENABLED: bool
+    FAQ_PATH: str
+    FAQ_THRESHOLD: float
+    LLM_STREAMING: bool
+    STREAM_EDIT_INTERVAL: float
+    SYSTEM_PROMPT: str
+    HISTORY_MAX_TURNS: int
+    LLM_CONTEXT_TOKEN_BUDGET: int
+    LLM_CONTEXT_SUMMARY: bool
+    SYSTEM_PROMPT_PATH: str
+    SYSTEM_PROMPT_RELOAD_INTERVAL: float
+    LLM_PROMPT_CACHE: str
+    HISTORY_STORE_MAX_CHATS: int
+    HISTORY_STORE_MAX_MESSAGES: int
+    HISTORY_STORE_TTL: float
+    LEAD_EXTRACTION: bool
+    LEAD_EXTRACTION_LLM: bool
+    LEAD_DB_PATH: str
+    LEAD_BATCH_INTERVAL: float
+    LEAD_BATCH_SIZE: int
+    CONVERSATION_LOG: bool
+    CONVERSATION_LOG_PATH: str
+    CONVERSATION_LOG_FLUSH_INTERVAL: float
+    HISTORY_BACKEND: str
+    HISTORY_DB_PATH: str
+    HISTORY_FLUSH_INTERVAL: float
+    HISTORY_FLUSH_BATCH_SIZE: int
+
+
+# Прочитанная конфигурация и окружение, из которого она прочитана
+_cached: Optional[Tuple[Dict[str, str], Config]] = None
+_dotenv_loaded = False
 
-def get_config():
+
+def get_config() -> Config:
     """
     Получить конфигурацию приложения.
     
+    При первом вызове загружает переменные из .env файла. Конфигурация
+    перечитывается, только если окружение изменилось с прошлого вызова.
+    
+    Returns:
+        Config: Словарь с настройками приложения, общий для вызывающих - не изменять
+    """
+    global _cached, _dotenv_loaded
+    if not _dotenv_loaded:
+        # Загружаем переменные из .env файла
+        load_dotenv()
+        _dotenv_loaded = True
+    
+    environment = dict(os.environ)
+    if _cached is None or _cached[0] != environment:
+        _cached = (environment, read_config())
+    return _cached[1]
+
+
+def read_config() -> Config:
+    """
+    Читает настройки из переменных окружения без кеширования и проверок.
+    
     Returns:
-        dict: Словарь с настройками приложения
+        Config: Словарь с настройками приложения
     """
-    config = {
+    config: Config = {
         'TELEGRAM_BOT_TOKEN': os.getenv('TELEGRAM_BOT_TOKEN'),
+        'TELEGRAM_API_URL': os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/'),
+        # Число рабочих процессов: больше 1 - обновления распределяются по chat_id между процессами
+        'BOT_WORKERS': int(os.getenv('BOT_WORKERS', '1')),
+        'WORKER_HEARTBEAT_INTERVAL': float(os.getenv('WORKER_HEARTBEAT_INTERVAL', '1.0')),
+        'WORKER_HEARTBEAT_TIMEOUT': float(os.getenv('WORKER_HEARTBEAT_TIMEOUT', '15.0')),
+        # Лимиты исходящих запросов к Telegram: на бота и на чат (запросов в секунду)
+        'TELEGRAM_GLOBAL_RATE': float(os.getenv('TELEGRAM_GLOBAL_RATE', '25')),
+        'TELEGRAM_CHAT_RATE': float(os.getenv('TELEGRAM_CHAT_RATE', '1.0')),
+        'TELEGRAM_CHAT_BURST': int(os.getenv('TELEGRAM_CHAT_BURST', '3')),
+        'TELEGRAM_SEND_RETRIES': int(os.getenv('TELEGRAM_SEND_RETRIES', '3')),
+        # Способ получения обновлений: polling или webhook
+        'BOT_MODE': os.getenv('BOT_MODE', 'polling'),
+        'WEBHOOK_URL': os.getenv('WEBHOOK_URL'),
+        'WEBHOOK_PATH': os.getenv('WEBHOOK_PATH', '/webhook'),
+        'WEBHOOK_HOST': os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+        'WEBHOOK_PORT': int(os.getenv('WEBHOOK_PORT', '8080')),
+        'WEBHOOK_SECRET': os.getenv('WEBHOOK_SECRET'),
         'LOG_LEVEL': os.getenv('LOG_LEVEL', 'INFO'),
         'LOG_FILE': os.getenv('LOG_FILE', 'logs/bot.log'),
+        # Формат файла лога (json или text) и ротация по размеру (size) или времени (time)
+        'LOG_FORMAT': os.getenv('LOG_FORMAT', 'json'),
+        'LOG_ROTATION': os.getenv('LOG_ROTATION', 'size'),
+        'LOG_MAX_BYTES': int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+        'LOG_ROTATE_WHEN': os.getenv('LOG_ROTATE_WHEN', 'midnight'),
+        'LOG_BACKUP_COUNT': int(os.getenv('LOG_BACKUP_COUNT', '5')),
+        # Запись текстов сообщений: full, truncate, redact или off; доля записей с текстом
+        'LOG_BODIES': os.getenv('LOG_BODIES', 'truncate'),
+        'LOG_BODY_MAX_CHARS': int(os.getenv('LOG_BODY_MAX_CHARS', '100')),
+        'LOG_BODY_SAMPLE_RATE': float(os.getenv('LOG_BODY_SAMPLE_RATE', '1.0')),
         # LLM настройки
         'OPENROUTER_API_KEY': os.getenv('OPENROUTER_API_KEY'),
         'OPENROUTER_API_URL': os.getenv('OPENROUTER_API_URL', 'https://openrouter.ai/api/v1'),
         'LLM_MODEL_NAME': os.getenv('LLM_MODEL_NAME', 'openai/gpt-3.5-turbo'),
         'LLM_TEMPERATURE': float(os.getenv('LLM_TEMPERATURE', '0.7')),
         'LLM_MAX_TOKENS': int(os.getenv('LLM_MAX_TOKENS', '200')),
+        # Резервные модели через запятую, резервный запрос после p95 задержки модели
+        'LLM_FALLBACK_MODELS': [model.strip() for model in os.getenv('LLM_FALLBACK_MODELS', '').split(',') if model.strip()],
+        'LLM_HEDGE_ENABLED': os.getenv('LLM_HEDGE_ENABLED', 'true').lower() == 'true',
+        'LLM_HEDGE_PERCENTILE': float(os.getenv('LLM_HEDGE_PERCENTILE', '0.95')),
+        'LLM_HEDGE_MIN_DELAY': float(os.getenv('LLM_HEDGE_MIN_DELAY', '1.0')),
+        'LLM_HEDGE_MAX_DELAY': float(os.getenv('LLM_HEDGE_MAX_DELAY', '10.0')),
+        'LLM_ROUTER_WINDOW': int(os.getenv('LLM_ROUTER_WINDOW', '100')),
+        # Автомат отключения модели: ошибок подряд и на сколько секунд отключать
+        'LLM_CIRCUIT_FAILURES': int(os.getenv('LLM_CIRCUIT_FAILURES', '5')),
+        'LLM_CIRCUIT_RESET': float(os.getenv('LLM_CIRCUIT_RESET', '30')),
+        'LLM_MAX_CONCURRENCY': int(os.getenv('LLM_MAX_CONCURRENCY', '10')),
+        'LLM_REQUEST_TIMEOUT': float(os.getenv('LLM_REQUEST_TIMEOUT', '30')),
+        # Допуск генераций при перегрузке: одновременно, в очереди и срок ожидания в очереди (секунды)
+        'ADMISSION_MAX_ACTIVE': int(os.getenv('ADMISSION_MAX_ACTIVE', os.getenv('LLM_MAX_CONCURRENCY', '10'))),
+        'ADMISSION_MAX_QUEUE': int(os.getenv('ADMISSION_MAX_QUEUE', '50')),
+        'ADMISSION_QUEUE_TIMEOUT': float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '10')),
+        # Локальный HTTP сервер метрик в формате Prometheus
+        'METRICS_ENABLED': os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+        'METRICS_HOST': os.getenv('METRICS_HOST', '127.0.0.1'),
+        'METRICS_PORT': int(os.getenv('METRICS_PORT', '9090')),
+        # Объединение подряд пришедших сообщений чата и отмена устаревшей генерации
+        'CHAT_DEBOUNCE_SECONDS': float(os.getenv('CHAT_DEBOUNCE_SECONDS', '0.3')),
+        'CHAT_CANCEL_INFLIGHT': os.getenv('CHAT_CANCEL_INFLIGHT', 'true').lower() == 'true',
+        # Кеш ответов для /start и повторяющихся вопросов
+        'LLM_CACHE_MAX_ENTRIES': int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1000')),
+        'LLM_CACHE_TTL': float(os.getenv('LLM_CACHE_TTL', '86400')),
+        'LLM_CACHE_VARIANTS': int(os.getenv('LLM_CACHE_VARIANTS', '3')),
+        'LLM_CACHE_REFRESH_AFTER': float(os.getenv('LLM_CACHE_REFRESH_AFTER', '3600')),
+        'LLM_CACHE_PREFILL': os.getenv('LLM_CACHE_PREFILL', 'false').lower() == 'true',
+        'LLM_CACHE_FAQ': os.getenv('LLM_CACHE_FAQ', 'false').lower() == 'true',
+        # Готовые ответы на частые вопросы без обращения к LLM: файл FAQ и порог близости вопроса (0..1)
+        'FAQ_ENABLED': os.getenv('FAQ_ENABLED', 'false').lower() == 'true',
+        'FAQ_PATH': os.getenv('FAQ_PATH', 'docs/faq.md'),
+        'FAQ_THRESHOLD': float(os.getenv('FAQ_THRESHOLD', '0.75')),
+        # Потоковый вывод ответа правками сообщения
+        'LLM_STREAMING': os.getenv('LLM_STREAMING', 'false').lower() == 'true',
+        'STREAM_EDIT_INTERVAL': float(os.getenv('STREAM_EDIT_INTERVAL', '1.0')),
         # История диалогов
         'SYSTEM_PROMPT': os.getenv('SYSTEM_PROMPT', 'Ты полезный ИИ-помощник. Отвечай кратко и по делу.'),
-        'HISTORY_MAX_TURNS': int(os.getenv('HISTORY_MAX_TURNS', '5'))
+        # Максимум реплик (вопрос + ответ) истории в запросе
+        'HISTORY_MAX_TURNS': int(os.getenv('HISTORY_MAX_TURNS', '5')),
+        # Бюджет токенов на весь запрос и краткое содержание не вошедших реплик
+        'LLM_CONTEXT_TOKEN_BUDGET': int(os.getenv('LLM_CONTEXT_TOKEN_BUDGET', '3000')),
+        'LLM_CONTEXT_SUMMARY': os.getenv('LLM_CONTEXT_SUMMARY', 'false').lower() == 'true',
+        # Системный промт из файла: как часто проверять изменение файла (секунды, 0 - не проверять)
+        # и отметка промта для кеширования у провайдера: auto, on или off
+        'SYSTEM_PROMPT_PATH': os.getenv('SYSTEM_PROMPT_PATH', 'docs/system_prompt.md'),
+        'SYSTEM_PROMPT_RELOAD_INTERVAL': float(os.getenv('SYSTEM_PROMPT_RELOAD_INTERVAL', '5')),
+        'LLM_PROMPT_CACHE': os.getenv('LLM_PROMPT_CACHE', 'auto'),
+        # Ограничения хранилища истории в памяти
+        'HISTORY_STORE_MAX_CHATS': int(os.getenv('HISTORY_STORE_MAX_CHATS', '10000')),
+        'HISTORY_STORE_MAX_MESSAGES': int(os.getenv('HISTORY_STORE_MAX_MESSAGES', '100000')),
+        'HISTORY_STORE_TTL': float(os.getenv('HISTORY_STORE_TTL', '86400')),
+        # Извлечение контактов клиентов в фоне (включается явно): пакет раз в LEAD_BATCH_INTERVAL секунд,
+        # LEAD_EXTRACTION_LLM=true - имя и компанию, не найденные правилами, ищет LLM
+        'LEAD_EXTRACTION': os.getenv('LEAD_EXTRACTION', 'false').lower() == 'true',
+        'LEAD_EXTRACTION_LLM': os.getenv('LEAD_EXTRACTION_LLM', 'false').lower() == 'true',
+        'LEAD_DB_PATH': os.getenv('LEAD_DB_PATH', 'data/leads.db'),
+        'LEAD_BATCH_INTERVAL': float(os.getenv('LEAD_BATCH_INTERVAL', '5')),
+        'LEAD_BATCH_SIZE': int(os.getenv('LEAD_BATCH_SIZE', '20')),
+        # Двоичный журнал диалогов для офлайн анализа (benchmarks/replay_conversations.py),
+        # записи дописываются раз в CONVERSATION_LOG_FLUSH_INTERVAL секунд
+        'CONVERSATION_LOG': os.getenv('CONVERSATION_LOG', 'false').lower() == 'true',
+        'CONVERSATION_LOG_PATH': os.getenv('CONVERSATION_LOG_PATH', 'data/conversations.log'),
+        'CONVERSATION_LOG_FLUSH_INTERVAL': float(os.getenv('CONVERSATION_LOG_FLUSH_INTERVAL', '1.0')),
+        # Постоянное хранилище истории: memory или sqlite
+        'HISTORY_BACKEND': os.getenv('HISTORY_BACKEND', 'memory'),
+        'HISTORY_DB_PATH': os.getenv('HISTORY_DB_PATH', 'data/history.db'),
+        'HISTORY_FLUSH_INTERVAL': float(os.getenv('HISTORY_FLUSH_INTERVAL', '0.5')),
+        'HISTORY_FLUSH_BATCH_SIZE': int(os.getenv('HISTORY_FLUSH_BATCH_SIZE', '100'))
     }
+    return config
+
+
+def validate_config(config: Config):
+    """
+    Проверяет обязательные параметры и допустимые значения. Вызывается при запуске бота.
     
-    # Валидация обязательных параметров
+    Args:
+        config: Конфигурация приложения
+        
+    Raises:
+        ValueError: Параметр не задан или имеет недопустимое значение
+    """
     if not config['TELEGRAM_BOT_TOKEN']:
         raise ValueError("TELEGRAM_BOT_TOKEN не найден в переменных окружения")
     
     if not config['OPENROUTER_API_KEY']:
         raise ValueError("OPENROUTER_API_KEY не найден в переменных окружения")
     
-    return config
+    if config['BOT_MODE'] not in ('polling', 'webhook'):
+        raise ValueError(f"Неизвестный BOT_MODE: {config['BOT_MODE']} (ожидается polling или webhook)")
+    
+    if config['BOT_MODE'] == 'webhook' and not (config['WEBHOOK_URL'] and config['WEBHOOK_SECRET']):
+        raise ValueError("Для BOT_MODE=webhook нужны WEBHOOK_URL и WEBHOOK_SECRET")
+    
+    if config['BOT_WORKERS'] < 1:
+        raise ValueError(f"BOT_WORKERS должен быть не меньше 1, получено {config['BOT_WORKERS']}")
+    
+    if config['HISTORY_BACKEND'] not in ('memory', 'sqlite'):
+        raise ValueError(f"Неизвестный HISTORY_BACKEND: {config['HISTORY_BACKEND']} (ожидается memory или sqlite)")
+    
+    if config['LLM_PROMPT_CACHE'] not in ('auto', 'on', 'off'):
+        raise ValueError(f"Неизвестный LLM_PROMPT_CACHE: {config['LLM_PROMPT_CACHE']} (ожидается auto, on или off)")
+    
+    if config['LOG_BODIES'] not in ('full', 'truncate', 'redact', 'off'):
+        raise ValueError(f"Неизвестный LOG_BODIES: {config['LOG_BODIES']} (ожидается full, truncate, redact или off)")
@@ -0,0 +1,150 @@
+"""
+Сборка контекста запроса к LLM в пределах бюджета токенов.
+
+История упаковывается целыми репликами (вопрос пользователя и ответ
+ассистента) от новых к старым, пока помещается в бюджет. Токены
+оцениваются приближенно, результат подсчета кешируется по тексту.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Union
+
+# Приблизительное число символов на токен для смешанного русско-английского текста
+CHARS_PER_TOKEN = 3
+
+# Служебные токены на каждое сообщение в формате Chat API
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Максимальная длина краткого содержания вытесненных реплик
+SUMMARY_MAX_CHARS = 500
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=65536)
+def count_tokens(text: str) -> int:
+    """
+    Оценивает число токенов в тексте.
+    
+    Каждое слово дает не меньше одного токена, длинные слова делятся
+    по CHARS_PER_TOKEN символов, знаки препинания считаются отдельно.
+    
+    Args:
+        text: Текст сообщения
+        
+    Returns:
+        Оценка числа токенов
+    """
+    return sum((len(piece) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN for piece in TOKEN_PATTERN.findall(text))
+
+
+def message_tokens(message: Dict) -> int:
+    """Оценка токенов сообщения вместе со служебными."""
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def group_turns(history: List[Dict]) -> List[List[Dict]]:
+    """
+    Делит историю на реплики: сообщение пользователя и следующие за ним ответы.
+    
+    Args:
+        history: История диалога в хронологическом порядке
+        
+    Returns:
+        Список реплик в хронологическом порядке
+    """
+    turns: List[List[Dict]] = []
+    for message in history:
+        if message["role"] == "user" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def summarize_turns(turns: List[List[Dict]]) -> str:
+    """
+    Кратко пересказывает вытесненные реплики без обращения к LLM.
+    
+    Args:
+        turns: Вытесненные реплики в хронологическом порядке
+        
+    Returns:
+        Текст краткого содержания
+    """
+    questions = [turn[0]["content"].replace("\n", " ") for turn in turns if turn[0]["role"] == "user"]
+    summary = "Ранее в диалоге пользователь писал: " + "; ".join(questions)
+    if len(summary) > SUMMARY_MAX_CHARS:
+        summary = summary[:SUMMARY_MAX_CHARS - 3] + "..."
+    return summary
+
+
+@dataclass
+class ContextWindow:
+    """Собранные сообщения запроса и статистика упаковки."""
+    messages: List[Dict]
+    prompt_tokens: int
+    turns_included: int
+    turns_dropped: int
+
+
+def build_context(system_prompt: Union[str, Dict], history: List[Dict], question: str,
+                  token_budget: int, max_turns: int, summarize: bool = False) -> ContextWindow:
+    """
+    Собирает сообщения запроса в пределах бюджета токенов.
+    
+    Системный промт и вопрос включаются всегда. Реплики истории добавляются
+    целиком от новых к старым, пока хватает бюджета и не превышен max_turns.
+    
+    Args:
+        system_prompt: Системный промт или готовое системное сообщение,
+            которое войдет в запрос без копирования
+        history: История диалога в хронологическом порядке
+        question: Текущий вопрос пользователя
+        token_budget: Бюджет токенов на весь запрос
+        max_turns: Максимальное число реплик истории
+        summarize: Добавлять ли краткое содержание не вошедших реплик
+        
+    Returns:
+        Собранное окно контекста
+    """
+    if isinstance(system_prompt, dict):
+        system_message = system_prompt
+    else:
+        system_message = {"role": "system", "content": system_prompt}
+    question_message = {"role": "user", "content": question}
+    used_tokens = message_tokens(system_message) + message_tokens(question_message)
+    
+    # Место под краткое содержание резервируется заранее, чтобы оно не вытесняло реплики
+    history_budget = token_budget
+    if summarize:
+        history_budget -= SUMMARY_MAX_CHARS // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+    
+    turns = group_turns(history)
+    included: List[List[Dict]] = []
+    for turn in reversed(turns):
+        if len(included) == max_turns:
+            break
+        turn_tokens = sum(message_tokens(message) for message in turn)
+        if used_tokens + turn_tokens > history_budget:
+            break
+        included.append(turn)
+        used_tokens += turn_tokens
+    included.reverse()
+    
+    dropped = turns[:len(turns) - len(included)]
+    messages = [system_message]
+    
+    if summarize and dropped:
+        summary_message = {"role": "system", "content": summarize_turns(dropped)}
+        summary_tokens = message_tokens(summary_message)
+        if used_tokens + summary_tokens <= token_budget:
+            messages.append(summary_message)
+            used_tokens += summary_tokens
+            
+    for turn in included:
+        messages.extend(turn)
+    messages.append(question_message)
+    
+    return ContextWindow(messages, used_tokens, len(included), len(dropped))
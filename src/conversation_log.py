@@ -0,0 +1,254 @@
+"""
+Журнал диалогов для офлайн анализа.
+
+Файл только дополняется: после заголовка идут записи с префиксом длины
+и контрольной суммой. Запись - одно сообщение диалога (вопрос, ответ) или
+очистка истории чата. Числовые поля записи (время, чат, задержка ответа,
+оценка токенов) лежат в заголовке фиксированной длины перед текстом, поэтому
+статистику можно собрать, не декодируя тексты. Чтение идет через mmap
+потоком записей: память не зависит от размера файла, оборванная при
+аварийной остановке последняя запись пропускается.
+
+Бот копит записи в памяти и дописывает их в файл пакетами в фоновом потоке.
+"""
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from context_builder import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Заголовок файла: формат и его версия
+FILE_MAGIC = b"CONVLOG1"
+
+# Рамка записи: длина содержимого и CRC32 содержимого
+FRAME = struct.Struct("<II")
+
+# Заголовок содержимого: время, чат, пользователь, тип, источник ответа, задержка (мс), токены
+RECORD_HEADER = struct.Struct("<dqqBBII")
+
+# Типы записей и источники ответа; номер в кортеже - значение в файле
+KINDS = ('user', 'assistant', 'clear')
+SOURCES = ('', 'llm', 'faq')
+
+# Записи длиннее считаются повреждением файла, а не сообщением
+MAX_RECORD_SIZE = 16 * 2 ** 20
+
+
+class ConversationRecord(NamedTuple):
+    """Запись журнала; text пустой, если журнал читается без текстов."""
+    timestamp: float
+    chat_id: int
+    user_id: int
+    kind: str
+    source: str
+    latency_ms: int
+    tokens: int
+    text: str
+
+
+def encode_record(record: ConversationRecord) -> bytes:
+    """
+    Кодирует запись вместе с рамкой.
+
+    Args:
+        record: Запись журнала
+
+    Returns:
+        Байты для дописывания в файл
+    """
+    payload = RECORD_HEADER.pack(
+        record.timestamp, record.chat_id, record.user_id, KINDS.index(record.kind),
+        SOURCES.index(record.source), min(record.latency_ms, 0xFFFFFFFF), record.tokens
+    ) + record.text.encode('utf-8')
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def iter_records(path: str, with_text: bool = True) -> Iterator[ConversationRecord]:
+    """
+    Читает записи журнала по порядку через mmap.
+
+    Args:
+        path: Путь к файлу журнала
+        with_text: Декодировать ли тексты сообщений; без них чтение быстрее
+
+    Yields:
+        Записи журнала; чтение останавливается на оборванной или поврежденной записи
+
+    Raises:
+        ValueError: Файл не является журналом диалогов
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(FILE_MAGIC)] != FILE_MAGIC:
+                raise ValueError(f"{path} не является журналом диалогов")
+            offset = len(FILE_MAGIC)
+            while offset + FRAME.size <= size:
+                length, checksum = FRAME.unpack_from(data, offset)
+                start = offset + FRAME.size
+                end = start + length
+                if length < RECORD_HEADER.size or length > MAX_RECORD_SIZE or end > size \
+                        or zlib.crc32(data[start:end]) != checksum:
+                    logger.warning(f"Журнал {path}: запись на смещении {offset} оборвана или повреждена, чтение остановлено")
+                    return
+                timestamp, chat_id, user_id, kind, source, latency_ms, tokens = RECORD_HEADER.unpack_from(data, start)
+                text = data[start + RECORD_HEADER.size:end].decode('utf-8') if with_text else ""
+                yield ConversationRecord(timestamp, chat_id, user_id, KINDS[kind], SOURCES[source],
+                                         latency_ms, tokens, text)
+                offset = end
+
+
+def write_records(path: str, records: Iterable[ConversationRecord]) -> int:
+    """
+    Записывает записи в новый файл журнала, например при сжатии старого.
+
+    Args:
+        path: Путь к новому файлу
+        records: Записи в порядке записи
+
+    Returns:
+        Число записанных записей
+    """
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(FILE_MAGIC)
+        for record in records:
+            f.write(encode_record(record))
+            count += 1
+    return count
+
+
+class ConversationLog:
+    """Дописывание журнала диалогов пакетами в фоновом потоке."""
+
+    def __init__(self, path: str, flush_interval: float, max_buffer: int = 2 ** 20):
+        """
+        Args:
+            path: Путь к файлу журнала
+            flush_interval: Сколько секунд копить записи перед записью в файл
+            max_buffer: Размер накопленных записей в байтах, после которого запись не ждет интервала
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        # Один поток: пакеты дописываются строго по очереди
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='conversation_log')
+        self._buffer = bytearray()
+        self._file = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def start(self):
+        """Запускает фоновую запись. Вызывается внутри работающего event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._write_loop())
+
+    async def stop(self):
+        """Дописывает накопленные записи и закрывает файл."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+        self._executor.shutdown()
+        logger.info("Журнал диалогов закрыт")
+
+    def append(self, chat_id: int, user_id: int, messages: List[Dict],
+               latency: Optional[float] = None, source: str = 'llm'):
+        """
+        Добавляет сообщения диалога в журнал, не дожидаясь записи.
+
+        Args:
+            chat_id: Идентификатор чата
+            user_id: Идентификатор пользователя
+            messages: Сообщения в формате {"role": ..., "content": ...}
+            latency: Время ответа в секундах, относится к ответу ассистента
+            source: Источник ответа: llm или faq
+        """
+        now = time.time()
+        for message in messages:
+            is_answer = message['role'] == 'assistant'
+            self._buffer += encode_record(ConversationRecord(
+                now, chat_id, user_id, message['role'],
+                source if is_answer else '',
+                round(latency * 1000) if is_answer and latency is not None else 0,
+                count_tokens(message['content']),
+                message['content']
+            ))
+        self._after_append()
+
+    def clear(self, chat_id: int, user_id: int):
+        """Отмечает в журнале очистку истории чата."""
+        self._buffer += encode_record(ConversationRecord(time.time(), chat_id, user_id, 'clear', '', 0, 0, ""))
+        self._after_append()
+
+    @property
+    def pending_bytes(self) -> int:
+        """Размер записей, ожидающих записи в файл."""
+        return len(self._buffer)
+
+    async def flush(self):
+        """Дописывает в файл все накопленные записи."""
+        if not self._buffer:
+            return
+        data, self._buffer = self._buffer, bytearray()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write, data)
+        except Exception as e:
+            logger.error(f"Ошибка записи журнала диалогов {self.path} ({len(data)} байт): {e}")
+
+    def _after_append(self):
+        if len(self._buffer) >= self.max_buffer:
+            self._wakeup.set()
+
+    async def _write_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _write(self, data: bytes):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'ab')
+            if self._file.tell() == 0:
+                self._file.write(FILE_MAGIC)
+        self._file.write(data)
+        self._file.flush()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def create_conversation_log(config: dict) -> Optional[ConversationLog]:
+    """
+    Создает журнал диалогов по настройкам CONVERSATION_LOG, CONVERSATION_LOG_PATH
+    и CONVERSATION_LOG_FLUSH_INTERVAL.
+
+    Args:
+        config: Конфигурация приложения
+
+    Returns:
+        Журнал или None, если он выключен
+    """
+    if not config['CONVERSATION_LOG']:
+        return None
+    return ConversationLog(config['CONVERSATION_LOG_PATH'], config['CONVERSATION_LOG_FLUSH_INTERVAL'])
@@ -0,0 +1,150 @@
+"""
+Ограниченное хранилище истории диалогов в памяти.
+
+Для каждого чата хранится только окно последних сообщений, которое
+реально уходит в LLM. Неактивные чаты вытесняются по LRU и TTL,
+общее число чатов и сообщений ограничено.
+"""
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+
+class Conversation:
+    """Окно истории одного чата и время последнего обращения."""
+    
+    __slots__ = ('messages', 'last_access')
+    
+    def __init__(self, window: int):
+        self.messages: Deque[Dict] = deque(maxlen=window)
+        self.last_access = time.monotonic()
+
+
+class ConversationStore:
+    """Хранилище истории диалогов с вытеснением по LRU и TTL."""
+    
+    def __init__(self, window: int, max_chats: int, max_messages: int, ttl_seconds: float):
+        """
+        Args:
+            window: Сколько последних сообщений хранить на чат
+            max_chats: Максимальное число чатов в памяти
+            max_messages: Максимальное суммарное число сообщений во всех чатах
+            ttl_seconds: Через сколько секунд неактивности чат удаляется
+        """
+        self.window = window
+        self.max_chats = max_chats
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        
+        # Порядок ключей - порядок последнего обращения: в начале самые старые чаты
+        self._conversations: 'OrderedDict[int, Conversation]' = OrderedDict()
+        self._total_messages = 0
+        
+        self.hits = 0
+        self.misses = 0
+        self.lru_evictions = 0
+        self.ttl_evictions = 0
+    
+    def get(self, chat_id: int) -> List[Dict]:
+        """
+        Возвращает копию окна истории чата.
+        
+        Args:
+            chat_id: Идентификатор чата
+            
+        Returns:
+            Список сообщений (пустой, если истории нет)
+        """
+        self._evict_expired()
+        conversation = self._touch(chat_id)
+        if conversation is None:
+            self.misses += 1
+            return []
+            
+        self.hits += 1
+        return list(conversation.messages)
+    
+    def extend(self, chat_id: int, messages: List[Dict]):
+        """
+        Добавляет сообщения в историю чата, вытесняя лишнее.
+        
+        Args:
+            chat_id: Идентификатор чата
+            messages: Сообщения в формате {"role": ..., "content": ...}
+        """
+        self._evict_expired()
+        conversation = self._touch(chat_id)
+        if conversation is None:
+            conversation = Conversation(self.window)
+            self._conversations[chat_id] = conversation
+            
+        before = len(conversation.messages)
+        conversation.messages.extend(messages)
+        self._total_messages += len(conversation.messages) - before
+        
+        self._evict_overflow()
+    
+    def clear(self, chat_id: int) -> bool:
+        """
+        Удаляет историю чата.
+        
+        Args:
+            chat_id: Идентификатор чата
+            
+        Returns:
+            True, если история была
+        """
+        conversation = self._conversations.pop(chat_id, None)
+        if conversation is None:
+            return False
+            
+        self._total_messages -= len(conversation.messages)
+        return True
+    
+    def __contains__(self, chat_id: int) -> bool:
+        self._evict_expired()
+        return chat_id in self._conversations
+    
+    def __len__(self) -> int:
+        return len(self._conversations)
+    
+    @property
+    def total_messages(self) -> int:
+        """Суммарное число сообщений во всех чатах."""
+        return self._total_messages
+    
+    def stats(self) -> Dict[str, int]:
+        """Счетчики обращений, вытеснений и текущий размер хранилища."""
+        return {
+            'chats': len(self._conversations),
+            'messages': self._total_messages,
+            'hits': self.hits,
+            'misses': self.misses,
+            'lru_evictions': self.lru_evictions,
+            'ttl_evictions': self.ttl_evictions
+        }
+    
+    def _touch(self, chat_id: int) -> Optional[Conversation]:
+        """Отмечает обращение к чату и переносит его в конец очереди LRU."""
+        conversation = self._conversations.get(chat_id)
+        if conversation is not None:
+            conversation.last_access = time.monotonic()
+            self._conversations.move_to_end(chat_id)
+        return conversation
+    
+    def _evict_expired(self):
+        """Удаляет чаты без обращений дольше TTL (они всегда в начале очереди)."""
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._conversations:
+            chat_id, conversation = next(iter(self._conversations.items()))
+            if conversation.last_access > deadline:
+                return
+            self.clear(chat_id)
+            self.ttl_evictions += 1
+    
+    def _evict_overflow(self):
+        """Вытесняет наименее активные чаты при превышении лимитов."""
+        while len(self._conversations) > self.max_chats or self._total_messages > self.max_messages:
+            chat_id = next(iter(self._conversations))
+            self.clear(chat_id)
+            self.lru_evictions += 1
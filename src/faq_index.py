@@ -0,0 +1,263 @@
+"""
+Индекс готовых ответов на частые вопросы.
+
+Вопрос пользователя сравнивается с формулировками вопросов из файла FAQ
+по косинусной близости TF-IDF векторов символьных n-грамм слов: такое
+сравнение устойчиво к опечаткам, окончаниям и порядку слов. Векторы разреженные, поиск идет
+по обратному индексу n-грамм и затрагивает только формулировки с общими
+n-граммами, поэтому занимает доли миллисекунды.
+
+Близости мало для короткого общего вопроса: "Сколько стоит?" почти совпадает
+с формулировкой "Сколько стоит сайт?". Поэтому ответ из FAQ дается, только
+если содержательные слова вопроса и формулировки совпадают (см. words_agree).
+"""
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from metrics import registry
+from response_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+FAQ_LOOKUPS = registry.counter(
+    "faq_lookups", "Поиск готового ответа в FAQ", ["outcome"])
+
+# Длины символьных n-грамм
+NGRAM_SIZES = (3, 4, 5)
+
+# Общие слова вопросов: вопросительные слова, местоимения, предлоги, приветствия и общие глаголы.
+# Совпадение только по ним не значит, что вопрос о том же разделе
+GENERIC_WORDS = frozenset("""
+    а в и к о с у во об от до по за из на над под для про при без или ли же ну не но да нет это то так
+    я мы вы мне меня нам нас вам вас вами мой моя мое мои наш наша наше наши нашей нашу нашего нашим
+    ваш ваша ваше ваши вашей вашу вашего вашим
+    что чем чего кто где куда когда как какой какая какое какие каких каким какую сколько почем почему зачем
+    есть может можете можно могу сможете нужен нужна нужно нужны надо хочу хотим хотели
+    делаете сделать сделаете делать помочь помогите помогаете стоит стоить стоимость цена цену
+    здравствуйте привет добрый день вечер утро подскажите пожалуйста скажите спасибо
+""".split())
+
+# Слова считаются одним словом с разными окончаниями, если совпадают первые буквы
+WORD_STEM_LENGTH = 4
+
+HEADING_PATTERN = re.compile(r"^##\s+(.+?)\s*$")
+BULLET_PATTERN = re.compile(r"^[-*]\s+(.+?)\s*$")
+
+
+@dataclass
+class FaqEntry:
+    """Раздел FAQ: основной вопрос, другие формулировки и ответ."""
+    question: str
+    phrasings: List[str]
+    answer: str
+
+
+@dataclass
+class FaqMatch:
+    """Найденный раздел, самая близкая его формулировка и близость к ней вопроса пользователя."""
+    entry: FaqEntry
+    score: float
+    phrasing: str
+
+
+def char_ngrams(text: str) -> Counter:
+    """
+    Символьные n-граммы слов нормализованного текста; слово дополнено пробелами
+    с краев, чтобы начало и конец слова давали свои n-граммы.
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        Число вхождений каждой n-граммы
+    """
+    grams = Counter()
+    for word in normalize_text(text).split():
+        padded = f" {word} "
+        for size in NGRAM_SIZES:
+            for start in range(len(padded) - size + 1):
+                grams[padded[start:start + size]] += 1
+    return grams
+
+
+def informative_words(text: str) -> List[str]:
+    """Слова нормализованного текста без общих слов вопросов."""
+    return [word for word in normalize_text(text).split() if word not in GENERIC_WORDS]
+
+
+def same_word(first: str, second: str) -> bool:
+    """Одно ли это слово с точностью до окончания и опечатки в конце слова."""
+    if min(len(first), len(second)) < WORD_STEM_LENGTH:
+        return first == second
+    return first[:WORD_STEM_LENGTH] == second[:WORD_STEM_LENGTH]
+
+
+def words_agree(question: str, phrasing: str) -> bool:
+    """
+    Проверяет, что вопрос и формулировка FAQ говорят об одном.
+
+    Каждое содержательное слово вопроса должно быть в формулировке: иначе
+    в вопросе есть то, на что ответ FAQ не отвечает ("Чем вы можете помочь
+    с нашей 1С?"). Если в формулировке есть содержательные слова, хотя бы одно
+    из них должно быть в вопросе: иначе вопрос слишком общий ("Сколько стоит?").
+
+    Args:
+        question: Вопрос пользователя
+        phrasing: Формулировка вопроса из FAQ
+
+    Returns:
+        True, если на вопрос можно ответить ответом этого раздела
+    """
+    asked = informative_words(question)
+    known = informative_words(phrasing)
+    if not all(any(same_word(word, other) for other in known) for word in asked):
+        return False
+    return not known or any(same_word(word, other) for word in known for other in asked)
+
+
+def load_faq(path: str) -> List[FaqEntry]:
+    """
+    Читает разделы FAQ из markdown файла.
+
+    Заголовок второго уровня - основной вопрос, список сразу под ним - другие
+    формулировки, остальной текст до следующего заголовка - ответ.
+
+    Args:
+        path: Путь к файлу
+
+    Returns:
+        Разделы с непустым ответом
+    """
+    entries = []
+    question = None
+    phrasings: List[str] = []
+    answer: List[str] = []
+
+    def finish():
+        text = "\n".join(answer).strip()
+        if question and text:
+            entries.append(FaqEntry(question, phrasings, text))
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip()
+            heading = HEADING_PATTERN.match(line)
+            if heading:
+                finish()
+                question, phrasings, answer = heading.group(1), [], []
+                continue
+            if question is None:
+                continue
+            bullet = BULLET_PATTERN.match(line)
+            if bullet and not answer:
+                phrasings.append(bullet.group(1))
+            elif line or answer:
+                answer.append(line)
+    finish()
+    return entries
+
+
+class FaqIndex:
+    """Поиск раздела FAQ по близости вопроса к формулировкам."""
+
+    def __init__(self, entries: List[FaqEntry], threshold: float):
+        """
+        Args:
+            entries: Разделы FAQ
+            threshold: Минимальная косинусная близость для ответа из FAQ, от 0 до 1
+        """
+        self.entries = entries
+        self.threshold = threshold
+
+        phrasings = [(index, text) for index, entry in enumerate(entries)
+                     for text in [entry.question] + entry.phrasings]
+        self._phrasing_entries = [index for index, _ in phrasings]
+        self._phrasings = [text for _, text in phrasings]
+        grams = [char_ngrams(text) for _, text in phrasings]
+
+        document_frequency = Counter(gram for counts in grams for gram in counts)
+        total = len(grams)
+        self._idf = {gram: math.log((1 + total) / (1 + frequency)) + 1
+                     for gram, frequency in document_frequency.items()}
+        # Вес n-граммы, которой нет ни в одной формулировке: она только уменьшает близость
+        self._unknown_idf = math.log(1 + total) + 1
+
+        # Обратный индекс: n-грамма -> (номер формулировки, вес в нормированном векторе)
+        self._postings: Dict[str, List[Tuple[int, float]]] = {}
+        for number, counts in enumerate(grams):
+            for gram, weight in self._normalized(counts).items():
+                self._postings.setdefault(gram, []).append((number, weight))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _normalized(self, counts: Counter) -> Dict[str, float]:
+        weights = {gram: (1 + math.log(count)) * self._idf.get(gram, self._unknown_idf)
+                   for gram, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {gram: weight / norm for gram, weight in weights.items()}
+
+    def search(self, question: str) -> Optional[FaqMatch]:
+        """
+        Находит самый близкий раздел независимо от порога.
+
+        Args:
+            question: Вопрос пользователя
+
+        Returns:
+            Раздел и близость или None, если общих n-грамм нет
+        """
+        scores: Dict[int, float] = {}
+        for gram, weight in self._normalized(char_ngrams(question)).items():
+            for number, phrasing_weight in self._postings.get(gram, ()):
+                scores[number] = scores.get(number, 0.0) + weight * phrasing_weight
+        if not scores:
+            return None
+        number = max(scores, key=scores.get)
+        return FaqMatch(self.entries[self._phrasing_entries[number]], scores[number], self._phrasings[number])
+
+    def accepts(self, question: str, match: FaqMatch) -> bool:
+        """Достаточно ли найденный раздел близок к вопросу для ответа из FAQ."""
+        return match.score >= self.threshold and words_agree(question, match.phrasing)
+
+    def lookup(self, question: str) -> Optional[FaqMatch]:
+        """
+        Находит раздел, достаточно близкий для ответа из FAQ.
+
+        Args:
+            question: Вопрос пользователя
+
+        Returns:
+            Раздел и близость или None, если близость ниже порога или вопрос о другом
+        """
+        match = self.search(question)
+        if match is None or not self.accepts(question, match):
+            FAQ_LOOKUPS.labels("miss").inc()
+            return None
+        FAQ_LOOKUPS.labels("hit").inc()
+        return match
+
+
+def create_faq_index(config: dict) -> Optional[FaqIndex]:
+    """
+    Создает индекс FAQ по настройкам FAQ_ENABLED, FAQ_PATH и FAQ_THRESHOLD.
+
+    Args:
+        config: Конфигурация приложения
+
+    Returns:
+        Индекс или None, если FAQ выключен или файл не прочитан
+    """
+    if not config['FAQ_ENABLED']:
+        return None
+    try:
+        entries = load_faq(config['FAQ_PATH'])
+    except OSError as e:
+        logger.error(f"Не удалось загрузить FAQ из {config['FAQ_PATH']}: {e}")
+        return None
+    logger.info(f"Загружен FAQ из {config['FAQ_PATH']}: {len(entries)} разделов")
+    return FaqIndex(entries, config['FAQ_THRESHOLD'])
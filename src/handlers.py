@@ -4,24 +4,38 @@
 from aiogram import types, Router
 from aiogram.filters import Command
 import logging
+import time
 from datetime import datetime
-from typing import Dict, List
-from llm_client import LLMClient
+from typing import List
+from admission import Overloaded
+from chat_coalescer import GenerationSuperseded
+from faq_index import FaqMatch
+from llm_client import StreamInterrupted
+from metrics import HANDLER_LATENCY
+from send_scheduler import PRIORITY_PLACEHOLDER
+from services import BotServices
+from stream_reply import StreamingReply, stream_to_message
 
 logger = logging.getLogger(__name__)
 
 # Создаем роутер для обработчиков
 router = Router()
 
-# Инициализируем LLM клиент
-llm_client = LLMClient()
-
-# Хранение истории диалогов в памяти по chat_id
-chat_history: Dict[int, List[Dict]] = {}
-
 # Максимальная длина сообщения для Telegram (4096 символов)
 MAX_MESSAGE_LENGTH = 4000
 
+# Ответ, когда LLM не вернула ответ
+ERROR_MESSAGE = "Извините, произошла ошибка при обработке запроса."
+
+# Пометка в конце потокового ответа, оборвавшегося на середине
+STREAM_INTERRUPTED_NOTE = "Ответ прерван из-за ошибки. Пожалуйста, повторите вопрос."
+
+# Ответ без обращения к LLM, когда бот перегружен
+OVERLOAD_MESSAGE = "Сейчас очень много обращений. Пожалуйста, повторите вопрос через минуту."
+
+# Запрос к LLM для приветствия по команде /start
+WELCOME_PROMPT = "Пользователь только что запустил бота. Представься как консультант компании, объясни свои возможности и предложи помощь в выборе услуг. Будь дружелюбным и профессиональным."
+
 
 def truncate_message(message: str, max_length: int = MAX_MESSAGE_LENGTH) -> str:
     """
@@ -45,95 +59,202 @@ def truncate_message(message: str, max_length: int = MAX_MESSAGE_LENGTH) -> str:
 
 def register_handlers(dp):
     """
-    Регистрирует обработчики сообщений.
+    Регистрирует обработчики сообщений и создает их сервисы.
+    
+    Сервисы попадают в данные диспетчера и передаются обработчикам
+    и хукам запуска и остановки в аргументе services.
     
     Args:
         dp: Диспетчер aiogram
     """
+    services = BotServices(lambda chat_id, messages: answer_messages(services, chat_id, messages))
+    dp["services"] = services
     dp.include_router(router)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+
+
+async def on_startup(services: BotServices):
+    """Запускает фоновые сервисы обработчиков."""
+    await services.start(WELCOME_PROMPT)
+
+
+async def on_shutdown(services: BotServices):
+    """Дожидается ответов на принятые сообщения и останавливает сервисы."""
+    await services.stop()
 
 
 @router.message(Command("start"))
-async def start_handler(message: types.Message):
+async def start_handler(message: types.Message, services: BotServices):
     """Обработчик команды /start - сценарий 1: Первое знакомство."""
+    # Приветствие читает историю чата, поэтому выполняется между ответами на сообщения
+    await services.chat_coalescer.run_exclusive(message.chat.id, lambda: send_welcome(services, message))
+
+
+async def send_welcome(services: BotServices, message: types.Message):
+    """Отправляет приветствие, сгенерированное LLM с учетом истории чата."""
+    started = time.perf_counter()
     chat_id = message.chat.id
     user_id = message.from_user.id
     
     logger.info(f"Пользователь {user_id} запустил бота")
     
     # Генерируем персонализированное приветствие через LLM
-    welcome_prompt = "Пользователь только что запустил бота. Представься как консультант компании, объясни свои возможности и предложи помощь в выборе услуг. Будь дружелюбным и профессиональным."
+    welcome_prompt = WELCOME_PROMPT
     
     # Получаем историю диалога (пустая для нового пользователя)
-    history = chat_history.get(chat_id, [])
+    history = await services.load_history(chat_id)
     
     # Генерируем приветствие через LLM
-    welcome_message = await llm_client.ask(welcome_prompt, history)
+    # Приветствие без истории одинаково для всех - берем его из кеша вариантов
+    try:
+        welcome_message = await services.admission.run(user_id, services.llm_client.ask(welcome_prompt, history, use_cache=not history))
+    except Overloaded:
+        # При перегрузке сразу отвечаем статичным приветствием
+        welcome_message = None
     
     if welcome_message:
         # Обрезаем сообщение до максимальной длины
         truncated_message = truncate_message(welcome_message)
-        await message.reply(truncated_message)
+        await services.send_scheduler.reply(message, truncated_message)
         logger.info(f"Отправлено приветствие пользователю {user_id}")
     else:
         # Fallback на статичное сообщение
-        await message.reply("Привет! Я ИИ-консультант компании ТехноСервис. Помогу вам с выбором IT-услуг. Задайте мне любой вопрос!")
+        await services.send_scheduler.reply(message, "Привет! Я ИИ-консультант компании ТехноСервис. Помогу вам с выбором IT-услуг. Задайте мне любой вопрос!")
         logger.error(f"Ошибка генерации приветствия для пользователя {user_id}")
+    HANDLER_LATENCY.labels("start").observe(time.perf_counter() - started)
 
 
 @router.message(Command("help"))
-async def help_handler(message: types.Message):
+async def help_handler(message: types.Message, services: BotServices):
     """Обработчик команды /help."""
-    await message.reply("Доступные команды:\n/start - начать работу\n/help - справка\n/reset - очистить историю диалога\n\nПросто напишите мне любой вопрос!")
+    await services.send_scheduler.reply(message, "Доступные команды:\n/start - начать работу\n/help - справка\n/reset - очистить историю диалога\n\nПросто напишите мне любой вопрос!")
     logger.info(f"Пользователь {message.from_user.id} запросил справку")
 
 
 @router.message(Command("reset"))
-async def reset_handler(message: types.Message):
+async def reset_handler(message: types.Message, services: BotServices):
     """Обработчик команды /reset - очистка истории диалога."""
+    # Идущий ответ отменяется, а очистка ждет конца его обработки: иначе ответ вернет в историю старый вопрос
+    await services.chat_coalescer.run_exclusive(message.chat.id, lambda: reset_history(services, message),
+                                                cancel_generation=True)
+
+
+async def reset_history(services: BotServices, message: types.Message):
+    """Очищает историю чата и сообщает об этом пользователю."""
     chat_id = message.chat.id
     
-    if chat_id in chat_history:
-        del chat_history[chat_id]
-        await message.reply("История диалога очищена.")
+    if await services.load_history(chat_id):
+        services.clear_history(chat_id, message.from_user.id)
+        await services.send_scheduler.reply(message, "История диалога очищена.")
         logger.info(f"История диалога очищена для пользователя {message.from_user.id}")
     else:
-        await message.reply("История диалога уже пуста.")
+        await services.send_scheduler.reply(message, "История диалога уже пуста.")
         logger.info(f"Попытка очистки пустой истории для пользователя {message.from_user.id}")
 
 
 @router.message()
-async def text_handler(message: types.Message):
+async def text_handler(message: types.Message, services: BotServices):
     """Обработчик всех текстовых сообщений через LLM."""
     if not message.text:
         return
     
-    chat_id = message.chat.id
-    user_id = message.from_user.id
+    logger.info("Пользователь %s отправил сообщение", message.from_user.id,
+                extra={'chat_id': message.chat.id, 'user_id': message.from_user.id, 'body': message.text})
     
-    await message.reply("Думаю...")
-    logger.info(f"Пользователь {user_id} отправил сообщение: {message.text}")
+    # Сообщения чата обрабатываются по очереди, быстро пришедшие подряд объединяются
+    services.chat_coalescer.submit(message.chat.id, message)
+
+
+async def answer_messages(services: BotServices, chat_id: int, messages: List[types.Message]):
+    """
+    Отвечает одним запросом к LLM на пакет подряд пришедших сообщений чата.
+    
+    Args:
+        services: Сервисы обработчиков
+        chat_id: Идентификатор чата
+        messages: Сообщения пользователя в порядке поступления
+    """
+    started = time.perf_counter()
+    message = messages[-1]
+    user_id = message.from_user.id
+    question = "\n".join(item.text for item in messages)
     
     # Получаем историю диалога для данного чата
-    history = chat_history.get(chat_id, [])
+    history = await services.load_history(chat_id)
+    
+    # Частый вопрос в начале диалога получает готовый ответ сразу, без "Думаю..." и обращения к LLM.
+    # Уточнения вроде "А сколько стоит?" зависят от предыдущих реплик - их разбирает LLM
+    faq_match = services.faq_index.lookup(question) if services.faq_index is not None and not history else None
+    if faq_match is not None:
+        await answer_from_faq(services, chat_id, message, question, faq_match, started)
+        HANDLER_LATENCY.labels("faq").observe(time.perf_counter() - started)
+        return
+    
+    # Служебное сообщение уступает очередь окончательным ответам, обработка его не ждет
+    placeholder = services.send_scheduler.reply(message, "Думаю...", PRIORITY_PLACEHOLDER)
     
-    # Отправляем запрос в LLM с историей
-    answer = await llm_client.ask(message.text, history)
+    # Первый вопрос диалога может совпасть с уже заданным (FAQ) - ищем ответ в кеше
+    use_cache = services.config['LLM_CACHE_FAQ'] and not history
+    streaming = services.config['LLM_STREAMING'] and not use_cache
+    
+    try:
+        if streaming:
+            # Ответ появляется в сообщении "Думаю..." по мере генерации
+            reply = StreamingReply(message, await placeholder, services.config['STREAM_EDIT_INTERVAL'],
+                                   MAX_MESSAGE_LENGTH, sender=services.send_scheduler)
+            generation = stream_to_message(services.llm_client.ask_stream(question, history), reply)
+        else:
+            # Отправляем запрос в LLM с историей
+            generation = services.llm_client.ask(question, history, use_cache=use_cache)
+        answer = await services.chat_coalescer.run_cancellable(chat_id, services.admission.run(user_id, generation))
+    except GenerationSuperseded:
+        # Сообщения пакета будут отвечены вместе с новым сообщением; начатый потоковый ответ удаляется целиком
+        if streaming:
+            await reply.discard()
+        else:
+            await services.discard_placeholder(placeholder)
+        return
+    except Overloaded:
+        # Короткий ответ без LLM; вопрос не попадает в историю
+        await services.discard_placeholder(placeholder)
+        await services.send_scheduler.reply(message, OVERLOAD_MESSAGE)
+        HANDLER_LATENCY.labels("shed").observe(time.perf_counter() - started)
+        return
+    except StreamInterrupted:
+        # Показанная часть ответа остается с пометкой об ошибке, неполный ответ в историю не попадает
+        await reply.abort(STREAM_INTERRUPTED_NOTE)
+        logger.error(f"Потоковый ответ LLM для пользователя {user_id} прерван")
+        HANDLER_LATENCY.labels("text").observe(time.perf_counter() - started)
+        return
     
     if answer:
-        # Обрезаем ответ до максимальной длины
-        truncated_answer = truncate_message(answer)
+        # Потоковый ответ уже разбит на сообщения, обычный обрезаем до максимальной длины
+        truncated_answer = answer if streaming else truncate_message(answer)
+        services.remember_answer(chat_id, user_id, question, truncated_answer, history,
+                                 latency=time.perf_counter() - started)
         
-        # Добавляем вопрос и ответ в историю (без timestamp для совместимости с API)
-        history.append({"role": "user", "content": message.text})
-        history.append({"role": "assistant", "content": truncated_answer})
-        
-        # Сохраняем обновленную историю
-        chat_history[chat_id] = history
-        
-        await message.reply(truncated_answer)
-        logger.info(f"LLM ответ для пользователя {user_id}: {truncated_answer[:100]}...")
-        logger.info(f"История диалога для чата {chat_id}: {len(history)} сообщений")
+        if not streaming:
+            # Еще не отправленное "Думаю..." уже не нужно
+            services.send_scheduler.cancel(placeholder)
+            await services.send_scheduler.reply(message, truncated_answer)
+        latency_ms = round((time.perf_counter() - started) * 1000)
+        logger.info("LLM ответ для пользователя %s", user_id,
+                    extra={'chat_id': chat_id, 'user_id': user_id, 'latency_ms': latency_ms, 'body': truncated_answer})
+        logger.debug("История диалога для чата %s обновлена, в памяти чатов: %s, сообщений: %s",
+                     chat_id, len(services.chat_history), services.chat_history.total_messages)
     else:
-        await message.reply("Извините, произошла ошибка при обработке запроса.")
+        services.send_scheduler.cancel(placeholder)
+        await services.send_scheduler.reply(message, ERROR_MESSAGE)
         logger.error(f"Ошибка получения ответа от LLM для пользователя {user_id}")
+    HANDLER_LATENCY.labels("text").observe(time.perf_counter() - started)
+
+
+async def answer_from_faq(services: BotServices, chat_id: int, message: types.Message, question: str,
+                          match: FaqMatch, started: float):
+    """Отвечает готовым ответом из FAQ на первый вопрос диалога; ответ попадает в историю, как ответ LLM."""
+    services.remember_answer(chat_id, message.from_user.id, question, match.entry.answer, [],
+                             latency=time.perf_counter() - started, source='faq')
+    await services.send_scheduler.reply(message, match.entry.answer)
+    logger.info("Ответ из FAQ для пользователя %s: %s (близость %.2f)", message.from_user.id, match.entry.question, match.score,
+                extra={'chat_id': chat_id, 'user_id': message.from_user.id})
@@ -0,0 +1,247 @@
+"""
+Постоянное хранение истории диалогов.
+
+Бэкенд хранит сообщения вне памяти процесса, PersistentHistory
+пишет в него пакетами в фоне, чтобы запись не задерживала ответы.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Операция над историей: ("append", chat_id, сообщения) или ("clear", chat_id, [])
+HistoryOperation = Tuple[str, int, List[Dict]]
+
+
+class HistoryBackend:
+    """Интерфейс хранилища истории. Методы синхронные и вызываются из фонового потока."""
+    
+    def load(self, chat_id: int, limit: int) -> List[Dict]:
+        """Возвращает последние limit сообщений чата в хронологическом порядке."""
+        raise NotImplementedError
+    
+    def apply(self, operations: List[HistoryOperation]):
+        """Применяет пакет операций одной транзакцией."""
+        raise NotImplementedError
+    
+    def close(self):
+        """Освобождает ресурсы хранилища."""
+
+
+class MemoryHistoryBackend(HistoryBackend):
+    """Хранилище в памяти процесса: история живет до перезапуска."""
+    
+    def __init__(self, keep_last: int, max_chats: int):
+        """
+        Args:
+            keep_last: Сколько последних сообщений хранить на чат
+            max_chats: Сколько чатов хранить, дольше всех не писавшие удаляются
+        """
+        self.keep_last = keep_last
+        self.max_chats = max_chats
+        self.messages: Dict[int, List[Dict]] = {}
+    
+    def load(self, chat_id: int, limit: int) -> List[Dict]:
+        return list(self.messages.get(chat_id, [])[-limit:])
+    
+    def apply(self, operations: List[HistoryOperation]):
+        for action, chat_id, messages in operations:
+            history = self.messages.pop(chat_id, [])
+            if action == 'clear':
+                continue
+            history.extend(messages)
+            del history[:-self.keep_last]
+            # Переставляем чат в конец словаря: в начале остаются дольше всех не писавшие
+            self.messages[chat_id] = history
+            if len(self.messages) > self.max_chats:
+                del self.messages[next(iter(self.messages))]
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """Хранилище в файле SQLite в режиме WAL."""
+    
+    def __init__(self, db_path: str, keep_last: int):
+        """
+        Args:
+            db_path: Путь к файлу базы данных
+            keep_last: Сколько последних сообщений хранить на чат, старые удаляются при записи
+        """
+        self.keep_last = keep_last
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            
+        # Соединение используется только из одного фонового потока PersistentHistory
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "chat_id INTEGER NOT NULL, "
+            "role TEXT NOT NULL, "
+            "content TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS messages_chat_id ON messages (chat_id, id)")
+        self.connection.commit()
+        logger.info(f"SQLite хранилище истории открыто: {db_path}")
+    
+    def load(self, chat_id: int, limit: int) -> List[Dict]:
+        rows = self.connection.execute(
+            "SELECT role, content FROM messages WHERE chat_id = ? ORDER BY id DESC LIMIT ?",
+            (chat_id, limit)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+    
+    def apply(self, operations: List[HistoryOperation]):
+        now = time.time()
+        appended = set()
+        with self.connection:
+            for action, chat_id, messages in operations:
+                if action == 'clear':
+                    self.connection.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+                    appended.discard(chat_id)
+                    continue
+                self.connection.executemany(
+                    "INSERT INTO messages (chat_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                    [(chat_id, message["role"], message["content"], now) for message in messages]
+                )
+                appended.add(chat_id)
+            # В той же транзакции удаляем сообщения старше окна: таблица не растет без ограничений
+            self.connection.executemany(
+                "DELETE FROM messages WHERE chat_id = ? AND id <= "
+                "(SELECT id FROM messages WHERE chat_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                [(chat_id, chat_id, self.keep_last) for chat_id in appended]
+            )
+    
+    def close(self):
+        self.connection.close()
+
+
+def create_history_backend(config: dict) -> HistoryBackend:
+    """
+    Создает хранилище истории по настройке HISTORY_BACKEND.
+    
+    Args:
+        config: Конфигурация приложения
+        
+    Returns:
+        Экземпляр хранилища
+    """
+    keep_last = config['HISTORY_MAX_TURNS'] * 2
+    if config['HISTORY_BACKEND'] == 'sqlite':
+        return SQLiteHistoryBackend(config['HISTORY_DB_PATH'], keep_last=keep_last)
+    return MemoryHistoryBackend(keep_last=keep_last, max_chats=config['HISTORY_STORE_MAX_CHATS'])
+
+
+class PersistentHistory:
+    """Асинхронная обертка над хранилищем с пакетной фоновой записью."""
+    
+    def __init__(self, backend: HistoryBackend, flush_interval: float, batch_size: int):
+        """
+        Args:
+            backend: Хранилище истории
+            flush_interval: Сколько секунд копить операции перед записью
+            batch_size: Максимальное число операций в одной транзакции
+        """
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        
+        # Один поток: операции с хранилищем выполняются строго по очереди
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history')
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending_chats: Dict[int, int] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Запускает фоновую запись. Вызывается внутри работающего event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._write_loop())
+    
+    async def stop(self):
+        """Дописывает накопленные операции и закрывает хранилище."""
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.backend.close)
+        self._executor.shutdown()
+        logger.info("Хранилище истории закрыто")
+    
+    def append(self, chat_id: int, messages: List[Dict]):
+        """Ставит сообщения в очередь на запись, не дожидаясь ее."""
+        self._enqueue(('append', chat_id, messages))
+    
+    def clear(self, chat_id: int):
+        """Ставит удаление истории чата в очередь на запись."""
+        self._enqueue(('clear', chat_id, []))
+    
+    async def load(self, chat_id: int, limit: int) -> List[Dict]:
+        """
+        Загружает историю чата из хранилища.
+        
+        Если для чата есть незаписанные операции, сначала дожидается их записи.
+        
+        Args:
+            chat_id: Идентификатор чата
+            limit: Сколько последних сообщений вернуть
+            
+        Returns:
+            Список сообщений в хронологическом порядке
+        """
+        if chat_id in self._pending_chats:
+            await self.flush()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.backend.load, chat_id, limit)
+    
+    @property
+    def pending_operations(self) -> int:
+        """Число операций, ожидающих записи."""
+        return self._queue.qsize()
+    
+    async def flush(self):
+        """Дожидается записи всех поставленных в очередь операций."""
+        if self._task is None:
+            # Фоновая запись не запущена (например, в тестах) - пишем сами
+            while not self._queue.empty():
+                await self._write_batch(self._take_batch())
+            return
+        await self._queue.join()
+    
+    def _enqueue(self, operation: HistoryOperation):
+        chat_id = operation[1]
+        self._pending_chats[chat_id] = self._pending_chats.get(chat_id, 0) + 1
+        self._queue.put_nowait(operation)
+    
+    def _take_batch(self) -> List[HistoryOperation]:
+        batch = []
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+    
+    async def _write_loop(self):
+        while True:
+            first = await self._queue.get()
+            await asyncio.sleep(self.flush_interval)
+            await self._write_batch([first] + self._take_batch())
+    
+    async def _write_batch(self, batch: List[HistoryOperation]):
+        if not batch:
+            return
+            
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.backend.apply, batch)
+        except Exception as e:
+            logger.error(f"Ошибка записи истории в хранилище ({len(batch)} операций): {e}")
+            
+        for _, chat_id, _ in batch:
+            self._pending_chats[chat_id] -= 1
+            if not self._pending_chats[chat_id]:
+                del self._pending_chats[chat_id]
+            self._queue.task_done()
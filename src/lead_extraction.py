@@ -0,0 +1,346 @@
+"""
+Извлечение контактов клиентов из диалогов вне пути ответа.
+
+Сообщения пользователя ставятся в очередь после отправки ответа.
+Фоновая задача раз в batch_interval секунд забирает пакет чатов,
+в отдельном потоке находит правилами телефоны, email, имя и компанию,
+а для чатов с признаками контактов, которые правила не разобрали,
+делает один запрос к LLM на весь пакет. Найденное сохраняется
+в SQLite: одна запись о клиенте на чат, новые поля дополняют прежние.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LEAD_FIELDS = ('name', 'company', 'phone', 'email')
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[^\W\d_]{2,}")
+PHONE_PATTERN = re.compile(r"(?<![\w+])(?:\+\d{1,3}|8)[\s\-]?\(?\d{3}\)?[\s\-]?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}(?!\d)")
+NAME_PATTERN = re.compile(r"(?i:меня зовут|мо[её] имя)\s+([А-ЯЁA-Z][а-яёa-z]+(?:\s+[А-ЯЁA-Z][а-яёa-z]+)?)")
+COMPANY_PATTERN = re.compile(r"\b((?:ООО|ОАО|ЗАО|ПАО|АО|ИП)\s+[«\"]?[^»\",.\n]+[»\"]?)")
+
+# Признаки того, что в сообщении могут быть имя или компания, которые правила не нашли
+HINT_PATTERN = re.compile(r"зовут|имя|компани|организаци|фирм|работаю|представля", re.IGNORECASE)
+
+# Инструкция для пакетного извлечения контактов через LLM
+EXTRACTION_PROMPT = (
+    "Извлеки контактные данные клиентов из диалогов. Для каждого чата верни объект "
+    "с полями chat_id, name, company, phone, email; неизвестные поля - null. "
+    "Ответь только JSON массивом без пояснений."
+)
+
+LEADS_EXTRACTED = registry.counter(
+    "leads_extracted", "Найденные поля контактов клиентов", ["source"])
+LEAD_EXTRACTION_BATCHES = registry.counter(
+    "lead_extraction_batches", "Обработанные пакеты извлечения контактов", ["pass"])
+
+
+def normalize_phone(phone: str) -> str:
+    """Приводит телефон к виду +<цифры>; российский номер с 8 - к +7."""
+    digits = re.sub(r"\D", "", phone)
+    if len(digits) == 11 and digits.startswith('8'):
+        digits = '7' + digits[1:]
+    return '+' + digits
+
+
+def extract_contacts(text: str) -> Dict[str, str]:
+    """
+    Находит контакты в тексте правилами, без обращения к LLM.
+
+    Args:
+        text: Сообщения пользователя
+
+    Returns:
+        Найденные поля из LEAD_FIELDS; из нескольких совпадений берется последнее
+    """
+    found = {}
+    emails = EMAIL_PATTERN.findall(text)
+    if emails:
+        found['email'] = emails[-1].lower()
+    phones = PHONE_PATTERN.findall(text)
+    if phones:
+        found['phone'] = normalize_phone(phones[-1])
+    names = NAME_PATTERN.findall(text)
+    if names:
+        found['name'] = names[-1]
+    companies = COMPANY_PATTERN.findall(text)
+    if companies:
+        found['company'] = companies[-1].strip()
+    return found
+
+
+@dataclass
+class PendingChat:
+    """Сообщения чата, накопленные до обработки пакета."""
+    user_id: int
+    texts: List[str] = field(default_factory=list)
+    # Последний вопрос бота перед сообщениями: "Как вас зовут?" помогает понять ответ "Иван"
+    context: str = ""
+
+
+class LeadStore:
+    """Записи о клиентах в файле SQLite. Методы синхронные и вызываются из фонового потока."""
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: Путь к файлу базы данных; файл создается при первой записи
+        """
+        self.db_path = db_path
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Соединение используется только из одного фонового потока LeadExtractor;
+            # в многопроцессном режиме файл общий, запись ждет блокировку
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS leads ("
+                "chat_id INTEGER PRIMARY KEY, "
+                "user_id INTEGER NOT NULL, "
+                "name TEXT, "
+                "company TEXT, "
+                "phone TEXT, "
+                "email TEXT, "
+                "created_at REAL NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def upsert(self, leads: Dict[int, Dict]):
+        """
+        Сохраняет найденные поля: заполненные поля заменяют прежние, пустые их не стирают.
+
+        Args:
+            leads: Поля по chat_id, включая user_id
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO leads (chat_id, user_id, name, company, phone, email, created_at, updated_at) "
+                "VALUES (:chat_id, :user_id, :name, :company, :phone, :email, :now, :now) "
+                "ON CONFLICT(chat_id) DO UPDATE SET "
+                "name = COALESCE(excluded.name, name), "
+                "company = COALESCE(excluded.company, company), "
+                "phone = COALESCE(excluded.phone, phone), "
+                "email = COALESCE(excluded.email, email), "
+                "updated_at = excluded.updated_at",
+                [dict({name: lead.get(name) for name in LEAD_FIELDS}, chat_id=chat_id, user_id=lead['user_id'], now=now)
+                 for chat_id, lead in leads.items()]
+            )
+
+    def get(self, chat_id: int) -> Optional[Dict]:
+        """Запись о клиенте чата или None."""
+        row = self.connection.execute(
+            "SELECT user_id, name, company, phone, email FROM leads WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('user_id',) + LEAD_FIELDS, row))
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class LeadExtractor:
+    """Фоновое пакетное извлечение контактов: правила для всех чатов, LLM - для непонятых."""
+
+    def __init__(self, store: LeadStore, batch_interval: float, batch_size: int,
+                 complete: Optional[Callable[[List[Dict]], Awaitable[Optional[str]]]] = None):
+        """
+        Args:
+            store: Хранилище записей о клиентах
+            batch_interval: Сколько секунд копить сообщения перед обработкой пакета
+            batch_size: Максимум чатов в одном пакете
+            complete: Запрос к LLM готовыми сообщениями; None - только правила
+        """
+        self.store = store
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.complete = complete
+
+        # Один поток: разбор правилами и запись в хранилище не занимают event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='leads')
+        self._pending: Dict[int, PendingChat] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._draining: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запускает фоновую обработку. Вызывается внутри работающего event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._process_loop())
+
+    async def stop(self):
+        """Обрабатывает накопленные сообщения и закрывает хранилище."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._draining is not None:
+            # Пакет, начатый фоновой задачей, дописывается до закрытия хранилища
+            await self._draining
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.store.close)
+        self._executor.shutdown()
+
+    def submit(self, chat_id: int, user_id: int, text: str, context: str = ""):
+        """
+        Ставит сообщение пользователя в очередь на извлечение, не дожидаясь обработки.
+
+        Args:
+            chat_id: Идентификатор чата
+            user_id: Идентификатор пользователя
+            text: Текст сообщения
+            context: Предыдущее сообщение бота в чате
+        """
+        pending = self._pending.get(chat_id)
+        if pending is None:
+            pending = self._pending[chat_id] = PendingChat(user_id, context=context)
+        pending.texts.append(text)
+        self._wakeup.set()
+
+    @property
+    def pending_chats(self) -> int:
+        """Число чатов, ожидающих обработки."""
+        return len(self._pending)
+
+    async def flush(self):
+        """Обрабатывает все накопленные сообщения."""
+        while self._pending:
+            await self._process_batch(self._take_batch())
+
+    def _take_batch(self) -> Dict[int, PendingChat]:
+        batch = {}
+        while self._pending and len(batch) < self.batch_size:
+            chat_id = next(iter(self._pending))
+            batch[chat_id] = self._pending.pop(chat_id)
+        return batch
+
+    async def _process_loop(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.batch_interval)
+            self._wakeup.clear()
+            # Остановка не прерывает пакет на середине: stop дождется его записи
+            self._draining = asyncio.create_task(self.flush())
+            await asyncio.shield(self._draining)
+            self._draining = None
+
+    async def _process_batch(self, batch: Dict[int, PendingChat]):
+        if not batch:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            leads = await loop.run_in_executor(self._executor, self._extract_rules, batch)
+            LEAD_EXTRACTION_BATCHES.labels("rules").inc()
+
+            unresolved = {chat_id: pending for chat_id, pending in batch.items()
+                          if self._needs_llm(pending, leads.get(chat_id, {}))}
+            if unresolved and self.complete is not None:
+                for chat_id, found in (await self._extract_llm(unresolved)).items():
+                    # Точные совпадения правил надежнее ответа модели
+                    leads[chat_id] = dict(found, **leads.get(chat_id, {}))
+
+            leads = {chat_id: dict(found, user_id=batch[chat_id].user_id) for chat_id, found in leads.items() if found}
+            if leads:
+                await loop.run_in_executor(self._executor, self.store.upsert, leads)
+        except Exception as e:
+            logger.error(f"Ошибка извлечения контактов ({len(batch)} чатов): {e}")
+
+    @staticmethod
+    def _extract_rules(batch: Dict[int, PendingChat]) -> Dict[int, Dict[str, str]]:
+        leads = {}
+        for chat_id, pending in batch.items():
+            found = extract_contacts("\n".join(pending.texts))
+            if found:
+                leads[chat_id] = found
+                LEADS_EXTRACTED.labels("rules").inc(len(found))
+        return leads
+
+    @staticmethod
+    def _needs_llm(pending: PendingChat, found: Dict[str, str]) -> bool:
+        """Имя или компанию правила не нашли, а в сообщениях или вопросе бота есть признаки контактов."""
+        if 'name' in found and 'company' in found:
+            return False
+        return any(HINT_PATTERN.search(text) for text in pending.texts + [pending.context])
+
+    async def _extract_llm(self, batch: Dict[int, PendingChat]) -> Dict[int, Dict[str, str]]:
+        """Один запрос к LLM на все чаты пакета."""
+        dialogs = []
+        for chat_id, pending in batch.items():
+            lines = [f"Чат {chat_id}:"]
+            if pending.context:
+                lines.append(f"Бот: {pending.context}")
+            lines.extend(f"Клиент: {text}" for text in pending.texts)
+            dialogs.append("\n".join(lines))
+
+        answer = await self.complete([
+            {"role": "system", "content": EXTRACTION_PROMPT},
+            {"role": "user", "content": "\n\n".join(dialogs)}
+        ])
+        LEAD_EXTRACTION_BATCHES.labels("llm").inc()
+        if not answer:
+            return {}
+
+        leads = {}
+        for item in parse_extraction(answer):
+            chat_id = item.get('chat_id')
+            if chat_id not in batch:
+                continue
+            found = {name: str(item[name]).strip() for name in LEAD_FIELDS if item.get(name)}
+            if 'phone' in found:
+                found['phone'] = normalize_phone(found['phone'])
+            if found:
+                leads[chat_id] = found
+                LEADS_EXTRACTED.labels("llm").inc(len(found))
+        return leads
+
+
+def parse_extraction(answer: str) -> List[Dict]:
+    """
+    Разбирает ответ LLM с JSON массивом, в том числе обернутый в markdown или текст.
+
+    Args:
+        answer: Текст ответа модели
+
+    Returns:
+        Объекты массива; при неразборчивом ответе - пустой список
+    """
+    start, end = answer.find('['), answer.rfind(']')
+    if start == -1 or end < start:
+        logger.warning("Ответ LLM при извлечении контактов не содержит JSON массива")
+        return []
+    try:
+        items = json.loads(answer[start:end + 1])
+    except json.JSONDecodeError as e:
+        logger.warning(f"Ответ LLM при извлечении контактов не разобран: {e}")
+        return []
+    result = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            item['chat_id'] = int(item.get('chat_id'))
+        except (TypeError, ValueError):
+            continue
+        result.append(item)
+    return result
@@ -1,96 +1,406 @@
 """
 Клиент для работы с LLM через OpenRouter API.
 """
-import openai
+import asyncio
+import aiohttp
 import logging
-import os
-import hashlib
-from typing import Optional, List, Dict
-from config import get_config
+import json
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional, List, Dict
+from config import Config, get_config
+from context_builder import build_context
+from metrics import ERRORS, LLM_LATENCY, LLM_TOKENS
+from model_router import ModelRouter, ModelsUnavailable
+from prompt_prefix import PromptPrefix
+from response_cache import ResponseCache, make_cache_key
 
 logger = logging.getLogger(__name__)
 
 
+class StreamInterrupted(Exception):
+    """Поток ответа оборвался после того, как часть ответа уже была выдана."""
+
+
 class LLMClient:
     """Клиент для работы с LLM через OpenRouter API."""
     
-    def __init__(self):
-        """Инициализация клиента с настройками из конфигурации."""
-        config = get_config()
+    def __init__(self, config: Optional[Config] = None,
+                 admit_background: Optional[Callable[[Awaitable], Awaitable]] = None):
+        """
+        Инициализация клиента с настройками из конфигурации.
+        
+        Args:
+            config: Конфигурация приложения, по умолчанию get_config()
+            admit_background: Допуск фоновых генераций кеша ответов: выполняет корутину
+                и возвращает результат или None, если генерация отложена. Без него
+                фоновые генерации выполняются сразу
+        """
+        config = config or get_config()
         
-        # Настройка для старой версии openai
-        openai.api_key = config['OPENROUTER_API_KEY']
-        openai.api_base = config['OPENROUTER_API_URL']
+        self.api_key = config['OPENROUTER_API_KEY']
+        self.api_url = config['OPENROUTER_API_URL'].rstrip('/')
         
         self.model = config['LLM_MODEL_NAME']
         self.temperature = config['LLM_TEMPERATURE']
         self.max_tokens = config['LLM_MAX_TOKENS']
         self.history_max_turns = config['HISTORY_MAX_TURNS']
+        self.context_token_budget = config['LLM_CONTEXT_TOKEN_BUDGET']
+        self.context_summary = config['LLM_CONTEXT_SUMMARY']
+        
+        # Пул моделей: основная и резервные в порядке предпочтения
+        self.fallback_models = config['LLM_FALLBACK_MODELS']
+        self.router = ModelRouter(
+            [self.model] + [model for model in self.fallback_models if model != self.model],
+            hedge_enabled=config['LLM_HEDGE_ENABLED'],
+            hedge_percentile=config['LLM_HEDGE_PERCENTILE'],
+            hedge_min_delay=config['LLM_HEDGE_MIN_DELAY'],
+            hedge_max_delay=config['LLM_HEDGE_MAX_DELAY'],
+            window=config['LLM_ROUTER_WINDOW'],
+            failure_threshold=config['LLM_CIRCUIT_FAILURES'],
+            reset_timeout=config['LLM_CIRCUIT_RESET']
+        )
+        
+        # Параметры HTTP транспорта
+        self.max_concurrency = config['LLM_MAX_CONCURRENCY']
+        self.request_timeout = config['LLM_REQUEST_TIMEOUT']
+        
+        # Общая сессия с пулом keep-alive соединений создается лениво,
+        # внутри работающего event loop
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        # Кеш ответов на повторяющиеся запросы и фоновые задачи его пополнения
+        self.response_cache = ResponseCache(
+            max_entries=config['LLM_CACHE_MAX_ENTRIES'],
+            ttl_seconds=config['LLM_CACHE_TTL'],
+            pool_size=config['LLM_CACHE_VARIANTS'],
+            refresh_after=config['LLM_CACHE_REFRESH_AFTER']
+        )
+        self._refreshing_keys = set()
+        self._background_tasks = set()
+        self._admit_background = admit_background
+        
+        # Системный промт: готовые сообщения собираются один раз, файл перечитывается при изменении
+        self.prompt_prefix = PromptPrefix(
+            config['SYSTEM_PROMPT_PATH'],
+            reload_interval=config['SYSTEM_PROMPT_RELOAD_INTERVAL'],
+            cache_mode=config['LLM_PROMPT_CACHE']
+        )
         
-        # Загружаем системный промт из файла
-        self.system_prompt = self._load_system_prompt()
+        logger.info(f"LLM клиент инициализирован: модель {self.model}, параллельных запросов до {self.max_concurrency}")
+    
+    @property
+    def system_prompt(self) -> str:
+        """Текущий текст системного промта."""
+        return self.prompt_prefix.text
+    
+    @property
+    def system_prompt_hash(self) -> str:
+        """Хеш текущего системного промта, входит в ключи кеша ответов."""
+        return self.prompt_prefix.hash
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую HTTP сессию, создавая её при первом обращении."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                headers={"Authorization": f"Bearer {self.api_key}"}
+            )
+        return self._session
+    
+    async def close(self):
+        """Останавливает фоновое пополнение кеша и закрывает HTTP сессию."""
+        for task in list(self._background_tasks):
+            task.cancel()
         
-        logger.info(f"LLM клиент инициализирован: модель {self.model}")
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP сессия LLM клиента закрыта")
+        self._session = None
     
-    def _load_system_prompt(self) -> str:
-        """Загружает системный промт из файла."""
-        prompt_path = os.getenv('SYSTEM_PROMPT_PATH', 'docs/system_prompt.md')
+    async def _complete(self, messages: List[Dict]) -> str:
+        """
+        Выполняет запрос chat completions через пул моделей.
         
-        try:
-            with open(prompt_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            # Логируем факт загрузки
-            content_hash = hashlib.md5(content.encode()).hexdigest()[:8]
-            logger.info(f"Загружен системный промт из {prompt_path}, длина: {len(content)} символов, хеш: {content_hash}")
+        Args:
+            messages: Сообщения в формате OpenAI Chat API
             
-            return content
+        Returns:
+            Текст ответа первой ответившей модели
             
-        except FileNotFoundError:
-            logger.error(f"Файл системного промта не найден: {prompt_path}")
-            return "Ты - полезный помощник."
-        except Exception as e:
-            logger.error(f"Ошибка загрузки системного промта: {e}")
-            return "Ты - полезный помощник."
+        Raises:
+            ModelsUnavailable: Ни одна модель пула не ответила
+        """
+        return await self.router.run(lambda model: self._complete_model(model, messages))
     
-    async def ask(self, question: str, history: List[Dict] = None) -> Optional[str]:
+    async def _complete_model(self, model: str, messages: List[Dict]) -> str:
+        """
+        Выполняет запрос chat completions к одной модели OpenRouter.
+        
+        Args:
+            model: Имя модели
+            messages: Сообщения в формате OpenAI Chat API
+            
+        Returns:
+            Текст ответа модели
+        """
+        payload = {
+            "model": model,
+            "messages": self.prompt_prefix.for_model(model, messages),
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+        
+        async with self._semaphore:
+            started = time.perf_counter()
+            session = self._get_session()
+            async with session.post(f"{self.api_url}/chat/completions", json=payload) as response:
+                response.raise_for_status()
+                data = await response.json()
+            LLM_LATENCY.labels("complete").observe(time.perf_counter() - started)
+            
+        record_usage(data.get("usage"))
+        return data["choices"][0]["message"]["content"]
+    
+    def _build_messages(self, question: str, history: List[Dict] = None) -> List[Dict]:
+        """Формирует сообщения с системным промтом, историей и текущим вопросом в пределах бюджета токенов."""
+        self.prompt_prefix.refresh()
+        context = build_context(
+            self.prompt_prefix.message,
+            history or [],
+            question,
+            token_budget=self.context_token_budget,
+            max_turns=self.history_max_turns,
+            summarize=self.context_summary
+        )
+        
+        if history:
+            logger.debug("Добавлена история диалога: %s реплик, вытеснено: %s, оценка токенов запроса: %s",
+                         context.turns_included, context.turns_dropped, context.prompt_tokens)
+        return context.messages
+    
+    async def ask(self, question: str, history: List[Dict] = None, use_cache: bool = False) -> Optional[str]:
         """
         Отправить вопрос в LLM и получить ответ.
         
         Args:
             question: Текст вопроса пользователя
             history: История диалога в формате [{"role": "user/assistant", "content": "текст"}]
+            use_cache: Искать ответ в кеше по нормализованному запросу и сохранять его туда
             
         Returns:
             Ответ от LLM или None в случае ошибки
         """
         try:
-            logger.info(f"Отправка запроса в LLM: {question[:100]}...")
-            
-            # Формируем сообщения с системным промтом и историей
-            messages = [{"role": "system", "content": self.system_prompt}]
-            
-            # Добавляем последние N реплик из истории
-            if history:
-                recent_history = history[-self.history_max_turns:]
-                messages.extend(recent_history)
-                logger.info(f"Добавлена история диалога: {len(recent_history)} реплик")
+            messages = self._build_messages(question, history)
             
-            # Добавляем текущий вопрос
-            messages.append({"role": "user", "content": question})
-            
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
+            if use_cache:
+                cache_key = make_cache_key(self.model, self.system_prompt_hash, messages[1:])
+                cached_answer = self.response_cache.get(cache_key)
+                if cached_answer is not None:
+                    self._schedule_cache_refresh(cache_key, messages)
+                    logger.info("Ответ на запрос взят из кеша", extra={'body': question})
+                    return cached_answer
             
-            answer = response.choices[0].message.content
-            logger.info(f"Получен ответ от LLM: {answer[:100]}...")
+            logger.info("Отправка запроса в LLM", extra={'body': question})
+            started = time.perf_counter()
+            answer = await self._complete(messages)
+            logger.info("Получен ответ от LLM", extra={'latency_ms': round((time.perf_counter() - started) * 1000)})
             
+            if use_cache:
+                self.response_cache.add(cache_key, answer)
             return answer
             
+        except ModelsUnavailable as e:
+            ERRORS.labels("llm_unavailable").inc()
+            logger.error(f"Ошибка LLM API: {e}")
+            return None
+        except Exception as e:
+            ERRORS.labels("llm").inc()
+            logger.error(f"Ошибка LLM API: {e}")
+            return None
+    
+    async def complete_messages(self, messages: List[Dict]) -> Optional[str]:
+        """
+        Отправить в LLM готовые сообщения без системного промта бота и истории.
+        
+        Args:
+            messages: Сообщения в формате OpenAI Chat API, например для служебной задачи
+        
+        Returns:
+            Ответ от LLM или None в случае ошибки
+        """
+        try:
+            return await self._complete(messages)
         except Exception as e:
+            ERRORS.labels("llm").inc()
             logger.error(f"Ошибка LLM API: {e}")
             return None
+    
+    def prefill_cache(self, question: str):
+        """
+        Заранее генерирует в фоне пул вариантов ответа на запрос без истории.
+        
+        Args:
+            question: Текст запроса, например приветствие для /start
+        """
+        messages = self._build_messages(question)
+        cache_key = make_cache_key(self.model, self.system_prompt_hash, messages[1:])
+        # Варианты генерируются по одному, чтобы не занимать несколько мест в допуске генераций
+        self._refreshing_keys.add(cache_key)
+        self._start_background(self._refresh_cache_entry(cache_key, messages, self.response_cache.pool_size))
+    
+    def _schedule_cache_refresh(self, cache_key: str, messages: List[Dict]):
+        """Пополняет пул вариантов или обновляет устаревшую запись в фоне, не более одной задачи на ключ."""
+        if cache_key in self._refreshing_keys or not self.response_cache.needs_refresh(cache_key):
+            return
+        self._refreshing_keys.add(cache_key)
+        self._start_background(self._refresh_cache_entry(cache_key, messages))
+    
+    async def _refresh_cache_entry(self, cache_key: str, messages: List[Dict], variants: int = 1):
+        """Генерирует новые варианты ответа и кладет их в кеш; останавливается, если генерация отложена."""
+        try:
+            for _ in range(variants):
+                generation = self._complete(messages)
+                if self._admit_background is not None:
+                    answer = await self._admit_background(generation)
+                else:
+                    answer = await generation
+                if answer is None:
+                    break
+                self.response_cache.add(cache_key, answer)
+        except Exception as e:
+            ERRORS.labels("llm").inc()
+            logger.error(f"Ошибка фонового обновления кеша ответов: {e}")
+        finally:
+            self._refreshing_keys.discard(cache_key)
+    
+    def _start_background(self, coroutine):
+        """Запускает фоновую задачу, сохраняя ссылку на неё до завершения."""
+        task = asyncio.create_task(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def ask_stream(self, question: str, history: List[Dict] = None) -> AsyncIterator[str]:
+        """
+        Отправить вопрос в LLM и получать ответ по частям по мере генерации.
+        
+        Args:
+            question: Текст вопроса пользователя
+            history: История диалога в формате [{"role": "user/assistant", "content": "текст"}]
+            
+        Yields:
+            Фрагменты ответа. При ошибке до первого фрагмента поток
+            завершается пустым, ошибка пишется в лог
+            
+        Raises:
+            StreamInterrupted: Поток оборвался после выдачи части ответа
+        """
+        messages = self._build_messages(question, history)
+        payload = {
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": True,
+            # OpenRouter присылает usage последним событием потока
+            "usage": {"include": True}
+        }
+        
+        logger.info("Отправка потокового запроса в LLM", extra={'body': question})
+        for model in self.router.candidates():
+            payload["model"] = model
+            payload["messages"] = self.prompt_prefix.for_model(model, messages)
+            received = False
+            success = None
+            try:
+                async with self._semaphore:
+                    started = time.perf_counter()
+                    session = self._get_session()
+                    async with session.post(f"{self.api_url}/chat/completions", json=payload) as response:
+                        response.raise_for_status()
+                        async for line in response.content:
+                            delta = parse_stream_line(line)
+                            if delta is None:
+                                break
+                            if delta:
+                                received = True
+                                yield delta
+                            else:
+                                record_usage(parse_stream_usage(line))
+                success = True
+                
+            except asyncio.TimeoutError:
+                success = False
+                ERRORS.labels("llm_timeout").inc()
+                logger.error(f"Таймаут потокового запроса к модели {model} ({self.request_timeout} с)")
+            except Exception as e:
+                success = False
+                ERRORS.labels("llm").inc()
+                logger.error(f"Ошибка потокового LLM API, модель {model}: {e}")
+            finally:
+                if success is None:
+                    # Поток прерван получателем - о модели это ничего не говорит
+                    self.router.release(model)
+                else:
+                    self.router.record(model, success, time.perf_counter() - started)
+                    
+            if success:
+                LLM_LATENCY.labels("stream").observe(time.perf_counter() - started)
+                logger.info(f"Потоковый ответ от LLM получен, модель {model}")
+                return
+            if received:
+                # Часть ответа уже показана пользователю - переключаться на другую модель поздно
+                raise StreamInterrupted(f"Поток ответа модели {model} прерван")
+                
+        logger.error("Нет доступных моделей для потокового запроса")
+
+
+def parse_stream_line(line: bytes) -> Optional[str]:
+    """
+    Разбирает строку потока Server-Sent Events от OpenRouter.
+    
+    Args:
+        line: Сырая строка потока
+        
+    Returns:
+        Фрагмент ответа (пустая строка для служебных строк) или None в конце потока
+    """
+    text = line.decode('utf-8').strip()
+    if not text.startswith('data:'):
+        # Пустые разделители и комментарии вида ": OPENROUTER PROCESSING"
+        return ""
+    
+    data = text[len('data:'):].strip()
+    if data == '[DONE]':
+        return None
+    
+    choices = json.loads(data).get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content") or ""
+
+
+def parse_stream_usage(line: bytes) -> Optional[Dict]:
+    """
+    Достает usage из строки потока, если она его содержит.
+    
+    Args:
+        line: Сырая строка потока без фрагмента ответа
+        
+    Returns:
+        Словарь usage или None
+    """
+    text = line.decode('utf-8').strip()
+    if not text.startswith('data:') or '"usage"' not in text:
+        return None
+    return json.loads(text[len('data:'):]).get("usage")
+
+
+def record_usage(usage: Optional[Dict]):
+    """Учитывает в метриках токены из usage ответа API."""
+    if not usage:
+        return
+    LLM_TOKENS.labels("prompt").inc(usage.get("prompt_tokens") or 0)
+    LLM_TOKENS.labels("completion").inc(usage.get("completion_tokens") or 0)
+    # Часть токенов запроса, взятая из кеша префикса у провайдера
+    details = usage.get("prompt_tokens_details") or {}
+    LLM_TOKENS.labels("cached").inc(details.get("cached_tokens") or 0)
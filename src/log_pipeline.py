@@ -0,0 +1,175 @@
+"""
+Неблокирующее логирование через очередь.
+
+Обработчики сообщений только кладут записи в очередь (QueueHandler),
+форматирование, маскирование текстов и запись на диск выполняет
+фоновый поток QueueListener. Файл пишется в JSON по строке на запись
+с ротацией по размеру или по времени.
+"""
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from typing import List
+
+# Поля контекста, которые передаются в логгер через extra и попадают в JSON
+CONTEXT_FIELDS = ('chat_id', 'user_id', 'latency_ms')
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладет запись в очередь без форматирования.
+    
+    Стандартный QueueHandler форматирует сообщение и копирует запись
+    в потоке event loop; здесь это делает фоновый поток. Аргументы
+    записи не должны меняться после вызова логгера.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class BodyFilter(logging.Filter):
+    """
+    Применяет политику записи текстов пользователя и ответов LLM.
+    
+    Текст передается в логгер отдельно: extra={'body': text}.
+    """
+    
+    def __init__(self, mode: str, max_chars: int, sample_rate: float):
+        """
+        Args:
+            mode: full - целиком, truncate - первые max_chars символов,
+                redact - только длина и хеш, off - не писать
+            max_chars: Длина текста в режиме truncate
+            sample_rate: Доля записей, в которых текст сохраняется (0..1)
+        """
+        super().__init__()
+        self.mode = mode
+        self.max_chars = max_chars
+        self.sample_rate = sample_rate
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        body = getattr(record, 'body', None)
+        # Запись проходит через несколько обработчиков, политика применяется один раз
+        if body is None or getattr(record, 'body_checked', False):
+            return True
+        record.body_checked = True
+        
+        if self.mode == 'off' or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            record.body = None
+        elif self.mode == 'redact':
+            digest = hashlib.sha256(body.encode()).hexdigest()[:12]
+            record.body = f"<{len(body)} символов, sha256:{digest}>"
+        elif self.mode == 'truncate' and len(body) > self.max_chars:
+            record.body = body[:self.max_chars] + "..."
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись как одну строку JSON."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+                
+        body = getattr(record, 'body', None)
+        if body is not None:
+            entry['body'] = body
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Текстовый формат для консоли: текст сообщения дописывается после двоеточия."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        body = getattr(record, 'body', None)
+        if body is not None:
+            line = f"{line}: {body}"
+        return line
+
+
+def create_file_handler(config: dict) -> logging.Handler:
+    """
+    Создает обработчик файла лога с ротацией по LOG_ROTATION.
+    
+    Args:
+        config: Конфигурация приложения
+        
+    Returns:
+        Обработчик с ротацией по размеру (size) или по времени (time)
+    """
+    if config['LOG_ROTATION'] == 'time':
+        return logging.handlers.TimedRotatingFileHandler(
+            config['LOG_FILE'],
+            when=config['LOG_ROTATE_WHEN'],
+            backupCount=config['LOG_BACKUP_COUNT'],
+            encoding='utf-8'
+        )
+    return logging.handlers.RotatingFileHandler(
+        config['LOG_FILE'],
+        maxBytes=config['LOG_MAX_BYTES'],
+        backupCount=config['LOG_BACKUP_COUNT'],
+        encoding='utf-8'
+    )
+
+
+def setup_logging(config: dict, console: bool = True) -> logging.handlers.QueueListener:
+    """
+    Подключает к корневому логгеру очередь и запускает фоновую запись.
+    
+    Args:
+        config: Конфигурация приложения
+        console: Дублировать ли записи в консоль
+        
+    Returns:
+        Запущенный QueueListener; при остановке приложения нужно вызвать stop(),
+        чтобы дописать оставшиеся в очереди записи
+    """
+    directory = os.path.dirname(config['LOG_FILE'])
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        
+    body_filter = BodyFilter(config['LOG_BODIES'], config['LOG_BODY_MAX_CHARS'], config['LOG_BODY_SAMPLE_RATE'])
+    
+    file_handler = create_file_handler(config)
+    file_handler.setFormatter(JsonFormatter() if config['LOG_FORMAT'] == 'json' else TextFormatter(TEXT_FORMAT))
+    handlers: List[logging.Handler] = [file_handler]
+    
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(TextFormatter(TEXT_FORMAT))
+        handlers.append(console_handler)
+        
+    for handler in handlers:
+        handler.addFilter(body_filter)
+        
+    # Очередь без ограничения: запись в неё не блокирует event loop
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(getattr(logging, config['LOG_LEVEL']))
+    
+    listener.start()
+    return listener
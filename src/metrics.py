@@ -0,0 +1,257 @@
+"""
+Метрики работы бота в текстовом формате Prometheus.
+
+Счетчики и гистограммы обновляются в памяти процесса за несколько
+операций без блокировок (все вызовы идут из одного event loop).
+Гейджи вычисляются функциями в момент запроса /metrics, поэтому
+не стоят ничего на пути обработки сообщений.
+"""
+import logging
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Формирует блок меток вида {name="value"} с экранированием значений."""
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    """Число в формате Prometheus: целые без дробной части, остальные без потери точности."""
+    if value != value:
+        return "NaN"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """Базовая метрика с необязательными метками."""
+    
+    kind = "untyped"
+    
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], 'Metric'] = {}
+    
+    def labels(self, *values: str) -> 'Metric':
+        """Возвращает дочернюю метрику для значений меток, создавая её при первом обращении."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}")
+            child = self._make_child()
+            self._children[values] = child
+        return child
+    
+    def _make_child(self) -> 'Metric':
+        raise NotImplementedError
+    
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        """Строки значений: (суффикс имени, метки, значение)."""
+        raise NotImplementedError
+    
+    def collect(self) -> List[str]:
+        """Строки метрики в текстовом формате Prometheus."""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        if self.labelnames:
+            children = sorted(self._children.items())
+        else:
+            children = [((), self)]
+        for values, child in children:
+            labels = format_labels(self.labelnames, values)
+            for suffix, extra, value in child._samples():
+                if extra:
+                    labels_block = labels[:-1] + "," + extra + "}" if labels else "{" + extra + "}"
+                else:
+                    labels_block = labels
+                lines.append(f"{self.name}{suffix}{labels_block} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик."""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self.value = 0.0
+    
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+    
+    def _make_child(self) -> 'Counter':
+        return Counter(self.name, self.description)
+    
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        return [("_total", "", self.value)]
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными корзинами."""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(buckets)
+        # Последняя корзина - значения больше всех границ (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def _make_child(self) -> 'Histogram':
+        return Histogram(self.name, self.description, buckets=self.buckets)
+    
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append(("_bucket", f'le="{bound:g}"', cumulative))
+        samples.append(("_bucket", 'le="+Inf"', self.count))
+        samples.append(("_sum", "", self.sum))
+        samples.append(("_count", "", self.count))
+        return samples
+
+
+class Gauge(Metric):
+    """Текущее значение, вычисляемое функцией в момент сбора метрик."""
+    
+    kind = "gauge"
+    
+    def __init__(self, name: str, description: str, function: Callable[[], float]):
+        super().__init__(name, description)
+        self.function = function
+    
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        try:
+            value = float(self.function())
+        except Exception as e:
+            logger.error(f"Ошибка вычисления метрики {self.name}: {e}")
+            value = float('nan')
+        return [("", "", value)]
+
+
+class MetricsRegistry:
+    """Набор метрик процесса."""
+    
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+    
+    def register(self, metric: Metric) -> Metric:
+        """Добавляет метрику; метрика с тем же именем заменяется."""
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, description, labelnames))
+    
+    def histogram(self, name: str, description: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, description, labelnames, buckets))
+    
+    def gauge(self, name: str, description: str, function: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, description, function))
+    
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+LLM_LATENCY = registry.histogram(
+    "llm_request_duration_seconds", "Время запроса к LLM API", ["mode"])
+HANDLER_LATENCY = registry.histogram(
+    "handler_duration_seconds", "Время от начала обработки сообщения до отправки ответа", ["handler"])
+TELEGRAM_LATENCY = registry.histogram(
+    "telegram_request_duration_seconds", "Время запроса к Telegram Bot API", ["method"])
+ERRORS = registry.counter(
+    "errors", "Число ошибок по источнику", ["kind"])
+LLM_TOKENS = registry.counter(
+    "llm_tokens", "Токены LLM по данным usage ответа API", ["type"])
+LLM_MODEL_REQUESTS = registry.counter(
+    "llm_model_requests", "Запросы к моделям пула по результату", ["model", "outcome"])
+
+
+def create_metrics_app(metrics: Optional[MetricsRegistry] = None) -> 'web.Application':
+    """
+    Создает aiohttp приложение с единственным маршрутом /metrics.
+    
+    Args:
+        metrics: Набор метрик, по умолчанию общий для процесса
+        
+    Returns:
+        aiohttp приложение
+    """
+    # aiohttp нужен только серверу метрик, модулям с одними счетчиками он не нужен
+    from aiohttp import web
+    
+    metrics = metrics or registry
+    
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+                            
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+class MetricsServer:
+    """Локальный HTTP сервер метрик, работающий в event loop бота."""
+    
+    def __init__(self, host: str, port: int, metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            host: Адрес для прослушивания
+            port: Порт для прослушивания
+            metrics: Набор метрик, по умолчанию общий для процесса
+        """
+        self.host = host
+        self.port = port
+        self.metrics = metrics
+        self._runner: Optional['web.AppRunner'] = None
+    
+    async def start(self):
+        """Запускает сервер. Вызывается внутри работающего event loop."""
+        if self._runner is not None:
+            return
+        from aiohttp import web
+        self._runner = web.AppRunner(create_metrics_app(self.metrics), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+    
+    async def stop(self):
+        """Останавливает сервер."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
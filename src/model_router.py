@@ -0,0 +1,254 @@
+"""
+Маршрутизация запросов по пулу моделей LLM.
+
+Модели перебираются в заданном порядке. Для каждой ведется скользящая
+статистика задержек и ошибок, а автомат отключения (circuit breaker)
+временно исключает модель после серии ошибок. Если основная модель не
+ответила за время около своего p95, параллельно запускается запрос к
+следующей (hedging), используется первый успешный ответ.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+from metrics import LLM_MODEL_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Сколько успешных ответов нужно, чтобы доверять p95 модели
+MIN_LATENCY_SAMPLES = 10
+
+
+class ModelsUnavailable(Exception):
+    """Все модели пула отключены автоматами или вернули ошибку."""
+
+
+def describe_error(error: Optional[BaseException]) -> str:
+    """Текст ошибки для лога; у таймаутов текст пустой, поэтому подставляется тип."""
+    if error is None:
+        return "все модели отключены"
+    return str(error) or type(error).__name__
+
+
+class CircuitBreaker:
+    """
+    Автомат отключения модели.
+    
+    После failure_threshold ошибок подряд модель отключается на reset_timeout
+    секунд, затем пропускается один пробный запрос: успех включает модель,
+    ошибка отключает снова.
+    """
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+    
+    @property
+    def state(self) -> str:
+        """closed - модель работает, open - отключена, half_open - ждет пробного запроса."""
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half_open'
+    
+    def allow(self) -> bool:
+        """Можно ли отправить запрос модели; в half_open пропускает один пробный запрос."""
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self.probing:
+            self.probing = True
+            return True
+        return False
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+    
+    def release(self):
+        """Пробный запрос отменен без результата - разрешаем следующий."""
+        self.probing = False
+
+
+class ModelStats:
+    """Скользящая статистика задержек и ошибок модели."""
+    
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+    
+    def record(self, success: bool, latency: float):
+        self.outcomes.append(success)
+        if success:
+            self.latencies.append(latency)
+    
+    def percentile(self, share: float) -> Optional[float]:
+        """Перцентиль задержки успешных ответов или None, пока данных мало."""
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+    
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class ModelRouter:
+    """Выбор модели, резервные запросы и учет состояния моделей."""
+    
+    def __init__(self, models: List[str], hedge_enabled: bool, hedge_percentile: float,
+                 hedge_min_delay: float, hedge_max_delay: float, window: int,
+                 failure_threshold: int, reset_timeout: float):
+        """
+        Args:
+            models: Модели в порядке предпочтения, первая - основная
+            hedge_enabled: Запускать ли резервный запрос, не дожидаясь ошибки
+            hedge_percentile: Перцентиль задержки модели, после которого запускается резервный запрос
+            hedge_min_delay: Нижняя граница ожидания перед резервным запросом, секунды
+            hedge_max_delay: Ожидание, пока статистики модели мало, и верхняя граница, секунды
+            window: Сколько последних запросов учитывать в статистике модели
+            failure_threshold: Ошибок подряд до отключения модели
+            reset_timeout: На сколько секунд отключается модель
+        """
+        self.models = models
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        
+        self.stats: Dict[str, ModelStats] = {model: ModelStats(window) for model in models}
+        self.breakers: Dict[str, CircuitBreaker] = {
+            model: CircuitBreaker(failure_threshold, reset_timeout) for model in models
+        }
+        self.hedged_requests = 0
+    
+    def hedge_delay(self, model: str) -> float:
+        """Сколько ждать ответа модели перед резервным запросом."""
+        latency = self.stats[model].percentile(self.hedge_percentile)
+        if latency is None:
+            return self.hedge_max_delay
+        return min(max(latency, self.hedge_min_delay), self.hedge_max_delay)
+    
+    async def run(self, request: Callable[[str], Awaitable[T]]) -> T:
+        """
+        Выполняет запрос, перебирая модели пула.
+        
+        Ошибка модели сразу передает запрос следующей; медленный ответ
+        запускает резервный запрос параллельно. Остальные запросы
+        отменяются после первого успешного ответа.
+        
+        Args:
+            request: Функция запроса к модели: request(model)
+            
+        Returns:
+            Первый успешный результат
+            
+        Raises:
+            ModelsUnavailable: Ни одна модель не ответила
+        """
+        candidates = self.candidates()
+        running: Dict[asyncio.Task, str] = {}
+        last_error: Optional[BaseException] = None
+        
+        def launch() -> bool:
+            model = next(candidates, None)
+            if model is None:
+                return False
+            running[asyncio.ensure_future(self._attempt(model, request))] = model
+            return True
+            
+        launch()
+        try:
+            while running:
+                primary = next(iter(running.values()))
+                timeout = self.hedge_delay(primary) if self.hedge_enabled else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    # Модель отвечает дольше обычного - подключаем резервную
+                    if launch():
+                        self.hedged_requests += 1
+                        logger.info(f"Модель {primary} не ответила за {timeout:.2f} с, запущен резервный запрос")
+                    else:
+                        await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                    
+                for task in done:
+                    model = running.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"Модель {model} вернула ошибку: {describe_error(last_error)}")
+                    # Ошибку модели сразу подхватывает следующая
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+                
+        raise ModelsUnavailable(f"Ни одна модель пула не ответила, последняя ошибка: {describe_error(last_error)}")
+    
+    def candidates(self) -> Iterator[str]:
+        """Модели, которым разрешен запрос, в порядке предпочтения; автомат проверяется при переходе к модели."""
+        for model in self.models:
+            if self.breakers[model].allow():
+                yield model
+    
+    def record(self, model: str, success: bool, latency: float):
+        """Учитывает результат запроса к модели в статистике и автомате отключения."""
+        self.stats[model].record(success, latency)
+        breaker = self.breakers[model]
+        if success:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+            if breaker.state == 'open':
+                logger.warning(f"Модель {model} отключена на {breaker.reset_timeout} с после {breaker.failures} ошибок")
+        LLM_MODEL_REQUESTS.labels(model, 'success' if success else 'error').inc()
+    
+    def release(self, model: str):
+        """Запрос к модели прерван без результата: пробный запрос автомата можно повторить."""
+        self.breakers[model].release()
+    
+    def snapshot(self) -> Dict[str, Dict]:
+        """Состояние моделей: автомат, доля ошибок и p95 задержки."""
+        return {
+            model: {
+                'state': self.breakers[model].state,
+                'error_rate': self.stats[model].error_rate,
+                'p95': self.stats[model].percentile(0.95)
+            }
+            for model in self.models
+        }
+    
+    async def _attempt(self, model: str, request: Callable[[str], Awaitable[T]]) -> T:
+        started = time.perf_counter()
+        try:
+            result = await request(model)
+        except asyncio.CancelledError:
+            # Отмененный резервный запрос ничего не говорит о модели
+            self.release(model)
+            LLM_MODEL_REQUESTS.labels(model, 'cancelled').inc()
+            raise
+        except Exception:
+            self.record(model, False, time.perf_counter() - started)
+            raise
+        self.record(model, True, time.perf_counter() - started)
+        return result
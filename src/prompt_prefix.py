@@ -0,0 +1,144 @@
+"""
+Постоянный префикс запроса к LLM: системный промт из файла.
+
+Сообщение с системным промтом и оценка его токенов собираются один раз
+и используются всеми запросами без копирования. Для моделей, которые
+кешируют префикс промта только по явной отметке (Anthropic, Gemini),
+отдельно собирается вариант сообщения с cache_control. Файл промта
+перечитывается при изменении, не чаще раза в reload_interval секунд;
+новый хеш промта меняет и ключи кеша ответов.
+"""
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from context_builder import message_tokens
+
+logger = logging.getLogger(__name__)
+
+# Промт, если файл не удалось прочитать при запуске
+DEFAULT_SYSTEM_PROMPT = "Ты - полезный помощник."
+
+# Модели OpenRouter, кеширующие префикс только по отметке cache_control
+CACHE_CONTROL_MODEL_PREFIXES = ('anthropic/', 'google/gemini')
+
+
+def supports_cache_control(model: str, mode: str) -> bool:
+    """
+    Нужна ли модели отметка cache_control на системном сообщении.
+
+    Args:
+        model: Имя модели OpenRouter
+        mode: auto - по имени модели, on - всегда, off - никогда
+
+    Returns:
+        True, если системное сообщение нужно отметить для кеширования
+    """
+    if mode == 'on':
+        return True
+    if mode == 'off':
+        return False
+    return model.startswith(CACHE_CONTROL_MODEL_PREFIXES)
+
+
+class PromptPrefix:
+    """Системный промт из файла с готовыми сообщениями и перечитыванием при изменении."""
+
+    def __init__(self, path: str, reload_interval: float, cache_mode: str = 'auto'):
+        """
+        Args:
+            path: Путь к файлу системного промта
+            reload_interval: Как часто проверять изменение файла, секунды; 0 - не проверять
+            cache_mode: Отметка для кеширования префикса у провайдера: auto, on или off
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self.cache_mode = cache_mode
+
+        self.text = DEFAULT_SYSTEM_PROMPT
+        self.hash = ""
+        self.message: Dict = {}
+        self.cached_message: Dict = {}
+        self.tokens = 0
+        self.reloads = 0
+
+        self._file_state: Optional[Tuple[float, int]] = None
+        self._checked_at = 0.0
+        self._load(initial=True)
+
+    def refresh(self):
+        """Перечитывает файл промта, если он изменился. Дешево: файл проверяется не чаще reload_interval."""
+        if not self.reload_interval:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        if self._stat() != self._file_state:
+            self._load(initial=False)
+
+    def for_model(self, model: str, messages: List[Dict]) -> List[Dict]:
+        """
+        Подставляет в собранный запрос системное сообщение в варианте для модели.
+
+        Args:
+            model: Имя модели, которой уйдет запрос
+            messages: Сообщения запроса, первое - self.message
+
+        Returns:
+            Те же сообщения или новый список с отмеченным для кеширования префиксом
+        """
+        if messages and messages[0] is self.message and supports_cache_control(model, self.cache_mode):
+            return [self.cached_message] + messages[1:]
+        return messages
+
+    def _stat(self) -> Optional[Tuple[float, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def _load(self, initial: bool):
+        file_state = self._stat()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except FileNotFoundError:
+            self._file_state = file_state
+            if initial:
+                logger.error(f"Файл системного промта не найден: {self.path}")
+                self._build(DEFAULT_SYSTEM_PROMPT)
+            else:
+                logger.error(f"Файл системного промта не найден: {self.path}, используется прежний промт")
+            return
+        except Exception as e:
+            logger.error(f"Ошибка загрузки системного промта: {e}")
+            if initial:
+                self._build(DEFAULT_SYSTEM_PROMPT)
+            return
+
+        self._file_state = file_state
+        content_hash = hashlib.md5(content.encode()).hexdigest()[:8]
+        if content_hash == self.hash:
+            # Файл сохранен без изменений текста - собранные сообщения остаются прежними
+            return
+        self._build(content)
+        if initial:
+            logger.info(f"Загружен системный промт из {self.path}, длина: {len(content)} символов, хеш: {content_hash}")
+        else:
+            self.reloads += 1
+            logger.info(f"Системный промт перечитан из {self.path}, длина: {len(content)} символов, хеш: {content_hash}")
+
+    def _build(self, content: str):
+        self.text = content
+        self.hash = hashlib.md5(content.encode()).hexdigest()[:8]
+        self.message = {"role": "system", "content": content}
+        # Формат частей содержимого с отметкой кеширования, как в документации OpenRouter
+        self.cached_message = {
+            "role": "system",
+            "content": [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]
+        }
+        self.tokens = message_tokens(self.message)
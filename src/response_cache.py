@@ -0,0 +1,152 @@
+"""
+Кеш ответов LLM для повторяющихся запросов.
+
+Ключ строится из модели, хеша системного промта и нормализованных
+сообщений. Для каждого ключа хранится небольшой пул вариантов ответа,
+чтобы повторные ответы не были одинаковыми.
+"""
+import hashlib
+import json
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Приводит текст к виду для сравнения: нижний регистр, без знаков препинания
+    и лишних пробелов, "ё" заменена на "е".
+    
+    Args:
+        text: Исходный текст
+        
+    Returns:
+        Нормализованный текст
+    """
+    text = PUNCTUATION_PATTERN.sub(" ", text.lower().replace("ё", "е"))
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def make_cache_key(model: str, prompt_hash: str, messages: List[Dict]) -> str:
+    """
+    Строит ключ кеша запроса.
+    
+    Args:
+        model: Имя модели
+        prompt_hash: Хеш системного промта
+        messages: Сообщения запроса без системного промта
+        
+    Returns:
+        Хеш-ключ запроса
+    """
+    normalized = [[message["role"], normalize_text(message["content"])] for message in messages]
+    payload = json.dumps([model, prompt_hash, normalized], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class CacheEntry:
+    """Пул вариантов ответа на один запрос."""
+    
+    __slots__ = ('variants', 'refreshed_at')
+    
+    def __init__(self, pool_size: int):
+        self.variants: Deque[str] = deque(maxlen=pool_size)
+        self.refreshed_at = time.monotonic()
+
+
+class ResponseCache:
+    """Кеш ответов с вытеснением по LRU и TTL и пулом вариантов на ключ."""
+    
+    def __init__(self, max_entries: int, ttl_seconds: float, pool_size: int, refresh_after: float):
+        """
+        Args:
+            max_entries: Максимальное число ключей в кеше
+            ttl_seconds: Через сколько секунд без обновления запись устаревает
+            pool_size: Сколько вариантов ответа хранить на ключ
+            refresh_after: Через сколько секунд запись стоит обновить в фоне
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.pool_size = pool_size
+        self.refresh_after = refresh_after
+        
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+    
+    def get(self, key: str) -> Optional[str]:
+        """
+        Возвращает случайный вариант ответа из пула.
+        
+        Args:
+            key: Ключ запроса
+            
+        Returns:
+            Ответ или None, если записи нет или она устарела
+        """
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.refreshed_at > self.ttl_seconds:
+            del self._entries[key]
+            self.evictions += 1
+            entry = None
+            
+        if entry is None:
+            self.misses += 1
+            return None
+            
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return random.choice(entry.variants)
+    
+    def add(self, key: str, answer: str):
+        """
+        Добавляет вариант ответа; при полном пуле вытесняется самый старый.
+        
+        Args:
+            key: Ключ запроса
+            answer: Ответ LLM
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = CacheEntry(self.pool_size)
+            self._entries[key] = entry
+        elif len(entry.variants) == self.pool_size:
+            self.refreshes += 1
+            
+        entry.variants.append(answer)
+        entry.refreshed_at = time.monotonic()
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def needs_refresh(self, key: str) -> bool:
+        """Нужно ли сгенерировать для ключа еще один вариант: пул не заполнен или устарел."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        return len(entry.variants) < self.pool_size or time.monotonic() - entry.refreshed_at > self.refresh_after
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def stats(self) -> Dict[str, float]:
+        """Счетчики попаданий, промахов, вытеснений и доля попаданий."""
+        requests = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'evictions': self.evictions,
+            'refreshes': self.refreshes
+        }
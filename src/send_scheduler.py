@@ -0,0 +1,374 @@
+"""
+Планировщик исходящих запросов к Telegram.
+
+Обработчики ставят отправку, правку и удаление сообщений в очередь,
+а планировщик выполняет их с соблюдением лимитов Telegram: общий
+token bucket на бота и отдельный на каждый чат. Запросы одного чата
+выполняются по одному и по приоритету: окончательный ответ раньше
+правок и служебного "Думаю...". Между чатами очередь обходится по
+кругу, чтобы "Думаю..." нового чата не ждало ответов занятых чатов.
+Правки одного сообщения, ждущие в очереди, объединяются в одну
+с последним текстом. Ответ 429 ставит
+отправку на паузу на указанное Telegram время, запрос повторяется.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше - раньше
+PRIORITY_ANSWER = 0
+PRIORITY_EDIT = 1
+PRIORITY_PLACEHOLDER = 2
+
+PRIORITY_NAMES = {PRIORITY_ANSWER: 'answer', PRIORITY_EDIT: 'edit', PRIORITY_PLACEHOLDER: 'placeholder'}
+
+TELEGRAM_RETRY_AFTER = registry.counter(
+    "telegram_retry_after", "Ответы 429 Too Many Requests от Telegram")
+TELEGRAM_SEND_WAIT = registry.histogram(
+    "telegram_send_wait_seconds", "Время ожидания запроса в очереди планировщика", ["priority"])
+
+
+class TokenBucket:
+    """Ограничение частоты: rate токенов в секунду, не больше capacity в запасе."""
+    
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена, 0 - токен есть."""
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+    
+    def take(self):
+        self.tokens -= 1
+    
+    @property
+    def full(self) -> bool:
+        return self.tokens >= self.capacity
+
+
+class SendJob:
+    """Запрос в очереди. Ожидание задачи возвращает результат запроса или None, если он отменен."""
+    
+    __slots__ = ('chat_id', 'send', 'priority', 'key', 'sequence', 'queued_at', 'attempts', 'cancelled', 'future')
+    
+    def __init__(self, chat_id: int, send: Callable[[], Awaitable], priority: int,
+                 key: Optional[Hashable], sequence: int):
+        self.chat_id = chat_id
+        self.send = send
+        self.priority = priority
+        self.key = key
+        self.sequence = sequence
+        self.queued_at = time.monotonic()
+        self.attempts = 0
+        self.cancelled = False
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Ошибка уже записана в лог планировщиком, правки и удаления часто никто не ждет
+        self.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+    
+    def __lt__(self, other: 'SendJob') -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+    
+    def __await__(self):
+        return self.future.__await__()
+
+
+# Состояния чата в планировщике
+CHAT_READY = 'ready'      # в очереди готовых чатов
+CHAT_WAITING = 'waiting'  # ждет токена своего лимита
+CHAT_BUSY = 'busy'        # запрос чата выполняется
+CHAT_IDLE = 'idle'        # запросов нет, хранится, пока лимит не восстановится
+
+
+class ChatQueue:
+    """Очередь и лимит одного чата."""
+    
+    __slots__ = ('jobs', 'bucket', 'state', 'wake_at')
+    
+    def __init__(self, bucket: TokenBucket):
+        self.jobs: List[SendJob] = []
+        self.bucket = bucket
+        self.state = CHAT_IDLE
+        # Время, на которое чат стоит в очереди таймеров; записи с другим временем устарели
+        self.wake_at: Optional[float] = None
+    
+    def head(self) -> Optional[SendJob]:
+        """Первая неотмененная задача очереди."""
+        while self.jobs and self.jobs[0].cancelled:
+            heapq.heappop(self.jobs)
+        return self.jobs[0] if self.jobs else None
+
+
+class SendScheduler:
+    """Очередь исходящих запросов к Telegram с лимитами, приоритетами и повтором после 429."""
+    
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, max_retries: int):
+        """
+        Args:
+            global_rate: Максимум запросов в секунду на бота
+            chat_rate: Максимум запросов в секунду в один чат
+            chat_burst: Сколько запросов в чат можно выполнить подряд без ожидания
+            max_retries: Сколько раз повторять запрос после ответа 429
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        
+        # Без запаса: запросы к Telegram распределяются по времени равномерно
+        self._global = TokenBucket(global_rate, 1.0)
+        self._chats: Dict[int, ChatQueue] = {}
+        # Готовые чаты по кругу и таймеры чатов, ждущих токена или удаления
+        self._ready: deque = deque()
+        self._timers: List[Tuple[float, int, int]] = []
+        self._edits: Dict[Hashable, SendJob] = {}
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._inflight = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        
+        self.queued = 0
+        self.coalesced_edits = 0
+        self.retried = 0
+    
+    def submit(self, chat_id: int, send: Callable[[], Awaitable], priority: int = PRIORITY_ANSWER,
+               key: Optional[Hashable] = None) -> SendJob:
+        """
+        Ставит запрос в очередь чата. Не ждет выполнения.
+        
+        Args:
+            chat_id: Чат, к лимиту которого относится запрос
+            send: Функция без аргументов, выполняющая запрос
+            priority: Приоритет запроса
+            key: Ключ объединения: ждущий запрос с тем же ключом заменяется новым
+        
+        Returns:
+            Задача; её можно дождаться, чтобы получить результат запроса
+        """
+        self._ensure_started()
+        
+        if key is not None and key in self._edits:
+            # Ждущая правка того же сообщения получает новый текст вместо второй правки
+            job = self._edits[key]
+            job.send = send
+            if priority < job.priority:
+                job.priority = priority
+                heapq.heapify(self._chats[chat_id].jobs)
+            self.coalesced_edits += 1
+            return job
+        
+        job = SendJob(chat_id, send, priority, key, next(self._sequence))
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = ChatQueue(TokenBucket(self.chat_rate, self.chat_burst))
+            self._chats[chat_id] = chat
+        heapq.heappush(chat.jobs, job)
+        if chat.state == CHAT_IDLE:
+            self._make_ready(chat_id, chat)
+        if key is not None:
+            self._edits[key] = job
+        self.queued += 1
+        self._wakeup.set()
+        return job
+    
+    def reply(self, message: Any, text: str, priority: int = PRIORITY_ANSWER) -> SendJob:
+        """Ставит в очередь ответ на сообщение пользователя."""
+        return self.submit(message.chat.id, lambda: message.reply(text), priority)
+    
+    def edit(self, message: Any, text: str, priority: int = PRIORITY_EDIT) -> SendJob:
+        """Ставит в очередь правку сообщения бота; ждущие правки того же сообщения объединяются."""
+        return self.submit(message.chat.id, lambda: self._ignore_bad_request(message.edit_text(text)),
+                           priority, key=('edit', message.chat.id, message.message_id))
+    
+    def delete(self, message: Any) -> SendJob:
+        """Ставит в очередь удаление сообщения бота."""
+        return self.submit(message.chat.id, lambda: self._ignore_bad_request(message.delete()), PRIORITY_ANSWER)
+    
+    def cancel(self, job: SendJob) -> bool:
+        """
+        Отменяет запрос, если он еще не начал выполняться.
+        
+        Returns:
+            True, если запрос отменен, False - если он уже выполняется или выполнен
+        """
+        if job.cancelled or job.future.done() or job.attempts:
+            return False
+        job.cancelled = True
+        self._forget(job)
+        job.future.set_result(None)
+        return True
+    
+    async def close(self):
+        """Дожидается выполнения всех запросов в очереди и останавливает планировщик."""
+        while self.queued or self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+            if self.queued:
+                await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    def _ensure_started(self):
+        # Задача завершена, если event loop, в котором она работала, закрыт
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch_loop())
+    
+    def _forget(self, job: SendJob):
+        self.queued -= 1
+        if job.key is not None and self._edits.get(job.key) is job:
+            del self._edits[job.key]
+    
+    async def _dispatch_loop(self):
+        while True:
+            job, delay = self._next_job(time.monotonic())
+            if job is not None:
+                task = asyncio.create_task(self._execute(job))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+                continue
+            
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _next_job(self, now: float) -> Tuple[Optional[SendJob], Optional[float]]:
+        """
+        Выбирает запрос с наивысшим приоритетом в следующем по кругу чате, у которого есть токен.
+        
+        Приоритет действует только внутри чата: обслуженный чат уходит в конец
+        очереди готовых чатов, поэтому служебные сообщения одних чатов не ждут,
+        пока другие чаты отправят все ответы и правки. Чаты без токена ждут
+        в очереди таймеров и не просматриваются при каждом выборе.
+        
+        Returns:
+            Запрос (или None) и сколько ждать до следующей попытки (None - до нового запроса)
+        """
+        if now < self._paused_until:
+            return None, self._paused_until - now
+        global_wait = self._global.wait_time(now)
+        if global_wait:
+            return None, global_wait
+        
+        self._wake_timers(now)
+        while self._ready:
+            chat_id = self._ready.popleft()
+            chat = self._chats[chat_id]
+            job = chat.head()
+            if job is None:
+                # Все запросы чата отменены
+                self._make_idle(chat_id, chat, now)
+                continue
+            wait = chat.bucket.wait_time(now)
+            if wait:
+                chat.state = CHAT_WAITING
+                self._schedule(chat_id, chat, now + wait)
+                continue
+            
+            heapq.heappop(chat.jobs)
+            chat.state = CHAT_BUSY
+            job.attempts += 1
+            chat.bucket.take()
+            self._global.take()
+            self._forget(job)
+            return job, None
+        
+        return None, (max(0.0, self._timers[0][0] - now) if self._timers else None)
+    
+    def _make_ready(self, chat_id: int, chat: ChatQueue):
+        chat.state = CHAT_READY
+        chat.wake_at = None
+        self._ready.append(chat_id)
+    
+    def _make_idle(self, chat_id: int, chat: ChatQueue, now: float):
+        """Чат без запросов удаляется, когда его лимит восстановится полностью."""
+        chat.bucket.refill(now)
+        if chat.bucket.full:
+            del self._chats[chat_id]
+            return
+        chat.state = CHAT_IDLE
+        self._schedule(chat_id, chat, now + (chat.bucket.capacity - chat.bucket.tokens) / chat.bucket.rate)
+    
+    def _schedule(self, chat_id: int, chat: ChatQueue, wake_at: float):
+        chat.wake_at = wake_at
+        heapq.heappush(self._timers, (wake_at, next(self._sequence), chat_id))
+    
+    def _wake_timers(self, now: float):
+        """Переводит чаты с наступившим временем таймера в готовые или удаляет простаивающие."""
+        while self._timers and self._timers[0][0] <= now:
+            wake_at, _, chat_id = heapq.heappop(self._timers)
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.wake_at != wake_at:
+                continue
+            if chat.head() is not None:
+                self._make_ready(chat_id, chat)
+            else:
+                self._make_idle(chat_id, chat, now)
+    
+    async def _execute(self, job: SendJob):
+        chat = self._chats[job.chat_id]
+        TELEGRAM_SEND_WAIT.labels(PRIORITY_NAMES.get(job.priority, str(job.priority))).observe(time.monotonic() - job.queued_at)
+        try:
+            result = await job.send()
+        except TelegramRetryAfter as e:
+            TELEGRAM_RETRY_AFTER.inc()
+            # Неизвестно, какой лимит превышен, поэтому пауза для всех чатов
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            logger.warning(f"Telegram ограничил частоту запросов, пауза {e.retry_after} с (чат {job.chat_id})")
+            if job.key is not None and job.key in self._edits:
+                # Пока правка выполнялась, пришла более новая правка того же сообщения - повтор не нужен
+                job.future.set_result(None)
+            elif job.attempts <= self.max_retries:
+                self.retried += 1
+                heapq.heappush(chat.jobs, job)
+                self.queued += 1
+                if job.key is not None:
+                    # Новые правки того же сообщения снова объединяются с повторяемой
+                    self._edits[job.key] = job
+            else:
+                logger.error(f"Запрос к Telegram для чата {job.chat_id} не выполнен после {job.attempts} попыток")
+                job.future.set_exception(e)
+        except Exception as e:
+            logger.error(f"Ошибка запроса к Telegram для чата {job.chat_id}: {e}")
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            # Обслуженный чат встает в конец очереди готовых чатов
+            if chat.head() is not None:
+                self._make_ready(job.chat_id, chat)
+            else:
+                self._make_idle(job.chat_id, chat, time.monotonic())
+            self._wakeup.set()
+    
+    @staticmethod
+    async def _ignore_bad_request(request: Awaitable) -> Any:
+        # "message is not modified" и удаленное сообщение не мешают ответу
+        try:
+            return await request
+        except TelegramBadRequest as e:
+            logger.warning(f"Telegram отклонил запрос: {e}")
+            return None
@@ -0,0 +1,242 @@
+"""
+Сервисы бота: LLM клиент, хранилища истории и контактов, очереди и допуск генераций.
+
+Сервисы создаются при создании диспетчера, а не при импорте обработчиков:
+импорт не читает конфигурацию и не требует секретов. Диспетчер хранит их
+под ключом "services", aiogram передает их обработчикам и хукам запуска
+и остановки по имени аргумента.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from admission import AdmissionController, Overloaded
+from chat_coalescer import ChatCoalescer
+from config import Config, get_config
+from conversation_log import create_conversation_log
+from conversation_store import ConversationStore
+from faq_index import create_faq_index
+from history_backend import PersistentHistory, create_history_backend
+from lead_extraction import LeadExtractor, LeadStore
+from llm_client import LLMClient
+from metrics import MetricsServer, registry
+from send_scheduler import SendJob, SendScheduler
+
+logger = logging.getLogger(__name__)
+
+# Допуск фоновой генерации извлечения контактов: не больше одной, уступает место ответам при перегрузке
+LEAD_EXTRACTION_USER = "lead_extraction"
+
+# Допуск фоновой генерации кеша ответов: не больше одной и только на свободное место без очереди
+CACHE_REFRESH_USER = "cache_refresh"
+
+
+class BotServices:
+    """Сервисы, общие для обработчиков одного диспетчера."""
+
+    def __init__(self, answer: Callable[..., Awaitable], config: Optional[Config] = None):
+        """
+        Args:
+            answer: Ответ на пакет сообщений чата (chat_id, messages), вызывается очередями чатов
+            config: Конфигурация приложения, по умолчанию get_config()
+        """
+        self.config = config = config or get_config()
+
+        # LLM клиент
+        self.llm_client = LLMClient(config, admit_background=self.admit_cache_refresh)
+
+        # Хранение истории диалогов в памяти по chat_id: только окно, уходящее в LLM
+        self.chat_history = ConversationStore(
+            window=config['HISTORY_MAX_TURNS'] * 2,
+            max_chats=config['HISTORY_STORE_MAX_CHATS'],
+            max_messages=config['HISTORY_STORE_MAX_MESSAGES'],
+            ttl_seconds=config['HISTORY_STORE_TTL']
+        )
+
+        # Постоянное хранилище истории: запись пакетами в фоне, чтение при первом обращении к чату
+        self.persistent_history = PersistentHistory(
+            create_history_backend(config),
+            flush_interval=config['HISTORY_FLUSH_INTERVAL'],
+            batch_size=config['HISTORY_FLUSH_BATCH_SIZE']
+        )
+
+        # Загрузки истории из хранилища, идущие сейчас: одна на чат
+        self._history_loads: Dict[int, asyncio.Future] = {}
+        
+        # Двоичный журнал диалогов для офлайн анализа: пишется вместе с историей
+        self.conversation_log = create_conversation_log(config)
+
+        # Готовые ответы на частые вопросы без обращения к LLM
+        self.faq_index = create_faq_index(config)
+
+        # Допуск генераций к LLM: ограниченная очередь и отказ при перегрузке
+        self.admission = AdmissionController(
+            max_active=config['ADMISSION_MAX_ACTIVE'],
+            max_queue=config['ADMISSION_MAX_QUEUE'],
+            queue_timeout=config['ADMISSION_QUEUE_TIMEOUT']
+        )
+
+        # Очередь исходящих запросов к Telegram с лимитами частоты и приоритетами
+        self.send_scheduler = SendScheduler(
+            global_rate=config['TELEGRAM_GLOBAL_RATE'],
+            chat_rate=config['TELEGRAM_CHAT_RATE'],
+            chat_burst=config['TELEGRAM_CHAT_BURST'],
+            max_retries=config['TELEGRAM_SEND_RETRIES']
+        )
+
+        # Извлечение контактов клиентов в фоне после ответа
+        self.lead_extractor = LeadExtractor(
+            LeadStore(config['LEAD_DB_PATH']),
+            batch_interval=config['LEAD_BATCH_INTERVAL'],
+            batch_size=config['LEAD_BATCH_SIZE'],
+            complete=self.complete_lead_extraction if config['LEAD_EXTRACTION_LLM'] else None
+        ) if config['LEAD_EXTRACTION'] else None
+
+        # Локальный HTTP сервер метрик /metrics
+        self.metrics_server = MetricsServer(config['METRICS_HOST'], config['METRICS_PORT'])
+
+        # Очереди сообщений по чатам: объединение, порядок и отмена устаревших генераций
+        self.chat_coalescer = ChatCoalescer(
+            answer,
+            debounce_seconds=config['CHAT_DEBOUNCE_SECONDS'],
+            cancel_inflight=config['CHAT_CANCEL_INFLIGHT']
+        )
+
+        self._register_gauges()
+
+    def _register_gauges(self):
+        """Гейджи вычисляются при запросе /metrics и не нагружают обработку сообщений."""
+        registry.gauge("active_chats", "Чатов с историей в памяти", lambda: len(self.chat_history))
+        registry.gauge("history_messages", "Сообщений истории в памяти", lambda: self.chat_history.total_messages)
+        registry.gauge("chats_in_processing", "Чатов с сообщениями в очереди или в обработке", lambda: len(self.chat_coalescer))
+        registry.gauge("history_pending_writes", "Операций истории, ожидающих записи в хранилище",
+                       lambda: self.persistent_history.pending_operations)
+        registry.gauge("admission_active", "Генерации, допущенные к LLM", lambda: self.admission.active)
+        registry.gauge("admission_queue_depth", "Запросы, ожидающие допуска к LLM", lambda: self.admission.queue_depth)
+        registry.gauge("telegram_send_queue", "Запросов к Telegram в очереди планировщика", lambda: self.send_scheduler.queued)
+        registry.gauge("lead_extraction_pending", "Чатов, ожидающих извлечения контактов",
+                       lambda: self.lead_extractor.pending_chats if self.lead_extractor is not None else 0)
+        registry.gauge("conversation_log_pending_bytes", "Байт журнала диалогов, ожидающих записи в файл",
+                       lambda: self.conversation_log.pending_bytes if self.conversation_log is not None else 0)
+        registry.gauge("llm_cache_entries", "Записей в кеше ответов LLM", lambda: len(self.llm_client.response_cache))
+
+    async def start(self, welcome_prompt: Optional[str] = None):
+        """
+        Запускает фоновую запись истории и журнала диалогов, извлечение контактов, сервер метрик
+        и, если включено, заранее генерирует приветствия.
+
+        Args:
+            welcome_prompt: Запрос приветствия для LLM_CACHE_PREFILL
+        """
+        self.persistent_history.start()
+        if self.conversation_log is not None:
+            self.conversation_log.start()
+        if self.lead_extractor is not None:
+            self.lead_extractor.start()
+        if self.config['METRICS_ENABLED']:
+            await self.metrics_server.start()
+        if self.config['LLM_CACHE_PREFILL'] and welcome_prompt:
+            self.llm_client.prefill_cache(welcome_prompt)
+
+    async def stop(self):
+        """Дожидается ответов на принятые сообщения, дописывает историю, журнал и контакты и освобождает ресурсы LLM клиента."""
+        await self.chat_coalescer.drain()
+        await self.send_scheduler.close()
+        await self.persistent_history.stop()
+        if self.conversation_log is not None:
+            await self.conversation_log.stop()
+        if self.lead_extractor is not None:
+            await self.lead_extractor.stop()
+        await self.llm_client.close()
+        await self.metrics_server.stop()
+
+    async def complete_lead_extraction(self, messages: List[Dict]) -> Optional[str]:
+        """Запрос к LLM для извлечения контактов через общий допуск генераций."""
+        try:
+            return await self.admission.run(LEAD_EXTRACTION_USER, self.llm_client.complete_messages(messages))
+        except Overloaded:
+            logger.warning("Извлечение контактов через LLM отложено из-за перегрузки, пакет разобран только правилами")
+            return None
+
+    async def admit_cache_refresh(self, generation: Awaitable) -> Optional[str]:
+        """Фоновая генерация кеша ответов через общий допуск; только на свободное место, без очереди."""
+        if not self.admission.has_free_slot(CACHE_REFRESH_USER):
+            generation.close()
+            logger.info("Обновление кеша ответов отложено: нет свободного места в допуске к LLM")
+            return None
+        return await self.admission.run(CACHE_REFRESH_USER, generation)
+    
+    async def load_history(self, chat_id: int) -> List[Dict]:
+        """
+        Возвращает историю чата, при первом обращении подгружая её из хранилища.
+
+        Args:
+            chat_id: Идентификатор чата
+
+        Returns:
+            Окно последних сообщений чата
+        """
+        if chat_id not in self.chat_history:
+            # Одновременные первые обращения к чату ждут одной загрузки, иначе история скопируется дважды
+            loading = self._history_loads.get(chat_id)
+            if loading is None:
+                loading = asyncio.ensure_future(self._load_stored_history(chat_id))
+                self._history_loads[chat_id] = loading
+                loading.add_done_callback(lambda _: self._history_loads.pop(chat_id, None))
+            await asyncio.shield(loading)
+        return self.chat_history.get(chat_id)
+    
+    async def _load_stored_history(self, chat_id: int):
+        """Копирует в память окно истории чата из хранилища."""
+        stored_messages = await self.persistent_history.load(chat_id, limit=self.chat_history.window)
+        if stored_messages and chat_id not in self.chat_history:
+            self.chat_history.extend(chat_id, stored_messages)
+            logger.info(f"История чата {chat_id} загружена из хранилища: {len(stored_messages)} сообщений")
+
+    def save_history(self, chat_id: int, messages: List[Dict]):
+        """Добавляет сообщения в историю чата и ставит их в очередь на запись."""
+        self.chat_history.extend(chat_id, messages)
+        self.persistent_history.append(chat_id, messages)
+
+    def clear_history(self, chat_id: int, user_id: int):
+        """Очищает историю чата в памяти и в хранилище и отмечает очистку в журнале диалогов."""
+        self.chat_history.clear(chat_id)
+        self.persistent_history.clear(chat_id)
+        if self.conversation_log is not None:
+            self.conversation_log.clear(chat_id, user_id)
+
+    def remember_answer(self, chat_id: int, user_id: int, question: str, answer: str, history: List[Dict],
+                        latency: float, source: str = 'llm'):
+        """
+        Сохраняет вопрос и ответ в историю и журнал диалогов и ставит вопрос в очередь извлечения контактов.
+
+        Args:
+            chat_id: Идентификатор чата
+            user_id: Идентификатор пользователя
+            question: Вопрос пользователя
+            answer: Отправленный ответ
+            history: История чата до вопроса
+            latency: Время от получения вопроса до ответа в секундах
+            source: Источник ответа: llm или faq
+        """
+        # Добавляем вопрос и ответ в историю (без timestamp для совместимости с API)
+        messages = [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": answer}
+        ]
+        self.save_history(chat_id, messages)
+        if self.conversation_log is not None:
+            self.conversation_log.append(chat_id, user_id, messages, latency, source)
+
+        # Контакты ищутся после ответа, в фоне: вопрос бота помогает понять короткий ответ клиента
+        if self.lead_extractor is not None:
+            previous = history[-1]["content"] if history and history[-1]["role"] == "assistant" else ""
+            self.lead_extractor.submit(chat_id, user_id, question, context=previous)
+
+    async def discard_placeholder(self, placeholder: SendJob):
+        """Убирает служебное сообщение: отменяет еще не отправленное или удаляет отправленное."""
+        if self.send_scheduler.cancel(placeholder):
+            return
+        sent = await placeholder
+        if sent is not None:
+            self.send_scheduler.delete(sent)
@@ -0,0 +1,206 @@
+"""
+Прогрессивный вывод потокового ответа LLM в Telegram.
+
+Ответ показывается редактированием сообщения-заглушки "Думаю...".
+Правки объединяются и отправляются не чаще заданного интервала,
+а при превышении лимита длины ответ продолжается новым сообщением.
+С планировщиком отправки промежуточные правки ставятся в его очередь
+и не задерживают чтение потока.
+"""
+import logging
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+from send_scheduler import PRIORITY_ANSWER, PRIORITY_EDIT, SendJob, SendScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def split_message(text: str, max_length: int) -> Tuple[str, str]:
+    """
+    Делит текст на часть, помещающуюся в одно сообщение, и остаток.
+    
+    Старается резать по переводу строки или пробелу во второй половине
+    допустимой длины, иначе режет жестко по лимиту.
+    
+    Args:
+        text: Исходный текст
+        max_length: Максимальная длина сообщения
+        
+    Returns:
+        Кортеж (первая часть, остаток)
+    """
+    if len(text) <= max_length:
+        return text, ""
+        
+    cut = max(text.rfind('\n', 0, max_length), text.rfind(' ', 0, max_length))
+    if cut < max_length // 2:
+        cut = max_length
+        
+    return text[:cut].rstrip(), text[cut:].lstrip()
+
+
+class StreamingReply:
+    """Сообщение Telegram, которое дописывается по мере поступления текста."""
+    
+    def __init__(self, user_message: types.Message, placeholder: types.Message,
+                 edit_interval: float, max_length: int, sender: Optional[SendScheduler] = None):
+        """
+        Args:
+            user_message: Сообщение пользователя, на которое отвечаем
+            placeholder: Уже отправленное сообщение-заглушка для редактирования
+            edit_interval: Минимальный интервал между правками в секундах
+            max_length: Максимальная длина одного сообщения
+            sender: Планировщик отправки; без него запросы выполняются напрямую
+        """
+        self.user_message = user_message
+        self.sender = sender
+        self.current_message = placeholder
+        self.edit_interval = edit_interval
+        self.max_length = max_length
+        
+        self.full_text = ""
+        self.current_text = ""
+        self.shown_text = placeholder.text or ""
+        self.last_edit_time = 0.0
+        # Все сообщения ответа по порядку и продолжение, которое еще ждет отправки
+        self.messages: List[types.Message] = [placeholder]
+        self._sending: Optional[SendJob] = None
+    
+    @property
+    def messages_sent(self) -> int:
+        """Число сообщений, на которые разбит ответ."""
+        return len(self.messages)
+    
+    async def push(self, delta: str):
+        """
+        Добавляет фрагмент ответа, при необходимости обновляя сообщение.
+        
+        Args:
+            delta: Очередной фрагмент текста от LLM
+        """
+        self.full_text += delta
+        self.current_text += delta
+        
+        while len(self.current_text) > self.max_length:
+            await self._roll_over()
+            
+        if time.monotonic() - self.last_edit_time >= self.edit_interval:
+            await self._edit(self.current_text)
+    
+    async def finish(self) -> str:
+        """
+        Показывает окончательный текст ответа.
+        
+        Returns:
+            Полный текст ответа
+        """
+        await self._edit(self.current_text, final=True)
+        logger.info(f"Потоковый ответ показан: {len(self.full_text)} символов, сообщений: {self.messages_sent}")
+        return self.full_text
+    
+    async def abort(self, note: str):
+        """
+        Завершает прерванный ответ: показанный текст дополняется пометкой об ошибке.
+        
+        Args:
+            note: Пометка для пользователя
+        """
+        text = "\n\n".join(part for part in (self.current_text.rstrip(), note) if part)
+        if len(text) <= self.max_length:
+            await self._edit(text, final=True)
+        else:
+            await self._edit(self.current_text, final=True)
+            self.current_message = await self._reply(note)
+        logger.warning(f"Потоковый ответ прерван после {len(self.full_text)} символов, сообщений: {self.messages_sent}")
+    
+    async def discard(self):
+        """Удаляет все сообщения ответа, включая продолжение, которое еще ждет отправки."""
+        if self._sending is not None and not self.sender.cancel(self._sending):
+            sent = await self._sending
+            if sent is not None:
+                self.messages.append(sent)
+        self._sending = None
+        
+        for message in self.messages:
+            if self.sender is not None:
+                self.sender.delete(message)
+            else:
+                try:
+                    await message.delete()
+                except TelegramBadRequest as e:
+                    logger.warning(f"Не удалось удалить сообщение: {e}")
+        logger.info(f"Потоковый ответ отменен, удалено сообщений: {len(self.messages)}")
+        self.messages = []
+    
+    async def _roll_over(self):
+        """Завершает текущее сообщение и продолжает ответ новым."""
+        head, tail = split_message(self.current_text, self.max_length)
+        await self._edit(head, final=True)
+        
+        self.current_text = tail
+        self.current_message = await self._reply(tail[:self.max_length] or "...")
+        self.shown_text = self.current_message.text or ""
+        self.last_edit_time = time.monotonic()
+    
+    async def _reply(self, text: str) -> types.Message:
+        """Отправляет следующее сообщение ответа и запоминает его."""
+        if self.sender is not None:
+            # Задача запоминается до отправки: отмененный ответ удалит и это сообщение
+            self._sending = self.sender.reply(self.user_message, text)
+            message = await self._sending
+            self._sending = None
+        else:
+            message = await self.user_message.reply(text)
+        self.messages.append(message)
+        return message
+    
+    async def _edit(self, text: str, final: bool = False):
+        """
+        Редактирует текущее сообщение, если текст изменился.
+        
+        Args:
+            text: Новый текст сообщения
+            final: Окончательный текст: через планировщик правка идет с приоритетом ответа и дожидается отправки
+        """
+        if not text.strip() or text == self.shown_text:
+            return
+            
+        if self.sender is not None:
+            # Ждущие в очереди правки этого сообщения заменяются новым текстом
+            job = self.sender.edit(self.current_message, text, PRIORITY_ANSWER if final else PRIORITY_EDIT)
+            if final:
+                await job
+        else:
+            try:
+                await self.current_message.edit_text(text)
+            except TelegramBadRequest as e:
+                # "message is not modified" и подобные ошибки не критичны для ответа
+                logger.warning(f"Не удалось отредактировать сообщение: {e}")
+            
+        self.shown_text = text
+        self.last_edit_time = time.monotonic()
+
+
+async def stream_to_message(chunks: AsyncIterator[str], reply: StreamingReply) -> str:
+    """
+    Выводит поток фрагментов ответа в Telegram.
+    
+    Args:
+        chunks: Асинхронный поток фрагментов ответа
+        reply: Сообщение для прогрессивного вывода
+        
+    Returns:
+        Полный текст ответа (пустая строка, если ответ не получен)
+        
+    Raises:
+        Исключения потока: показанная часть ответа остается как есть,
+        завершить ее пометкой об ошибке может вызывающий через reply.abort()
+    """
+    async for delta in chunks:
+        await reply.push(delta)
+        
+    if not reply.full_text:
+        return ""
+    return await reply.finish()
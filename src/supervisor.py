@@ -0,0 +1,304 @@
+"""
+Супервизор многопроцессного режима.
+
+Супервизор получает обновления Telegram (long polling или webhook),
+разбирает только JSON и по chat_id передает обновление одному из
+рабочих процессов. Он следит за процессами: упавший или зависший
+процесс перезапускается с новой очередью, и в нее повторно передаются
+обновления, получение которых процесс не подтвердил. SIGTERM обрабатывает
+только супервизор: прием прекращается, а процессы дорабатывают
+полученные обновления и завершаются.
+"""
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from metrics import MetricsServer, registry
+from worker import run_worker, shard_index, worker_environment
+
+logger = logging.getLogger(__name__)
+
+# Типы обновлений, которые обрабатывает бот
+ALLOWED_UPDATES = ["message"]
+
+# Таймаут long polling запроса getUpdates, секунды
+POLL_TIMEOUT = 30
+
+# Пауза перед повтором getUpdates после ошибки, секунды
+POLL_RETRY_DELAY = 1.0
+
+# Сколько секунд ждать завершения рабочих процессов при остановке
+STOP_TIMEOUT = 40
+
+# С какого числа неподтвержденных обновлений процесса подтверждения читаются при каждой передаче
+ACK_READ_THRESHOLD = 100
+
+WORKER_RESTARTS = registry.counter("worker_restarts", "Перезапуски рабочих процессов", ["reason"])
+
+
+class WorkerHandle:
+    """Рабочий процесс, его очередь обновлений и обновления, получение которых он не подтвердил."""
+
+    def __init__(self, index: int, context):
+        self.index = index
+        # Очередь и канал подтверждений создаются для каждого запуска процесса: убитый во время
+        # чтения процесс оставляет блокировку очереди занятой, и новый процесс из нее не прочитает
+        self.updates = None
+        self.acks = None
+        self.unconfirmed: Dict[int, Dict] = {}
+        self.heartbeat = context.Value('d', 0.0)
+        self.process: Optional[multiprocessing.Process] = None
+        self.restarts = 0
+        self.dispatched = 0
+
+
+class Supervisor:
+    """Запуск рабочих процессов, распределение обновлений и контроль их состояния."""
+
+    def __init__(self, config: dict, workers: int):
+        """
+        Args:
+            config: Конфигурация приложения
+            workers: Число рабочих процессов
+        """
+        self.config = config
+        self.heartbeat_timeout = config['WORKER_HEARTBEAT_TIMEOUT']
+        self.check_interval = config['WORKER_HEARTBEAT_INTERVAL']
+
+        # spawn одинаково работает на Linux и Windows и не копирует event loop родителя
+        self._context = multiprocessing.get_context('spawn')
+        self.workers: List[WorkerHandle] = [WorkerHandle(index, self._context) for index in range(workers)]
+        self.stopping = False
+
+        registry.gauge("workers_alive", "Работающие рабочие процессы", lambda: self.health()['alive'])
+
+    def start(self):
+        """Запускает все рабочие процессы."""
+        for handle in self.workers:
+            self._spawn(handle)
+
+    def dispatch(self, update: Dict):
+        """Передает обновление процессу, отвечающему за его чат."""
+        handle = self.workers[shard_index(update, len(self.workers))]
+        handle.unconfirmed[update['update_id']] = update
+        handle.updates.put(update)
+        handle.dispatched += 1
+        if len(handle.unconfirmed) >= ACK_READ_THRESHOLD:
+            self._read_acks(handle)
+
+    async def monitor(self):
+        """Перезапускает упавшие процессы и процессы, переставшие отмечать активность."""
+        while not self.stopping:
+            await asyncio.sleep(self.check_interval)
+            for handle in self.workers:
+                if self.stopping:
+                    break
+                self._read_acks(handle)
+                process = handle.process
+                if not process.is_alive():
+                    logger.error(f"Рабочий процесс {handle.index} завершился с кодом {process.exitcode}, перезапуск")
+                    self._restart(handle, 'crash')
+                elif time.time() - handle.heartbeat.value > self.heartbeat_timeout:
+                    logger.error(f"Рабочий процесс {handle.index} не отвечает {self.heartbeat_timeout} с, перезапуск")
+                    process.kill()
+                    process.join()
+                    self._restart(handle, 'hang')
+
+    async def stop(self):
+        """Просит процессы доработать полученные обновления и дожидается их завершения."""
+        self.stopping = True
+        for handle in self.workers:
+            handle.updates.put(None)
+
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for handle in self.workers:
+            timeout = max(0.0, deadline - time.monotonic())
+            await loop.run_in_executor(None, handle.process.join, timeout)
+            if handle.process.is_alive():
+                logger.error(f"Рабочий процесс {handle.index} не завершился за {STOP_TIMEOUT} с, принудительная остановка")
+                handle.process.kill()
+                handle.process.join()
+        logger.info("Рабочие процессы остановлены")
+
+    def health(self) -> Dict:
+        """Состояние процессов: сколько работает, перезапуски и принятые обновления по процессам."""
+        now = time.time()
+        workers = [
+            {
+                'index': handle.index,
+                'pid': handle.process.pid if handle.process else None,
+                'alive': bool(handle.process and handle.process.is_alive()),
+                'heartbeat_age': now - handle.heartbeat.value,
+                'restarts': handle.restarts,
+                'dispatched': handle.dispatched,
+                'unconfirmed': len(handle.unconfirmed)
+            }
+            for handle in self.workers
+        ]
+        return {'alive': sum(1 for worker in workers if worker['alive']), 'workers': workers}
+
+    def _spawn(self, handle: WorkerHandle):
+        handle.updates = self._context.Queue()
+        handle.acks, acks_writer = self._context.Pipe(duplex=False)
+        # Время запуска засчитывается как активность, пока процесс импортирует модули
+        handle.heartbeat.value = time.time() + self.heartbeat_timeout
+        handle.process = self._context.Process(
+            target=run_worker,
+            args=(handle.index, handle.updates, acks_writer, handle.heartbeat,
+                  worker_environment(handle.index, len(self.workers), self.config)),
+            name=f"bot-worker-{handle.index}",
+            daemon=True
+        )
+        handle.process.start()
+        # Конец канала для записи остается только у процесса: после его смерти чтение завершится
+        acks_writer.close()
+        logger.info(f"Рабочий процесс {handle.index} запущен, pid {handle.process.pid}")
+
+        for update in handle.unconfirmed.values():
+            handle.updates.put(update)
+
+    def _restart(self, handle: WorkerHandle, reason: str):
+        # Процесс уже завершен: дочитываем его подтверждения и бросаем его очередь
+        self._read_acks(handle)
+        handle.acks.close()
+        handle.updates.close()
+        handle.updates.cancel_join_thread()
+        if handle.unconfirmed:
+            logger.warning(f"Рабочий процесс {handle.index}: {len(handle.unconfirmed)} обновлений передаются новому процессу")
+
+        handle.restarts += 1
+        WORKER_RESTARTS.labels(reason).inc()
+        self._spawn(handle)
+
+    def _read_acks(self, handle: WorkerHandle):
+        """Забирает подтверждения полученных процессом обновлений."""
+        try:
+            while handle.acks.poll():
+                for update_id in handle.acks.recv():
+                    handle.unconfirmed.pop(update_id, None)
+        except (EOFError, OSError):
+            # Процесс завершился, возможно посреди записи подтверждения
+            pass
+
+
+async def poll_updates(supervisor: Supervisor, config: dict):
+    """
+    Получает обновления через getUpdates и раздает их рабочим процессам.
+
+    Обновления не разбираются в объекты aiogram: супервизору нужен только chat_id.
+    """
+    url = f"{config['TELEGRAM_API_URL']}/bot{config['TELEGRAM_BOT_TOKEN']}/getUpdates"
+    offset = 0
+    timeout = aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        while True:
+            payload = {'offset': offset, 'timeout': POLL_TIMEOUT, 'allowed_updates': ALLOWED_UPDATES}
+            try:
+                async with session.post(url, json=payload) as response:
+                    data = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Ошибка getUpdates: {e}")
+                await asyncio.sleep(POLL_RETRY_DELAY)
+                continue
+
+            if not data.get('ok'):
+                logger.error(f"Telegram отклонил getUpdates: {data.get('description')}")
+                await asyncio.sleep(POLL_RETRY_DELAY)
+                continue
+
+            for update in data['result']:
+                supervisor.dispatch(update)
+                offset = update['update_id'] + 1
+
+
+def create_supervisor_webhook_app(supervisor: Supervisor, config: dict) -> web.Application:
+    """
+    Создает aiohttp приложение, принимающее обновления для рабочих процессов.
+
+    Запросы без верного X-Telegram-Bot-Api-Secret-Token отклоняются с кодом 401.
+    """
+    async def handle_update(request: web.Request) -> web.Response:
+        if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != config['WEBHOOK_SECRET']:
+            return web.Response(status=401)
+        supervisor.dispatch(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(config['WEBHOOK_PATH'], handle_update)
+    return app
+
+
+async def set_webhook(config: dict):
+    """Регистрирует webhook в Telegram."""
+    webhook_url = config['WEBHOOK_URL'].rstrip('/') + config['WEBHOOK_PATH']
+    url = f"{config['TELEGRAM_API_URL']}/bot{config['TELEGRAM_BOT_TOKEN']}/setWebhook"
+    payload = {'url': webhook_url, 'secret_token': config['WEBHOOK_SECRET'], 'allowed_updates': ALLOWED_UPDATES}
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=payload) as response:
+            data = await response.json()
+    if not data.get('ok'):
+        raise RuntimeError(f"Не удалось зарегистрировать webhook: {data.get('description')}")
+    logger.info(f"Webhook зарегистрирован: {webhook_url}")
+
+
+async def serve_supervisor(supervisor: Supervisor, config: dict, stop: asyncio.Event):
+    """
+    Работает до события stop: рабочие процессы, источник обновлений и сервер метрик.
+
+    Args:
+        supervisor: Супервизор с еще не запущенными процессами
+        config: Конфигурация приложения
+        stop: Событие остановки
+    """
+    supervisor.start()
+    monitor = asyncio.create_task(supervisor.monitor())
+
+    metrics_server = MetricsServer(config['METRICS_HOST'], config['METRICS_PORT'])
+    if config['METRICS_ENABLED']:
+        await metrics_server.start()
+
+    runner = None
+    source = None
+    if config['BOT_MODE'] == 'webhook':
+        runner = web.AppRunner(create_supervisor_webhook_app(supervisor, config), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, config['WEBHOOK_HOST'], config['WEBHOOK_PORT']).start()
+        await set_webhook(config)
+        logger.info(f"Webhook сервер слушает {config['WEBHOOK_HOST']}:{config['WEBHOOK_PORT']}")
+    else:
+        source = asyncio.create_task(poll_updates(supervisor, config))
+
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Остановка: прием обновлений прекращен, рабочие процессы дорабатывают полученные")
+        if source is not None:
+            source.cancel()
+        if runner is not None:
+            await runner.cleanup()
+        monitor.cancel()
+        await supervisor.stop()
+        await metrics_server.stop()
+
+
+def run_supervisor(config: dict):
+    """Запускает многопроцессный режим до SIGINT/SIGTERM."""
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, stop.set)
+            except NotImplementedError:
+                # Windows: остановка по Ctrl+C через KeyboardInterrupt
+                pass
+        await serve_supervisor(Supervisor(config, config['BOT_WORKERS']), config, stop)
+
+    asyncio.run(main())
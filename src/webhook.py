@@ -0,0 +1,80 @@
+"""
+Прием обновлений Telegram через webhook на локальном aiohttp сервере.
+"""
+import asyncio
+import logging
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд при остановке ждать завершения уже принятых обновлений
+DRAIN_TIMEOUT = 30
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Обработчик webhook, который при остановке дожидается принятых обновлений."""
+    
+    async def drain(self, app: web.Application):
+        """Дожидается фоновой обработки уже принятых обновлений."""
+        pending = list(self._background_feed_update_tasks)
+        if pending:
+            logger.info(f"Ожидание обработки {len(pending)} принятых обновлений")
+            await asyncio.wait(pending, timeout=DRAIN_TIMEOUT)
+
+
+def create_webhook_app(bot: Bot, dp: Dispatcher, config: dict) -> web.Application:
+    """
+    Создает aiohttp приложение, принимающее обновления Telegram.
+    
+    Запрос подтверждается сразу, обновление обрабатывается в фоне.
+    Запросы без верного X-Telegram-Bot-Api-Secret-Token отклоняются с кодом 401.
+    
+    Args:
+        bot: Экземпляр бота
+        dp: Диспетчер с зарегистрированными обработчиками
+        config: Конфигурация приложения
+        
+    Returns:
+        aiohttp приложение
+    """
+    app = web.Application()
+    request_handler = DrainingRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config['WEBHOOK_SECRET'],
+        handle_in_background=True
+    )
+    # Хуки остановки выполняются по порядку регистрации: сначала дожидаемся принятых обновлений,
+    # затем останавливаем диспетчер (ответы из очередей чатов), и только потом закрываем сессию бота
+    app.on_shutdown.append(request_handler.drain)
+    setup_application(app, dp, bot=bot)
+    request_handler.register(app, path=config['WEBHOOK_PATH'])
+    return app
+
+
+def run_webhook(bot: Bot, dp: Dispatcher, config: dict):
+    """
+    Регистрирует webhook в Telegram и запускает сервер до SIGINT/SIGTERM.
+    
+    Args:
+        bot: Экземпляр бота
+        dp: Диспетчер с зарегистрированными обработчиками
+        config: Конфигурация приложения
+    """
+    webhook_url = config['WEBHOOK_URL'].rstrip('/') + config['WEBHOOK_PATH']
+    
+    async def set_webhook(bot: Bot):
+        await bot.set_webhook(
+            webhook_url,
+            secret_token=config['WEBHOOK_SECRET'],
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logger.info(f"Webhook зарегистрирован: {webhook_url}")
+        
+    dp.startup.register(set_webhook)
+    app = create_webhook_app(bot, dp, config)
+    
+    logger.info(f"Webhook сервер слушает {config['WEBHOOK_HOST']}:{config['WEBHOOK_PORT']}")
+    web.run_app(app, host=config['WEBHOOK_HOST'], port=config['WEBHOOK_PORT'], print=None)
@@ -0,0 +1,184 @@
+"""
+Рабочий процесс многопроцессного режима.
+
+Супервизор передает процессу через очередь обновления его чатов,
+процесс подтверждает их получение и обрабатывает обычными обработчиками
+бота. Все обновления
+одного чата попадают в один процесс, поэтому история чата хранится
+в его памяти без общего состояния между процессами.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд при остановке ждать обработки уже полученных обновлений
+DRAIN_TIMEOUT = 30
+
+# Максимум обновлений, забираемых из очереди за одно обращение к потоку чтения
+READ_BATCH_SIZE = 100
+
+
+def worker_environment(index: int, workers: int, config: dict) -> Dict[str, str]:
+    """
+    Переменные окружения рабочего процесса: у каждого свой порт метрик, файл лога и журнал диалогов,
+    общий лимит запросов бота к Telegram делится между процессами поровну.
+
+    Args:
+        index: Номер рабочего процесса
+        workers: Число рабочих процессов
+        config: Конфигурация супервизора
+
+    Returns:
+        Переопределения переменных окружения
+    """
+    root, extension = os.path.splitext(config['LOG_FILE'])
+    log_root, log_extension = os.path.splitext(config['CONVERSATION_LOG_PATH'])
+    return {
+        'METRICS_PORT': str(config['METRICS_PORT'] + 1 + index),
+        'LOG_FILE': f"{root}.worker{index}{extension}",
+        'CONVERSATION_LOG_PATH': f"{log_root}.worker{index}{log_extension}",
+        'TELEGRAM_GLOBAL_RATE': str(config['TELEGRAM_GLOBAL_RATE'] / workers)
+    }
+
+
+def run_worker(index: int, updates, acks, heartbeat, environment: Dict[str, str]):
+    """
+    Точка входа рабочего процесса.
+
+    Args:
+        index: Номер рабочего процесса
+        updates: Очередь обновлений от супервизора; None - сигнал остановки
+        acks: Канал, куда процесс пишет update_id полученных обновлений
+        heartbeat: Общее значение, куда процесс пишет время последней активности
+        environment: Переопределения переменных окружения
+    """
+    # Остановкой управляет супервизор: Ctrl+C в терминале и SIGTERM всей группе процессов
+    # не должны обрывать обработку, супервизор сам попросит процесс доработать и завершиться
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    os.environ.update(environment)
+
+    from config import get_config, validate_config
+    from log_pipeline import setup_logging
+
+    config = get_config()
+    validate_config(config)
+    listener = setup_logging(config)
+    try:
+        asyncio.run(serve(index, updates, acks, heartbeat, config))
+    finally:
+        listener.stop()
+
+
+async def serve(index: int, updates, acks, heartbeat, config: dict):
+    """Обрабатывает обновления из очереди до сигнала остановки или завершения супервизора."""
+    from bot import create_bot, create_dispatcher
+
+    bot = create_bot(config)
+    dp = create_dispatcher()
+    await dp.emit_startup(bot=bot, **dp.workflow_data)
+    logger.info(f"Рабочий процесс {index} запущен, pid {os.getpid()}")
+
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    interval = config['WORKER_HEARTBEAT_INTERVAL']
+    beat = asyncio.create_task(send_heartbeats(heartbeat, interval))
+    supervisor = multiprocessing.parent_process()
+    try:
+        stopping = False
+        while not stopping:
+            # Блокирующее чтение очереди выполняется в потоке, за раз забирается пачка
+            batch = await loop.run_in_executor(None, read_batch, updates, acks, interval)
+            if not batch and supervisor is not None and not supervisor.is_alive():
+                # SIGTERM процесс игнорирует, поэтому без супервизора завершается сам
+                logger.error(f"Рабочий процесс {index}: супервизор завершился, остановка")
+                break
+            for update in batch:
+                if update is None:
+                    stopping = True
+                    break
+                task = asyncio.create_task(process_update(dp, bot, update))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+        if tasks:
+            logger.info(f"Рабочий процесс {index}: ожидание обработки {len(tasks)} обновлений")
+            await asyncio.wait(tasks, timeout=DRAIN_TIMEOUT)
+    finally:
+        beat.cancel()
+        await dp.emit_shutdown(bot=bot, **dp.workflow_data)
+        await bot.session.close()
+        logger.info(f"Рабочий процесс {index} остановлен")
+
+
+def read_batch(updates, acks, timeout: float) -> list:
+    """
+    Ждет первое обновление, забирает без ожидания те, что уже лежат в очереди, и подтверждает их получение.
+
+    Returns:
+        Пачка обновлений; пустая, если за timeout секунд ничего не пришло
+    """
+    try:
+        batch = [updates.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    while batch[-1] is not None and len(batch) < READ_BATCH_SIZE:
+        try:
+            batch.append(updates.get_nowait())
+        except queue.Empty:
+            break
+    received = [update['update_id'] for update in batch if update is not None]
+    if received:
+        acks.send(received)
+    return batch
+
+
+async def process_update(dp, bot, update: Dict):
+    try:
+        await dp.feed_raw_update(bot, update)
+    except Exception as e:
+        logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+
+
+async def send_heartbeats(heartbeat, interval: float):
+    """Обновляет время активности, пока event loop процесса не завис."""
+    while True:
+        heartbeat.value = time.time()
+        await asyncio.sleep(interval)
+
+
+def update_chat_id(update: Dict) -> Optional[int]:
+    """
+    Находит чат, к которому относится обновление Bot API.
+
+    Args:
+        update: Обновление в формате Bot API
+
+    Returns:
+        Идентификатор чата или пользователя, None если обновление ни к кому не относится
+    """
+    for key, value in update.items():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        sender = value.get('from') or value.get('user')
+        if sender:
+            return sender['id']
+    return None
+
+
+def shard_index(update: Dict, workers: int) -> int:
+    """Номер рабочего процесса для обновления: остаток от деления chat_id на число процессов."""
+    chat_id = update_chat_id(update)
+    if chat_id is None:
+        chat_id = update.get('update_id', 0)
+    return chat_id % workers
@@ -0,0 +1,96 @@
+"""
+Тесты допуска запросов к LLM: очередь, срок ожидания и одна генерация на пользователя.
+"""
+import sys
+import os
+import asyncio
+import pytest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from admission import AdmissionController, Overloaded
+
+
+async def generation(events: list, name: str, delay: float = 0.05):
+    events.append(("start", name))
+    await asyncio.sleep(delay)
+    events.append(("end", name))
+    return name
+
+
+def test_full_queue_sheds_immediately_without_running_generation():
+    events = []
+    
+    async def scenario():
+        admission = AdmissionController(max_active=1, max_queue=1, queue_timeout=5)
+        running = asyncio.create_task(admission.run(1, generation(events, "первый")))
+        waiting = asyncio.create_task(admission.run(2, generation(events, "второй")))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await admission.run(3, generation(events, "третий"))
+        depth = admission.queue_depth
+        await asyncio.gather(running, waiting)
+        return shed.value.reason, depth, admission
+    
+    reason, depth, admission = asyncio.run(scenario())
+    
+    assert reason == "queue_full"
+    assert depth == 1
+    assert ("start", "третий") not in events
+    assert admission.shed == 1
+    assert admission.active == 0
+
+
+def test_queue_wait_deadline_sheds_request():
+    events = []
+    
+    async def scenario():
+        admission = AdmissionController(max_active=1, max_queue=10, queue_timeout=0.05)
+        running = asyncio.create_task(admission.run(1, generation(events, "долгий", delay=0.3)))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await admission.run(2, generation(events, "ждущий"))
+        await running
+        return shed.value.reason, admission.queue_depth
+    
+    reason, depth = asyncio.run(scenario())
+    
+    assert reason == "timeout"
+    assert depth == 0
+    assert ("start", "ждущий") not in events
+
+
+def test_one_generation_per_user_lets_other_users_go_first():
+    events = []
+    
+    async def scenario():
+        admission = AdmissionController(max_active=2, max_queue=10, queue_timeout=5)
+        await asyncio.gather(
+            admission.run(1, generation(events, "первый пользователя 1")),
+            admission.run(1, generation(events, "второй пользователя 1")),
+            admission.run(2, generation(events, "пользователь 2"))
+        )
+    
+    asyncio.run(scenario())
+    
+    # Второй запрос пользователя 1 ждет, хотя слот свободен; пользователь 2 проходит сразу
+    assert events[:2] == [("start", "первый пользователя 1"), ("start", "пользователь 2")]
+    assert events.index(("start", "второй пользователя 1")) > events.index(("end", "первый пользователя 1"))
+
+
+def test_cancelled_waiter_leaves_queue():
+    events = []
+    
+    async def scenario():
+        admission = AdmissionController(max_active=1, max_queue=10, queue_timeout=5)
+        running = asyncio.create_task(admission.run(1, generation(events, "первый")))
+        waiting = asyncio.create_task(admission.run(2, generation(events, "отмененный")))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(running, waiting, return_exceptions=True)
+        return admission
+    
+    admission = asyncio.run(scenario())
+    
+    assert admission.queue_depth == 0
+    assert admission.active == 0
+    assert ("start", "отмененный") not in events
@@ -0,0 +1,99 @@
+"""
+Тесты объединения и последовательной обработки сообщений чатов.
+"""
+import sys
+import os
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from chat_coalescer import ChatCoalescer, GenerationSuperseded
+
+
+def test_messages_within_window_are_merged():
+    processed = []
+    
+    async def process(chat_id, messages):
+        processed.append((chat_id, messages))
+    
+    async def scenario():
+        coalescer = ChatCoalescer(process, debounce_seconds=0.05, cancel_inflight=True)
+        coalescer.submit(1, "привет")
+        coalescer.submit(1, "как дела")
+        await asyncio.sleep(0.02)
+        coalescer.submit(1, "что умеешь")
+        await coalescer.drain()
+        return coalescer
+        
+    coalescer = asyncio.run(scenario())
+    
+    assert processed == [(1, ["привет", "как дела", "что умеешь"])]
+    assert coalescer.merged_messages == 2
+    assert len(coalescer) == 0
+
+
+def test_batches_of_one_chat_run_in_order():
+    events = []
+    
+    async def process(chat_id, messages):
+        events.append(("start", messages))
+        await asyncio.sleep(0.05)
+        events.append(("end", messages))
+    
+    async def scenario():
+        coalescer = ChatCoalescer(process, debounce_seconds=0.01, cancel_inflight=False)
+        coalescer.submit(1, "первое")
+        await asyncio.sleep(0.03)
+        coalescer.submit(1, "второе")
+        await coalescer.drain()
+        
+    asyncio.run(scenario())
+    
+    assert events == [
+        ("start", ["первое"]), ("end", ["первое"]),
+        ("start", ["второе"]), ("end", ["второе"])
+    ]
+
+
+def test_new_message_cancels_generation_and_requeues_batch():
+    answered = []
+    superseded = []
+    
+    async def process(chat_id, messages):
+        try:
+            await coalescer.run_cancellable(chat_id, asyncio.sleep(0.1))
+        except GenerationSuperseded:
+            superseded.append(messages)
+            return
+        answered.append(messages)
+    
+    async def scenario():
+        coalescer.submit(1, "первое")
+        await asyncio.sleep(0.05)
+        coalescer.submit(1, "второе")
+        await coalescer.drain()
+        
+    coalescer = ChatCoalescer(process, debounce_seconds=0.01, cancel_inflight=True)
+    asyncio.run(scenario())
+    
+    assert superseded == [["первое"]]
+    assert answered == [["первое", "второе"]]
+    assert coalescer.cancelled_generations == 1
+
+
+def test_chats_are_processed_independently():
+    started = []
+    
+    async def process(chat_id, messages):
+        started.append(chat_id)
+        await asyncio.sleep(0.05)
+    
+    async def scenario():
+        coalescer = ChatCoalescer(process, debounce_seconds=0.01, cancel_inflight=True)
+        coalescer.submit(1, "первый чат")
+        coalescer.submit(2, "второй чат")
+        await asyncio.sleep(0.03)
+        # Оба чата обрабатываются одновременно, а не по очереди
+        assert sorted(started) == [1, 2]
+        await coalescer.drain()
+        
+    asyncio.run(scenario())
@@ -0,0 +1,72 @@
+"""
+Тесты сборки контекста в пределах бюджета токенов.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from context_builder import build_context, count_tokens, group_turns, message_tokens
+
+
+def make_history(turns: int, answer_words: int = 5):
+    history = []
+    for number in range(turns):
+        history.append({"role": "user", "content": f"вопрос номер {number}"})
+        history.append({"role": "assistant", "content": " ".join(["ответ"] * answer_words) + f" {number}"})
+    return history
+
+
+def test_group_turns_keeps_pairs_and_leading_assistant():
+    history = [{"role": "assistant", "content": "привет"}] + make_history(2)
+    
+    turns = group_turns(history)
+    
+    assert [len(turn) for turn in turns] == [1, 2, 2]
+
+
+def test_budget_packs_whole_turns_newest_first():
+    history = make_history(10)
+    turn_tokens = sum(message_tokens(message) for message in history[:2])
+    base = message_tokens({"role": "system", "content": "промт"}) + message_tokens({"role": "user", "content": "вопрос"})
+    
+    context = build_context("промт", history, "вопрос", token_budget=base + turn_tokens * 3 + 1, max_turns=100)
+    
+    assert context.turns_included == 3
+    assert context.turns_dropped == 7
+    history_part = context.messages[1:-1]
+    assert [message["role"] for message in history_part] == ["user", "assistant"] * 3
+    assert history_part[-1]["content"].endswith(" 9")
+    assert context.prompt_tokens <= base + turn_tokens * 3 + 1
+
+
+def test_max_turns_limits_history():
+    context = build_context("промт", make_history(10), "вопрос", token_budget=100000, max_turns=2)
+    
+    assert context.turns_included == 2
+    assert len(context.messages) == 1 + 4 + 1
+
+
+def test_system_prompt_and_question_always_included():
+    context = build_context("длинный промт " * 100, make_history(3), "вопрос", token_budget=10, max_turns=5)
+    
+    assert context.messages[0]["role"] == "system"
+    assert context.messages[-1] == {"role": "user", "content": "вопрос"}
+    assert context.turns_included == 0
+
+
+def test_summary_of_dropped_turns():
+    context = build_context("промт", make_history(10, answer_words=50), "вопрос", token_budget=300, max_turns=100, summarize=True)
+    
+    summary = context.messages[1]
+    assert summary["role"] == "system"
+    assert "вопрос номер 0" in summary["content"]
+
+
+def test_token_counts_are_cached():
+    text = "уникальный текст для проверки кеша " * 10
+    count_tokens(text)
+    hits_before = count_tokens.cache_info().hits
+    
+    count_tokens(text)
+    
+    assert count_tokens.cache_info().hits == hits_before + 1
@@ -0,0 +1,115 @@
+"""
+Тесты журнала диалогов: формат записей, оборванный хвост, статистика, воспроизведение и сжатие.
+"""
+import sys
+import os
+import asyncio
+import tracemalloc
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from conversation_log import ConversationLog, ConversationRecord, iter_records, write_records
+from replay_conversations import ContextPolicy, collect_stats, compact, parse_policy, replay
+
+SYSTEM_MESSAGE = {"role": "system", "content": "Ты консультант компании."}
+
+
+def make_dialog(chats: int, turns: int, started: float = 1_700_000_000.0):
+    """Записи диалогов: вопрос и ответ LLM с длинной историей, каждый третий ответ - из FAQ."""
+    for turn in range(turns):
+        for chat_id in range(chats):
+            timestamp = started + turn * 60
+            yield ConversationRecord(timestamp, chat_id, chat_id, 'user', '', 0, 6, f"Вопрос {turn} про сайт и приложение")
+            source = 'faq' if turn % 3 == 2 else 'llm'
+            yield ConversationRecord(timestamp, chat_id, chat_id, 'assistant', source, 1200 + turn, 40,
+                                     "Подробный ответ консультанта о разработке. " * 5)
+
+
+def test_log_writes_turns_and_clears(tmp_path):
+    path = str(tmp_path / "logs" / "conversations.log")
+
+    async def scenario():
+        log = ConversationLog(path, flush_interval=0.01)
+        log.start()
+        log.append(1, 10, [{"role": "user", "content": "Сколько стоит сайт?"},
+                           {"role": "assistant", "content": "Зависит от задач."}], latency=1.5)
+        log.clear(1, 10)
+        await asyncio.sleep(0.05)
+        log.append(2, 20, [{"role": "user", "content": "Контакты?"},
+                           {"role": "assistant", "content": "+7 (812) 1234567"}], latency=0.002, source='faq')
+        await log.stop()
+
+    asyncio.run(scenario())
+    records = list(iter_records(path))
+
+    assert [(record.chat_id, record.kind, record.source, record.latency_ms) for record in records] == [
+        (1, 'user', '', 0), (1, 'assistant', 'llm', 1500), (1, 'clear', '', 0),
+        (2, 'user', '', 0), (2, 'assistant', 'faq', 2)
+    ]
+    assert records[0].text == "Сколько стоит сайт?" and records[0].tokens > 0
+    assert [record.text for record in iter_records(path, with_text=False)] == [""] * 5
+
+
+def test_reader_stops_at_torn_tail(tmp_path):
+    path = str(tmp_path / "conversations.log")
+    write_records(path, make_dialog(chats=1, turns=2))
+    with open(path, 'ab') as f:
+        f.write(b"\x40\x00\x00\x00\x00")
+
+    assert len(list(iter_records(path))) == 4
+
+
+def test_stats_run_in_constant_memory(tmp_path):
+    path = str(tmp_path / "conversations.log")
+    write_records(path, make_dialog(chats=500, turns=30))
+
+    tracemalloc.start()
+    stats = collect_stats([path])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert stats.records == 30000 and stats.turns == 15000
+    assert stats.latency_ms['faq'].count == 5000
+    assert abs(stats.latency_ms['llm'].quantile(0.5) - 1214) / 1214 < 0.05
+    assert peak < 512 * 1024
+
+
+def test_replay_compares_context_policies(tmp_path):
+    path = str(tmp_path / "conversations.log")
+    write_records(path, make_dialog(chats=3, turns=12))
+    policies = [parse_policy("turns=10,budget=100000"), parse_policy("turns=2,budget=100000,summary=1")]
+
+    wide, narrow = asyncio.run(replay([path], policies, SYSTEM_MESSAGE))
+
+    # Ответы из FAQ не уходят в LLM: воспроизводятся только ответы LLM
+    assert wide.requests == narrow.requests == 3 * 8
+    assert narrow.truncated > wide.truncated
+    assert narrow.prompt_tokens.mean < wide.prompt_tokens.mean
+
+
+def test_replay_sends_limited_requests_to_llm(tmp_path):
+    path = str(tmp_path / "conversations.log")
+    write_records(path, make_dialog(chats=4, turns=6))
+    requests = []
+
+    class StubClient:
+        async def complete_messages(self, messages):
+            requests.append(messages)
+            await asyncio.sleep(0.001)
+            return "Ответ"
+
+    stats, = asyncio.run(replay([path], [ContextPolicy(5, 3000)], SYSTEM_MESSAGE, StubClient(), limit=10, concurrency=3))
+
+    assert len(requests) == stats.latency_ms.count == 10
+    assert requests[0][0] is SYSTEM_MESSAGE and requests[0][-1]["content"] == "Вопрос 0 про сайт и приложение"
+    assert stats.errors == 0
+
+
+def test_compact_drops_old_records_and_merges_logs(tmp_path):
+    first, second = str(tmp_path / "a.log"), str(tmp_path / "b.log")
+    write_records(first, make_dialog(chats=1, turns=3, started=1000.0))
+    write_records(second, make_dialog(chats=1, turns=3, started=5000.0))
+    output = str(tmp_path / "compact.log")
+
+    assert compact([first, second], output, since=1100.0) == 2 + 6
+    assert all(record.timestamp >= 1100.0 for record in iter_records(output))
@@ -0,0 +1,83 @@
+"""
+Тесты ограниченного хранилища истории диалогов.
+"""
+import sys
+import os
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from conversation_store import ConversationStore
+
+
+def make_store(**overrides) -> ConversationStore:
+    options = {'window': 4, 'max_chats': 100, 'max_messages': 1000, 'ttl_seconds': 3600}
+    options.update(overrides)
+    return ConversationStore(**options)
+
+
+def turn(number: int):
+    return [{"role": "user", "content": f"вопрос {number}"}, {"role": "assistant", "content": f"ответ {number}"}]
+
+
+def test_keeps_only_window_of_last_messages():
+    store = make_store(window=4)
+    for number in range(5):
+        store.extend(1, turn(number))
+    
+    history = store.get(1)
+    
+    assert [message["content"] for message in history] == ["вопрос 3", "ответ 3", "вопрос 4", "ответ 4"]
+    assert store.total_messages == 4
+
+
+def test_get_returns_copy_and_counts_hits():
+    store = make_store()
+    store.extend(1, turn(1))
+    
+    store.get(1).append({"role": "user", "content": "лишнее"})
+    store.get(2)
+    
+    assert len(store.get(1)) == 2
+    stats = store.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+
+
+def test_lru_eviction_by_chat_count():
+    store = make_store(max_chats=2)
+    store.extend(1, turn(1))
+    store.extend(2, turn(2))
+    store.get(1)
+    store.extend(3, turn(3))
+    
+    assert 1 in store and 3 in store
+    assert 2 not in store
+    assert store.stats()['lru_evictions'] == 1
+
+
+def test_global_message_cap():
+    store = make_store(max_messages=5)
+    for chat_id in range(4):
+        store.extend(chat_id, turn(chat_id))
+    
+    assert store.total_messages <= 5
+    assert len(store) == 2
+
+
+def test_ttl_eviction_of_idle_chats():
+    store = make_store(ttl_seconds=0.05)
+    store.extend(1, turn(1))
+    time.sleep(0.1)
+    
+    assert store.get(1) == []
+    assert store.stats()['ttl_evictions'] == 1
+    assert store.total_messages == 0
+
+
+def test_clear():
+    store = make_store()
+    store.extend(1, turn(1))
+    
+    assert store.clear(1) is True
+    assert store.clear(1) is False
+    assert store.total_messages == 0
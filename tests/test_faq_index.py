@@ -0,0 +1,64 @@
+"""
+Тесты индекса частых вопросов: разбор файла FAQ, близость и порог.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from faq_index import FaqEntry, FaqIndex, load_faq
+
+FAQ_PATH = os.path.join(os.path.dirname(__file__), '..', 'docs', 'faq.md')
+
+ENTRIES = [
+    FaqEntry("Сколько стоит разработка сайта?", ["Какая цена сайта?"], "Цена зависит от задач."),
+    FaqEntry("Какие у вас контакты?", ["Ваш телефон?"], "+7 (812) 1234567"),
+    FaqEntry("Вы разрабатываете мобильные приложения?", [], "Да."),
+]
+
+
+def test_load_faq_reads_sections(tmp_path):
+    path = tmp_path / "faq.md"
+    path.write_text(
+        "# Частые вопросы\n\nВступление не попадает в разделы.\n\n"
+        "## Первый вопрос?\n- Другая формулировка\n- Еще одна\n\nОтвет\nв две строки\n\n"
+        "## Вопрос без ответа\n- Формулировка\n",
+        encoding='utf-8'
+    )
+
+    entries = load_faq(str(path))
+
+    assert entries == [FaqEntry("Первый вопрос?", ["Другая формулировка", "Еще одна"], "Ответ\nв две строки")]
+
+
+def test_repo_faq_sections_have_answers():
+    entries = load_faq(FAQ_PATH)
+
+    assert len(entries) >= 5
+    assert all(entry.answer and entry.phrasings for entry in entries)
+
+
+def test_paraphrase_and_typo_match_section():
+    index = FaqIndex(ENTRIES, threshold=0.6)
+
+    assert index.lookup("сколько стоит сайт разработать").entry is ENTRIES[0]
+    assert index.lookup("ваш телефон").entry is ENTRIES[1]
+    assert index.lookup("Вы разрабатываете мобильные прилажения").entry is ENTRIES[2]
+
+
+def test_unrelated_question_falls_back_to_llm():
+    index = FaqIndex(ENTRIES, threshold=0.6)
+
+    assert index.lookup("Меня зовут Ольга, у нас сеть кофеен") is None
+    assert index.lookup("!!!") is None
+    assert index.search("Какие сроки у интернет-магазина?").score < 0.6
+
+
+
+def test_generic_question_is_not_answered_from_faq():
+    index = FaqIndex(load_faq(FAQ_PATH), threshold=0.75)
+
+    # Близость высокая, но вопрос общий или о том, на что ответ FAQ не отвечает
+    assert index.search("Сколько стоит?").score >= 0.75
+    assert index.lookup("Сколько стоит?") is None
+    assert index.lookup("Чем вы можете помочь с нашей 1С?") is None
+    assert index.lookup("Сколько стоит сайт?") is not None
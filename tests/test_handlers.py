@@ -0,0 +1,130 @@
+"""
+Тесты ответа на сообщения чата: обрыв потокового ответа, выбор между FAQ и LLM и /reset во время ответа.
+"""
+import sys
+import os
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fake_openrouter import run_fake_openrouter
+from config import read_config
+from handlers import STREAM_INTERRUPTED_NOTE, answer_messages, reset_handler
+from services import BotServices
+
+
+class FakeChat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class FakeMessage:
+    """Сообщение Telegram, записывающее отправленные и отредактированные тексты в общий журнал."""
+
+    def __init__(self, log: list, chat_id: int = 1, text: str = ""):
+        self.log = log
+        self.chat = FakeChat(chat_id)
+        self.message_id = len(log) + 1
+        self.from_user = FakeUser(chat_id)
+        self.text = text
+
+    async def reply(self, text: str):
+        self.log.append(('reply', text))
+        return FakeMessage(self.log, self.chat.id, text)
+
+    async def edit_text(self, text: str):
+        self.log.append(('edit', text))
+        self.text = text
+
+    async def delete(self):
+        self.log.append(('delete', self.text))
+
+
+def ask(monkeypatch, question: str, history=None, **server_options):
+    """Отвечает на вопрос через заглушку OpenRouter; возвращает журнал Telegram, историю чата и запросы к LLM."""
+    async def scenario():
+        async with run_fake_openrouter(**server_options) as server:
+            monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+            monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+            monkeypatch.setenv('OPENROUTER_API_URL', server.base_url)
+            monkeypatch.setenv('HISTORY_BACKEND', 'memory')
+            monkeypatch.setenv('METRICS_ENABLED', 'false')
+            services = BotServices(lambda chat_id, messages: None, read_config())
+            if history:
+                services.save_history(1, history)
+            log = []
+            await answer_messages(services, 1, [FakeMessage(log, text=question)])
+            await services.send_scheduler.close()
+            await services.llm_client.close()
+            return log, services.chat_history.get(1), server.requests
+
+    return asyncio.run(scenario())
+
+
+def test_interrupted_stream_gets_error_note_and_is_not_remembered(monkeypatch):
+    monkeypatch.setenv('LLM_STREAMING', 'true')
+    monkeypatch.setenv('LLM_CACHE_FAQ', 'false')
+
+    log, history, _ = ask(monkeypatch, "Расскажите про погоду на Марсе",
+                          answer="Погода на Марсе холодная и ветреная", stream_cut_after=3)
+
+    assert log[-1] == ('edit', "Погода на Марсе\n\n" + STREAM_INTERRUPTED_NOTE)
+    assert history == []
+
+
+def test_first_question_is_answered_from_faq(monkeypatch):
+    monkeypatch.setenv('FAQ_ENABLED', 'true')
+
+    log, history, requests = ask(monkeypatch, "Сколько стоит разработка сайта?")
+
+    assert requests == []
+    assert len(log) == 1
+    assert history[-1]['content'] == log[0][1]
+
+
+def test_follow_up_with_history_goes_to_llm(monkeypatch):
+    monkeypatch.setenv('FAQ_ENABLED', 'true')
+    monkeypatch.setenv('LLM_STREAMING', 'false')
+    previous = [
+        {"role": "user", "content": "Нужен интернет-магазин для сети кофеен"},
+        {"role": "assistant", "content": "Расскажите, сколько у вас товаров?"}
+    ]
+
+    log, history, requests = ask(monkeypatch, "А сколько стоит?", history=previous, answer="Зависит от каталога")
+
+    assert len(requests) == 1
+    assert log[-1] == ('reply', "Зависит от каталога")
+    assert history[-1]['content'] == "Зависит от каталога"
+
+
+def test_reset_during_generation_drops_the_answer(monkeypatch):
+    monkeypatch.setenv('LLM_STREAMING', 'false')
+    monkeypatch.setenv('CHAT_DEBOUNCE_SECONDS', '0.01')
+
+    async def scenario():
+        async with run_fake_openrouter(latency=0.3) as server:
+            monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+            monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+            monkeypatch.setenv('OPENROUTER_API_URL', server.base_url)
+            monkeypatch.setenv('HISTORY_BACKEND', 'memory')
+            services = BotServices(lambda chat_id, messages: answer_messages(services, chat_id, messages), read_config())
+            services.save_history(1, [{"role": "user", "content": "привет"}, {"role": "assistant", "content": "здравствуйте"}])
+            log = []
+            services.chat_coalescer.submit(1, FakeMessage(log, text="вопрос"))
+            await asyncio.sleep(0.1)
+            await reset_handler(FakeMessage(log, text="/reset"), services)
+            await services.chat_coalescer.drain()
+            await services.send_scheduler.close()
+            await services.llm_client.close()
+            return log, services.chat_history.get(1)
+
+    log, history = asyncio.run(scenario())
+
+    assert ('reply', "История диалога очищена.") in log
+    assert ('reply', "Ответ заглушки") not in log
+    assert history == []
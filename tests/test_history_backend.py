@@ -0,0 +1,111 @@
+"""
+Тесты постоянного хранилища истории и пакетной фоновой записи.
+"""
+import sys
+import os
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from config import read_config
+from history_backend import MemoryHistoryBackend, PersistentHistory, SQLiteHistoryBackend
+from services import BotServices
+
+
+def turn(number: int):
+    return [{"role": "user", "content": f"вопрос {number}"}, {"role": "assistant", "content": f"ответ {number}"}]
+
+
+class CountingBackend(MemoryHistoryBackend):
+    """Хранилище в памяти, считающее число транзакций."""
+    
+    def __init__(self):
+        super().__init__(keep_last=100, max_chats=100)
+        self.batches = []
+    
+    def apply(self, operations):
+        self.batches.append(len(operations))
+        super().apply(operations)
+
+
+def test_sqlite_uses_wal_and_survives_reopen(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    backend = SQLiteHistoryBackend(db_path, keep_last=100)
+    backend.apply([('append', 1, turn(1)), ('append', 1, turn(2)), ('append', 2, turn(3))])
+    backend.close()
+    
+    reopened = SQLiteHistoryBackend(db_path, keep_last=100)
+    
+    assert reopened.connection.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert [message["content"] for message in reopened.load(1, limit=3)] == ["ответ 1", "вопрос 2", "ответ 2"]
+    reopened.apply([('clear', 1, [])])
+    assert reopened.load(1, limit=10) == []
+    assert len(reopened.load(2, limit=10)) == 2
+    reopened.close()
+
+
+def test_sqlite_keeps_only_last_messages_of_chat(tmp_path):
+    backend = SQLiteHistoryBackend(str(tmp_path / "history.db"), keep_last=3)
+    backend.apply([('append', 1, turn(1)), ('append', 2, turn(1))])
+    backend.apply([('append', 1, turn(2) + turn(3))])
+    
+    rows = backend.connection.execute("SELECT chat_id, content FROM messages ORDER BY id").fetchall()
+    backend.close()
+    
+    assert rows == [(2, "вопрос 1"), (2, "ответ 1"), (1, "ответ 2"), (1, "вопрос 3"), (1, "ответ 3")]
+
+
+def test_memory_backend_limits():
+    backend = MemoryHistoryBackend(keep_last=3, max_chats=2)
+    backend.apply([('append', 1, turn(1) + turn(2)), ('append', 2, turn(1)), ('append', 3, turn(1))])
+    
+    assert backend.load(1, limit=10) == []
+    assert len(backend.load(2, limit=10)) == 2
+    assert len(backend.load(3, limit=10)) == 2
+
+
+def test_appends_are_batched_in_background():
+    backend = CountingBackend()
+    
+    async def scenario():
+        history = PersistentHistory(backend, flush_interval=0.05, batch_size=100)
+        history.start()
+        for number in range(10):
+            history.append(number, turn(number))
+        await history.stop()
+    
+    asyncio.run(scenario())
+    
+    assert backend.batches == [10]
+    assert len(backend.messages) == 10
+
+
+def test_load_waits_for_pending_writes_of_chat():
+    backend = CountingBackend()
+    
+    async def scenario():
+        history = PersistentHistory(backend, flush_interval=0.05, batch_size=100)
+        history.start()
+        history.append(1, turn(1))
+        history.clear(1)
+        history.append(1, turn(2))
+        loaded = await history.load(1, limit=10)
+        await history.stop()
+        return loaded
+    
+    loaded = asyncio.run(scenario())
+    
+    assert [message["content"] for message in loaded] == ["вопрос 2", "ответ 2"]
+
+
+def test_concurrent_first_loads_copy_history_once(monkeypatch):
+    monkeypatch.setenv('HISTORY_BACKEND', 'memory')
+    
+    async def scenario():
+        services = BotServices(lambda chat_id, messages: None, read_config())
+        services.persistent_history.backend.apply([('append', 1, turn(1))])
+        return await asyncio.gather(services.load_history(1), services.load_history(1))
+    
+    first, second = asyncio.run(scenario())
+    
+    assert [message["content"] for message in first] == ["вопрос 1", "ответ 1"]
+    assert second == first
@@ -0,0 +1,83 @@
+"""
+Тесты фонового извлечения контактов: правила, пакетный запрос к LLM и хранилище.
+"""
+import sys
+import os
+import json
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from lead_extraction import LeadExtractor, LeadStore, extract_contacts, parse_extraction
+
+
+def test_rules_find_phone_email_name_and_company():
+    found = extract_contacts("Меня зовут Иван, пишите на Ivan.Petrov@Example.ru или звоните 8 (912) 345-67-89. Мы ООО «Ромашка»")
+
+    assert found == {
+        'name': "Иван",
+        'company': "ООО «Ромашка»",
+        'phone': "+79123456789",
+        'email': "ivan.petrov@example.ru"
+    }
+    assert extract_contacts("Сколько стоит сайт на 10 страниц?") == {}
+
+
+def test_store_keeps_known_fields_when_new_ones_are_empty(tmp_path):
+    store = LeadStore(str(tmp_path / "leads.db"))
+    store.upsert({1: {'user_id': 10, 'phone': "+79123456789"}})
+    store.upsert({1: {'user_id': 10, 'email': "a@b.ru"}})
+
+    assert store.get(1) == {'user_id': 10, 'name': None, 'company': None, 'phone': "+79123456789", 'email': "a@b.ru"}
+    store.close()
+
+
+def test_llm_pass_is_one_request_per_batch_and_only_for_unresolved_chats(tmp_path):
+    requests = []
+
+    async def complete(messages):
+        requests.append(messages[-1]["content"])
+        return "```json\n" + json.dumps([
+            {"chat_id": 1, "name": "Анна", "company": "Вектор", "phone": None, "email": None},
+            {"chat_id": 2, "name": "Петр", "company": None, "phone": "8 900 000 00 00", "email": None},
+            {"chat_id": 99, "name": "Чужой"}
+        ], ensure_ascii=False) + "\n```"
+
+    async def scenario():
+        extractor = LeadExtractor(LeadStore(str(tmp_path / "leads.db")), batch_interval=0.01,
+                                  batch_size=10, complete=complete)
+        extractor.start()
+        extractor.submit(1, 11, "Анна", context="Как вас зовут и из какой вы компании?")
+        extractor.submit(1, 11, "Компания Вектор")
+        extractor.submit(2, 12, "Я Петр, работаю сам на себя, телефон +7 900 111-22-33")
+        extractor.submit(3, 13, "Сколько стоит сайт?")
+        await asyncio.sleep(0.2)
+        leads = {chat_id: extractor.store.get(chat_id) for chat_id in (1, 2, 3, 99)}
+        await extractor.stop()
+        return leads
+
+    leads = asyncio.run(scenario())
+
+    assert len(requests) == 1
+    assert "Чат 1:" in requests[0] and "Чат 2:" in requests[0] and "Чат 3:" not in requests[0]
+    assert leads[1] == {'user_id': 11, 'name': "Анна", 'company': "Вектор", 'phone': None, 'email': None}
+    # Телефон, найденный правилами, важнее ответа модели
+    assert leads[2]['phone'] == "+79001112233"
+    assert leads[2]['name'] == "Петр"
+    assert leads[3] is None and leads[99] is None
+
+
+def test_stop_processes_pending_messages(tmp_path):
+    async def scenario():
+        extractor = LeadExtractor(LeadStore(str(tmp_path / "leads.db")), batch_interval=60, batch_size=10)
+        extractor.start()
+        extractor.submit(1, 10, "почта client@mail.ru")
+        await extractor.stop()
+
+    asyncio.run(scenario())
+
+    assert LeadStore(str(tmp_path / "leads.db")).get(1)['email'] == "client@mail.ru"
+
+
+def test_unparsable_llm_answer_is_ignored():
+    assert parse_extraction("Не удалось разобрать") == []
+    assert parse_extraction('[{"chat_id": "5", "name": "Олег"}, "мусор"]') == [{"chat_id": 5, "name": "Олег"}]
@@ -0,0 +1,82 @@
+"""
+Тесты асинхронного транспорта LLMClient против локальной заглушки OpenRouter.
+"""
+import sys
+import os
+import time
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fake_openrouter import run_fake_openrouter
+
+
+def make_client(monkeypatch, base_url: str, **env):
+    """Создает LLMClient, направленный на заглушку."""
+    monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+    monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+    monkeypatch.setenv('OPENROUTER_API_URL', base_url)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    from llm_client import LLMClient
+    return LLMClient()
+
+
+def test_ask_returns_answer_and_sends_history(monkeypatch):
+    async def scenario():
+        async with run_fake_openrouter(answer="Привет!") as server:
+            client = make_client(monkeypatch, server.base_url)
+            history = [{"role": "user", "content": "раз"}, {"role": "assistant", "content": "два"}]
+            answer = await client.ask("три", history)
+            await client.close()
+            return answer, server.requests
+            
+    answer, requests = asyncio.run(scenario())
+    
+    assert answer == "Привет!"
+    messages = requests[0]["messages"]
+    assert messages[0]["role"] == "system"
+    assert messages[-1] == {"role": "user", "content": "три"}
+    assert messages[1:3] == [{"role": "user", "content": "раз"}, {"role": "assistant", "content": "два"}]
+
+
+def test_concurrent_requests_do_not_block_each_other(monkeypatch):
+    async def scenario():
+        async with run_fake_openrouter(latency=0.3) as server:
+            client = make_client(monkeypatch, server.base_url, LLM_MAX_CONCURRENCY='10')
+            started = time.perf_counter()
+            answers = await asyncio.gather(*(client.ask(f"вопрос {i}") for i in range(10)))
+            elapsed = time.perf_counter() - started
+            await client.close()
+            return answers, elapsed
+            
+    answers, elapsed = asyncio.run(scenario())
+    
+    assert all(answers)
+    # 10 запросов по 0.3 с последовательно заняли бы 3 с
+    assert elapsed < 1.0
+
+
+def test_concurrency_limit_is_respected(monkeypatch):
+    async def scenario():
+        async with run_fake_openrouter(latency=0.2) as server:
+            client = make_client(monkeypatch, server.base_url, LLM_MAX_CONCURRENCY='2')
+            started = time.perf_counter()
+            await asyncio.gather(*(client.ask("вопрос") for _ in range(4)))
+            elapsed = time.perf_counter() - started
+            await client.close()
+            return elapsed
+            
+    # 4 запроса при лимите 2 выполняются в две волны
+    assert asyncio.run(scenario()) >= 0.4
+
+
+def test_timeout_returns_none(monkeypatch):
+    async def scenario():
+        async with run_fake_openrouter(latency=0.5) as server:
+            client = make_client(monkeypatch, server.base_url, LLM_REQUEST_TIMEOUT='0.1')
+            answer = await client.ask("вопрос")
+            await client.close()
+            return answer
+            
+    assert asyncio.run(scenario()) is None
@@ -0,0 +1,44 @@
+"""
+Тест нагрузочного теста: сценарий smoke проходит целиком и сохраняет JSON результат.
+"""
+import sys
+import os
+import json
+import subprocess
+
+LOAD_TEST = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'load_test.py')
+
+
+def run_load_test(*arguments):
+    # Отдельный процесс: обработчики читают настройки из окружения один раз при импорте
+    return subprocess.run([sys.executable, LOAD_TEST, '--population', 'smoke', '--llm-latency', '0.01', *arguments],
+                          capture_output=True, text=True, timeout=120)
+
+
+def test_smoke_population_reports_and_compares(tmp_path):
+    first = tmp_path / 'first.json'
+    second = tmp_path / 'second.json'
+    
+    completed = run_load_test('--output', str(first))
+    assert completed.returncode == 0, completed.stderr
+    
+    result = json.loads(first.read_text(encoding='utf-8'))
+    assert result['population'] == 'smoke'
+    assert result['results']['messages'] == 6
+    assert result['results']['outcomes'] == {'ok': 6, 'error': 0, 'shed': 0, 'timeout': 0}
+    assert set(result['results']['latency_s']) == {'p50', 'p95', 'p99', 'max'}
+    assert result['results']['chat_history'] == {'chats': 3, 'messages': 12}
+    
+    completed = run_load_test('--output', str(second), '--compare', str(first))
+    assert completed.returncode == 0, completed.stderr
+    assert "latency_s.p99" in completed.stdout
+
+
+def test_injected_llm_errors_are_counted(tmp_path):
+    output = tmp_path / 'errors.json'
+    
+    completed = run_load_test('--error-rate', '1', '--output', str(output))
+    assert completed.returncode == 0, completed.stderr
+    
+    outcomes = json.loads(output.read_text(encoding='utf-8'))['results']['outcomes']
+    assert outcomes == {'ok': 0, 'error': 6, 'shed': 0, 'timeout': 0}
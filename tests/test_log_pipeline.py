@@ -0,0 +1,107 @@
+"""
+Тесты логирования через очередь.
+"""
+import sys
+import os
+import json
+import logging
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from log_pipeline import BodyFilter, JsonFormatter, setup_logging
+
+
+def make_record(body=None, **fields) -> logging.LogRecord:
+    record = logging.LogRecord("handlers", logging.INFO, __file__, 1, "Пользователь %s отправил сообщение", (42,), None)
+    if body is not None:
+        record.body = body
+    for name, value in fields.items():
+        setattr(record, name, value)
+    return record
+
+
+def make_config(log_file: str, **overrides) -> dict:
+    config = {
+        'LOG_FILE': log_file,
+        'LOG_LEVEL': 'INFO',
+        'LOG_FORMAT': 'json',
+        'LOG_ROTATION': 'size',
+        'LOG_MAX_BYTES': 10 * 1024 * 1024,
+        'LOG_ROTATE_WHEN': 'midnight',
+        'LOG_BACKUP_COUNT': 2,
+        'LOG_BODIES': 'full',
+        'LOG_BODY_MAX_CHARS': 100,
+        'LOG_BODY_SAMPLE_RATE': 1.0
+    }
+    config.update(overrides)
+    return config
+
+
+def run_with_pipeline(config: dict, emit):
+    """Подключает очередь логирования, вызывает emit и возвращает корневой логгер в исходное состояние."""
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    listener = setup_logging(config, console=False)
+    try:
+        emit()
+    finally:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in saved_handlers:
+            root.addHandler(handler)
+        root.setLevel(saved_level)
+
+
+def test_json_record_contains_context_fields():
+    record = make_record(body="Привет", chat_id=10, user_id=42, latency_ms=120)
+    
+    entry = json.loads(JsonFormatter().format(record))
+    
+    assert entry['message'] == "Пользователь 42 отправил сообщение"
+    assert entry['chat_id'] == 10
+    assert entry['latency_ms'] == 120
+    assert entry['body'] == "Привет"
+
+
+def test_body_truncate_redact_and_sampling():
+    truncated = make_record(body="x" * 50)
+    BodyFilter('truncate', max_chars=10, sample_rate=1.0).filter(truncated)
+    redacted = make_record(body="секретный телефон +79991234567")
+    BodyFilter('redact', max_chars=10, sample_rate=1.0).filter(redacted)
+    sampled_out = make_record(body="текст")
+    BodyFilter('full', max_chars=10, sample_rate=0.0).filter(sampled_out)
+    
+    assert truncated.body == "x" * 10 + "..."
+    assert "79991234567" not in redacted.body
+    assert redacted.body.startswith("<30 символов")
+    assert sampled_out.body is None
+
+
+def test_queue_pipeline_writes_json_lines(tmp_path):
+    log_file = str(tmp_path / "bot.log")
+    
+    def emit():
+        logging.getLogger("handlers").info("Пользователь %s отправил сообщение", 42,
+                                           extra={'chat_id': 10, 'body': "Сколько стоит сайт?"})
+        
+    run_with_pipeline(make_config(log_file, LOG_BODIES='redact'), emit)
+    
+    with open(log_file, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    assert entries[-1]['chat_id'] == 10
+    assert entries[-1]['message'] == "Пользователь 42 отправил сообщение"
+    assert "Сколько стоит" not in entries[-1]['body']
+
+
+def test_size_rotation(tmp_path):
+    log_file = str(tmp_path / "bot.log")
+    
+    def emit():
+        for number in range(200):
+            logging.getLogger("handlers").info("Запись %s %s", number, "x" * 100)
+            
+    run_with_pipeline(make_config(log_file, LOG_MAX_BYTES=2000), emit)
+    
+    assert sorted(os.listdir(tmp_path)) == ["bot.log", "bot.log.1", "bot.log.2"]
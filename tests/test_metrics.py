@@ -0,0 +1,85 @@
+"""
+Тесты метрик и эндпоинта /metrics.
+"""
+import sys
+import os
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from fake_openrouter import run_fake_openrouter
+from metrics import LLM_TOKENS, MetricsRegistry, create_metrics_app
+
+
+def test_histogram_counter_and_gauge_rendering():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Задержка", ["mode"], buckets=(0.1, 1.0))
+    errors = registry.counter("errors", "Ошибки", ["kind"])
+    registry.gauge("active_chats", "Активные чаты", lambda: 3)
+    
+    latency.labels("complete").observe(0.05)
+    latency.labels("complete").observe(0.5)
+    latency.labels("complete").observe(5)
+    errors.labels("llm").inc()
+    errors.labels("llm").inc()
+    
+    text = registry.render()
+    
+    assert '# TYPE latency_seconds histogram' in text
+    assert 'latency_seconds_bucket{mode="complete",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{mode="complete",le="1"} 2' in text
+    assert 'latency_seconds_bucket{mode="complete",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{mode="complete"} 3' in text
+    assert 'errors_total{kind="llm"} 2' in text
+    assert 'active_chats 3' in text
+
+
+def test_failing_gauge_does_not_break_scrape():
+    registry = MetricsRegistry()
+    registry.gauge("broken", "Сломанная метрика", lambda: 1 / 0)
+    registry.gauge("working", "Рабочая метрика", lambda: 7)
+    
+    text = registry.render()
+    
+    assert 'broken NaN' in text
+    assert 'working 7' in text
+
+
+def test_metrics_endpoint():
+    registry = MetricsRegistry()
+    registry.counter("requests", "Запросы").inc(5)
+    
+    async def scenario():
+        async with TestClient(TestServer(create_metrics_app(registry))) as client:
+            response = await client.get('/metrics')
+            return response.status, response.content_type, await response.text()
+            
+    status, content_type, text = asyncio.run(scenario())
+    
+    assert status == 200
+    assert content_type == "text/plain"
+    assert 'requests_total 5' in text
+
+
+def test_llm_client_records_usage_tokens(monkeypatch):
+    async def scenario():
+        async with run_fake_openrouter() as server:
+            monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+            monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+            monkeypatch.setenv('OPENROUTER_API_URL', server.base_url)
+            from llm_client import LLMClient
+            client = LLMClient()
+            await client.ask("вопрос")
+            async for _ in client.ask_stream("вопрос"):
+                pass
+            await client.close()
+            
+    prompt_before = LLM_TOKENS.labels("prompt").value
+    completion_before = LLM_TOKENS.labels("completion").value
+    asyncio.run(scenario())
+    
+    # Заглушка отвечает usage 10 + 5 токенов и на обычный, и на потоковый запрос
+    assert LLM_TOKENS.labels("prompt").value - prompt_before == 20
+    assert LLM_TOKENS.labels("completion").value - completion_before == 10
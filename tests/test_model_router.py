@@ -0,0 +1,138 @@
+"""
+Тесты пула моделей: переключение при ошибках, резервные запросы и автоматы отключения.
+"""
+import sys
+import os
+import time
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fake_openrouter import ModelFault, run_fake_openrouter
+from model_router import CircuitBreaker, ModelRouter, ModelsUnavailable
+
+
+def make_router(models, **overrides) -> ModelRouter:
+    options = {
+        'hedge_enabled': True,
+        'hedge_percentile': 0.95,
+        'hedge_min_delay': 0.01,
+        'hedge_max_delay': 0.05,
+        'window': 100,
+        'failure_threshold': 2,
+        'reset_timeout': 60
+    }
+    options.update(overrides)
+    return ModelRouter(models, **options)
+
+
+def test_circuit_breaker_opens_and_probes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    
+    time.sleep(0.06)
+    # После паузы пропускается ровно один пробный запрос
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_failover_to_next_model_on_error():
+    calls = []
+    
+    async def request(model):
+        calls.append(model)
+        if model == "primary":
+            raise RuntimeError("502")
+        return f"ответ {model}"
+        
+    router = make_router(["primary", "backup"], hedge_enabled=False)
+    result = asyncio.run(router.run(request))
+    
+    assert result == "ответ backup"
+    assert calls == ["primary", "backup"]
+    assert router.stats["primary"].error_rate == 1.0
+
+
+def test_slow_primary_is_hedged():
+    cancelled = []
+    
+    async def request(model):
+        try:
+            await asyncio.sleep(1.0 if model == "primary" else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        return f"ответ {model}"
+    
+    async def scenario():
+        started = time.perf_counter()
+        result = await router.run(request)
+        return result, time.perf_counter() - started
+        
+    router = make_router(["primary", "backup"])
+    result, elapsed = asyncio.run(scenario())
+    
+    assert result == "ответ backup"
+    assert elapsed < 0.5
+    assert cancelled == ["primary"]
+    assert router.hedged_requests == 1
+    # Отмененный запрос не считается ошибкой модели
+    assert router.breakers["primary"].failures == 0
+
+
+def test_open_breaker_skips_model_and_all_failed_raises():
+    calls = []
+    
+    async def request(model):
+        calls.append(model)
+        raise RuntimeError("502")
+    
+    async def scenario():
+        for _ in range(2):
+            try:
+                await router.run(request)
+            except ModelsUnavailable:
+                pass
+        calls.clear()
+        try:
+            await router.run(request)
+        except ModelsUnavailable:
+            return True
+        return False
+        
+    router = make_router(["primary", "backup"], hedge_enabled=False)
+    raised = asyncio.run(scenario())
+    
+    assert raised
+    assert calls == []
+    assert router.snapshot()["primary"]["state"] == 'open'
+
+
+def test_llm_client_falls_back_on_failing_model(monkeypatch):
+    async def scenario():
+        faults = {"broken/model": ModelFault(error_rate=1.0)}
+        async with run_fake_openrouter(faults=faults) as server:
+            monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+            monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+            monkeypatch.setenv('OPENROUTER_API_URL', server.base_url)
+            monkeypatch.setenv('LLM_MODEL_NAME', 'broken/model')
+            monkeypatch.setenv('LLM_FALLBACK_MODELS', 'backup/model')
+            from llm_client import LLMClient
+            client = LLMClient()
+            answer = await client.ask("вопрос")
+            chunks = [chunk async for chunk in client.ask_stream("вопрос")]
+            await client.close()
+            return answer, "".join(chunks), [request["model"] for request in server.requests]
+            
+    answer, streamed, models = asyncio.run(scenario())
+    
+    assert answer == "Ответ заглушки"
+    assert streamed == "Ответ заглушки"
+    assert models == ["broken/model", "backup/model", "broken/model", "backup/model"]
@@ -0,0 +1,108 @@
+"""
+Тесты постоянного префикса запроса: перечитывание промта, хеш и отметка для кеширования.
+"""
+import sys
+import os
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from context_builder import build_context
+from fake_openrouter import run_fake_openrouter
+from prompt_prefix import DEFAULT_SYSTEM_PROMPT, PromptPrefix, supports_cache_control
+
+
+def rewrite(path, text: str):
+    path.write_text(text, encoding='utf-8')
+    # Время изменения файла может совпасть с прежним на грубых файловых системах
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+
+
+def test_changed_file_is_reloaded_with_new_hash(tmp_path):
+    path = tmp_path / "prompt.md"
+    path.write_text("Первый промт", encoding='utf-8')
+    prefix = PromptPrefix(str(path), reload_interval=0.001)
+    first_hash = prefix.hash
+    first_message = prefix.message
+
+    prefix.refresh()
+    assert prefix.message is first_message
+
+    rewrite(path, "Второй промт")
+    prefix._checked_at = 0.0
+    prefix.refresh()
+
+    assert prefix.text == "Второй промт"
+    assert prefix.hash != first_hash
+    assert prefix.message == {"role": "system", "content": "Второй промт"}
+    assert prefix.reloads == 1
+
+
+def test_missing_file_keeps_last_prompt(tmp_path):
+    path = tmp_path / "prompt.md"
+    path.write_text("Рабочий промт", encoding='utf-8')
+    prefix = PromptPrefix(str(path), reload_interval=0.001)
+
+    path.unlink()
+    prefix._checked_at = 0.0
+    prefix.refresh()
+
+    assert prefix.text == "Рабочий промт"
+    assert PromptPrefix(str(path), reload_interval=0).text == DEFAULT_SYSTEM_PROMPT
+
+
+def test_cache_control_only_for_models_that_need_it(tmp_path):
+    path = tmp_path / "prompt.md"
+    path.write_text("Промт", encoding='utf-8')
+    prefix = PromptPrefix(str(path), reload_interval=0)
+    messages = [prefix.message, {"role": "user", "content": "вопрос"}]
+
+    marked = prefix.for_model("anthropic/claude-3.5-haiku", messages)
+    assert marked[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert marked[1:] == messages[1:]
+    assert prefix.for_model("openai/gpt-4o-mini", messages) is messages
+
+    assert supports_cache_control("openai/gpt-4o-mini", "on")
+    assert not supports_cache_control("anthropic/claude-3.5-haiku", "off")
+
+
+def test_build_context_reuses_system_message():
+    system_message = {"role": "system", "content": "Промт"}
+
+    context = build_context(system_message, [], "вопрос", token_budget=1000, max_turns=5)
+
+    assert context.messages[0] is system_message
+    assert context.prompt_tokens == build_context("Промт", [], "вопрос", 1000, 5).prompt_tokens
+
+
+def test_client_picks_up_prompt_change_and_marks_prefix(monkeypatch, tmp_path):
+    path = tmp_path / "prompt.md"
+    path.write_text("Старый промт", encoding='utf-8')
+
+    async def scenario():
+        async with run_fake_openrouter() as server:
+            monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+            monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+            monkeypatch.setenv('OPENROUTER_API_URL', server.base_url)
+            monkeypatch.setenv('LLM_MODEL_NAME', 'anthropic/claude-3.5-haiku')
+            monkeypatch.setenv('SYSTEM_PROMPT_PATH', str(path))
+            monkeypatch.setenv('SYSTEM_PROMPT_RELOAD_INTERVAL', '0.001')
+            from llm_client import LLMClient
+            client = LLMClient()
+
+            await client.ask("вопрос", use_cache=True)
+            old_hash = client.system_prompt_hash
+            rewrite(path, "Новый промт")
+            await asyncio.sleep(0.01)
+            # Ответ из кеша для старого промта не выдается: запрос снова уходит в API
+            await client.ask("вопрос", use_cache=True)
+            await client.close()
+            return server.requests, old_hash, client.system_prompt_hash
+
+    requests, old_hash, new_hash = asyncio.run(scenario())
+
+    assert len(requests) == 2
+    assert old_hash != new_hash
+    assert [request["messages"][0]["content"][0]["text"] for request in requests] == ["Старый промт", "Новый промт"]
+    assert requests[1]["messages"][0]["content"][0]["cache_control"] == {"type": "ephemeral"}
@@ -0,0 +1,148 @@
+"""
+Тесты кеша ответов LLM.
+"""
+import sys
+import os
+import time
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fake_openrouter import run_fake_openrouter
+from response_cache import ResponseCache, make_cache_key, normalize_text
+
+
+def make_cache(**overrides) -> ResponseCache:
+    options = {'max_entries': 10, 'ttl_seconds': 3600, 'pool_size': 1, 'refresh_after': 3600}
+    options.update(overrides)
+    return ResponseCache(**options)
+
+
+def test_normalized_questions_share_key():
+    first = make_cache_key("model", "hash", [{"role": "user", "content": "Какие услуги вы предлагаете?"}])
+    second = make_cache_key("model", "hash", [{"role": "user", "content": "  какие УСЛУГИ вы   предлагаете"}])
+    other_prompt = make_cache_key("model", "other", [{"role": "user", "content": "Какие услуги вы предлагаете?"}])
+    
+    assert normalize_text("Ещё, раз!") == "еще раз"
+    assert first == second
+    assert first != other_prompt
+
+
+def test_hit_miss_and_hit_rate():
+    cache = make_cache()
+    
+    assert cache.get("key") is None
+    cache.add("key", "ответ")
+    assert cache.get("key") == "ответ"
+    assert cache.stats()['hit_rate'] == 0.5
+
+
+def test_lru_eviction():
+    cache = make_cache(max_entries=2)
+    cache.add("a", "1")
+    cache.add("b", "2")
+    cache.get("a")
+    cache.add("c", "3")
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl_expiry():
+    cache = make_cache(ttl_seconds=0.05)
+    cache.add("key", "ответ")
+    time.sleep(0.1)
+    
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_variant_pool_fills_and_replaces_oldest():
+    cache = make_cache(pool_size=2)
+    cache.add("key", "первый")
+    assert cache.needs_refresh("key")
+    
+    cache.add("key", "второй")
+    assert not cache.needs_refresh("key")
+    
+    cache.add("key", "третий")
+    variants = {cache.get("key") for _ in range(50)}
+    assert variants == {"второй", "третий"}
+    assert cache.stats()['refreshes'] == 1
+
+
+def test_llm_client_serves_repeated_question_from_cache(monkeypatch):
+    async def scenario():
+        async with run_fake_openrouter(answer="Мы разрабатываем сайты") as server:
+            monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+            monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+            monkeypatch.setenv('OPENROUTER_API_URL', server.base_url)
+            monkeypatch.setenv('LLM_CACHE_VARIANTS', '1')
+            from llm_client import LLMClient
+            client = LLMClient()
+            first = await client.ask("Какие услуги?", use_cache=True)
+            second = await client.ask("какие услуги", use_cache=True)
+            uncached = await client.ask("какие услуги")
+            await client.close()
+            return first, second, uncached, len(server.requests), client.response_cache.stats()
+    
+    first, second, uncached, requests, stats = asyncio.run(scenario())
+    
+    assert first == second == uncached == "Мы разрабатываем сайты"
+    assert requests == 2
+    assert stats['hits'] == 1
+
+
+def test_prefill_generates_variant_pool(monkeypatch):
+    async def scenario():
+        async with run_fake_openrouter() as server:
+            monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+            monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+            monkeypatch.setenv('OPENROUTER_API_URL', server.base_url)
+            monkeypatch.setenv('LLM_CACHE_VARIANTS', '3')
+            from llm_client import LLMClient
+            client = LLMClient()
+            client.prefill_cache("Приветствие")
+            await asyncio.gather(*client._background_tasks)
+            answer = await client.ask("Приветствие", use_cache=True)
+            await client.close()
+            return answer, len(server.requests)
+    
+    answer, requests = asyncio.run(scenario())
+    
+    assert answer == "Ответ заглушки"
+    assert requests == 3
+
+
+def test_prefill_goes_through_admission_and_yields_to_users(monkeypatch):
+    async def scenario():
+        async with run_fake_openrouter() as server:
+            monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+            monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+            monkeypatch.setenv('OPENROUTER_API_URL', server.base_url)
+            monkeypatch.setenv('HISTORY_BACKEND', 'memory')
+            monkeypatch.setenv('LLM_CACHE_VARIANTS', '3')
+            monkeypatch.setenv('ADMISSION_MAX_ACTIVE', '1')
+            from config import read_config
+            from services import BotServices
+            services = BotServices(lambda chat_id, messages: None, read_config())
+            client = services.llm_client
+            
+            # Единственное место занято ответом пользователю - приветствия не генерируются
+            await services.admission.acquire(42)
+            client.prefill_cache("Приветствие")
+            await asyncio.gather(*client._background_tasks)
+            busy_requests = len(server.requests)
+            services.admission.release(42)
+            
+            client.prefill_cache("Приветствие")
+            await asyncio.gather(*client._background_tasks)
+            await client.close()
+            return busy_requests, len(server.requests), services.admission.active
+    
+    busy_requests, requests, active = asyncio.run(scenario())
+    
+    assert busy_requests == 0
+    assert requests == 3
+    assert active == 0
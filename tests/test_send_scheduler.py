@@ -0,0 +1,242 @@
+"""
+Тесты планировщика исходящих запросов к Telegram: лимиты, приоритеты, объединение правок и 429.
+"""
+import sys
+import os
+import time
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from send_scheduler import PRIORITY_ANSWER, PRIORITY_PLACEHOLDER, SendScheduler
+
+
+class FakeChat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+
+
+class FakeMessage:
+    """Сообщение Telegram, записывающее запросы в общий журнал."""
+    
+    def __init__(self, log: list, chat_id: int = 1, message_id: int = 1, text: str = ""):
+        self.log = log
+        self.chat = FakeChat(chat_id)
+        self.message_id = message_id
+        self.text = text
+    
+    async def reply(self, text: str):
+        self.log.append(('reply', self.chat.id, text))
+        return FakeMessage(self.log, self.chat.id, len(self.log) + 100, text)
+    
+    async def edit_text(self, text: str):
+        self.log.append(('edit', self.chat.id, text))
+    
+    async def delete(self):
+        self.log.append(('delete', self.chat.id, self.text))
+
+
+def make_scheduler(**options) -> SendScheduler:
+    settings = {'global_rate': 1000, 'chat_rate': 1000, 'chat_burst': 1, 'max_retries': 3}
+    settings.update(options)
+    return SendScheduler(**settings)
+
+
+def test_answer_overtakes_queued_placeholder():
+    log = []
+    
+    async def scenario():
+        scheduler = make_scheduler(chat_rate=20)
+        message = FakeMessage(log)
+        # Первый запрос забирает токен чата, остальные ждут в очереди
+        first = scheduler.reply(message, "первый")
+        placeholder = scheduler.reply(message, "Думаю...", PRIORITY_PLACEHOLDER)
+        answer = scheduler.reply(message, "ответ", PRIORITY_ANSWER)
+        await asyncio.gather(first, placeholder, answer)
+        await scheduler.close()
+    
+    asyncio.run(scenario())
+    
+    assert [text for _, _, text in log] == ["первый", "ответ", "Думаю..."]
+
+
+def test_placeholder_of_new_chat_does_not_wait_for_busy_chats():
+    log = []
+    
+    async def scenario():
+        # Узкое место - общий лимит бота: занятые чаты не должны забрать все его токены
+        scheduler = make_scheduler(global_rate=100, chat_burst=100)
+        answers = [scheduler.reply(FakeMessage(log, chat_id), f"ответ {number}")
+                   for number in range(10) for chat_id in (1, 2, 3)]
+        placeholder = scheduler.reply(FakeMessage(log, 4), "Думаю...", PRIORITY_PLACEHOLDER)
+        await asyncio.gather(placeholder, *answers)
+        await scheduler.close()
+    
+    asyncio.run(scenario())
+    
+    assert len(log) == 31
+    # Чаты обслуживаются по кругу: "Думаю..." нового чата уходит в первом же круге
+    assert log.index(('reply', 4, "Думаю...")) < 4
+    assert [text for _, chat_id, text in log if chat_id == 1] == [f"ответ {number}" for number in range(10)]
+
+
+def test_cancelled_placeholder_is_not_sent():
+    log = []
+    
+    async def scenario():
+        scheduler = make_scheduler(chat_rate=20)
+        message = FakeMessage(log)
+        busy = scheduler.reply(message, "первый")
+        placeholder = scheduler.reply(message, "Думаю...", PRIORITY_PLACEHOLDER)
+        cancelled = scheduler.cancel(placeholder)
+        await busy
+        await scheduler.close()
+        return cancelled, await placeholder, scheduler.queued
+    
+    cancelled, result, queued = asyncio.run(scenario())
+    
+    assert cancelled is True
+    assert result is None
+    assert queued == 0
+    assert log == [('reply', 1, "первый")]
+
+
+def test_queued_edits_of_one_message_are_coalesced():
+    log = []
+    
+    async def scenario():
+        scheduler = make_scheduler(chat_rate=20)
+        message = FakeMessage(log, message_id=7)
+        scheduler.reply(message, "первый")
+        jobs = [scheduler.edit(message, text) for text in ("а", "аб", "абв")]
+        await asyncio.gather(*jobs)
+        await scheduler.close()
+        return jobs, scheduler.coalesced_edits
+    
+    jobs, coalesced = asyncio.run(scenario())
+    
+    assert jobs[0] is jobs[1] is jobs[2]
+    assert coalesced == 2
+    assert log == [('reply', 1, "первый"), ('edit', 1, "абв")]
+
+
+def test_chat_rate_limits_sends_but_not_other_chats():
+    log = []
+    sent_at = {}
+    
+    async def scenario():
+        scheduler = make_scheduler(chat_rate=10)
+        started = time.monotonic()
+        
+        async def send(chat_id):
+            await scheduler.reply(FakeMessage(log, chat_id), "текст")
+            sent_at.setdefault(chat_id, []).append(time.monotonic() - started)
+        
+        await asyncio.gather(*(send(1) for _ in range(4)), send(2))
+        await scheduler.close()
+    
+    asyncio.run(scenario())
+    
+    # 4 запроса в чат 1 при 10 в секунду занимают не меньше 0.3 с, чат 2 не ждет
+    assert max(sent_at[1]) >= 0.29
+    assert sent_at[2][0] < 0.1
+
+
+def test_retry_after_pauses_and_retries():
+    attempts = []
+    
+    async def scenario():
+        scheduler = make_scheduler()
+        
+        async def flaky_send():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=0.2)
+            return "отправлено"
+        
+        result = await scheduler.submit(1, flaky_send)
+        await scheduler.close()
+        return result, scheduler.retried
+    
+    result, retried = asyncio.run(scenario())
+    
+    assert result == "отправлено"
+    assert retried == 1
+    assert attempts[1] - attempts[0] >= 0.19
+
+
+class RateLimitedMessage(FakeMessage):
+    """Сообщение, первая правка которого получает 429."""
+    
+    def __init__(self, log: list, edit_started: asyncio.Event = None):
+        super().__init__(log)
+        self.edit_started = edit_started
+        self.edits = 0
+    
+    async def edit_text(self, text: str):
+        self.edits += 1
+        if self.edits == 1:
+            if self.edit_started is not None:
+                self.edit_started.set()
+                await asyncio.sleep(0.05)
+            raise TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=0.2)
+        await super().edit_text(text)
+
+
+def test_retried_edit_is_coalesced_with_newer_edits():
+    log = []
+    
+    async def scenario():
+        scheduler = make_scheduler()
+        message = RateLimitedMessage(log)
+        first = scheduler.edit(message, "раз")
+        await asyncio.sleep(0.05)
+        # Первая правка ждет конца паузы после 429, новые тексты заменяют ее текст
+        second = scheduler.edit(message, "раз два")
+        third = scheduler.edit(message, "раз два три")
+        await asyncio.gather(first, second, third)
+        await scheduler.close()
+        return scheduler.coalesced_edits
+    
+    coalesced = asyncio.run(scenario())
+    
+    assert log == [('edit', 1, "раз два три")]
+    assert coalesced == 2
+
+
+def test_edit_queued_during_retried_edit_replaces_it():
+    log = []
+    
+    async def scenario():
+        scheduler = make_scheduler()
+        edit_started = asyncio.Event()
+        message = RateLimitedMessage(log, edit_started)
+        first = scheduler.edit(message, "раз")
+        await edit_started.wait()
+        # Правка выполняется, поэтому новый текст встает в очередь отдельной правкой
+        second = scheduler.edit(message, "раз два")
+        await asyncio.gather(first, second)
+        await scheduler.close()
+    
+    asyncio.run(scenario())
+    
+    assert log == [('edit', 1, "раз два")]
+
+
+def test_idle_chats_are_forgotten_after_limit_recovers():
+    async def scenario():
+        scheduler = make_scheduler(chat_rate=20)
+        jobs = [scheduler.reply(FakeMessage([], chat_id), "привет") for chat_id in range(50)]
+        await asyncio.gather(*jobs)
+        remembered = len(scheduler._chats)
+        # Лимит чата восстанавливается за 1/20 секунды, после этого таймер удаляет чат
+        await asyncio.sleep(0.2)
+        forgotten = len(scheduler._chats)
+        await scheduler.close()
+        return remembered, forgotten
+    
+    remembered, forgotten = asyncio.run(scenario())
+    
+    assert remembered > 0
+    assert forgotten == 0
@@ -0,0 +1,111 @@
+"""
+Тесты запуска: импорт без секретов, разбор вывода -X importtime и кеш конфигурации.
+"""
+import sys
+import os
+import subprocess
+import pytest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from bench_startup import (clean_environment, measure_dispatcher, measure_import, parse_importtime,
+                           third_party_packages, top_packages)
+from config import get_config, read_config, validate_config
+
+# Модули, которым не нужен aiogram: их импортируют утилиты, бенчмарки и тесты
+LIGHT_MODULES = "config, metrics, admission, faq_index, lead_extraction, llm_client"
+
+# Сторонние пакеты, которые может импортировать запуск бота: aiogram с зависимостями,
+# необязательные ускорители aiohttp и пакеты, которые зависимости пробуют импортировать в try.
+# Новый пакет здесь - повод замерить запуск benchmarks/bench_startup.py, прежде чем расширять список
+STARTUP_PACKAGES = {
+    'aiogram', 'aiohttp', 'aiofiles', 'aiohappyeyeballs', 'aiosignal', 'attr', 'certifi', 'frozenlist',
+    'idna', 'magic_filter', 'multidict', 'propcache', 'yarl', 'pydantic', 'pydantic_core',
+    'annotated_types', 'typing_extensions', 'dotenv',
+    'aiodns', 'brotli', 'brotlicffi', 'uvloop',
+    'backports_abc', 'org',
+}
+
+
+def run_python(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, '-c', code], env=clean_environment(),
+                          capture_output=True, text=True)
+
+
+def test_parse_importtime_output():
+    records = parse_importtime(
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     pydantic.fields\n"
+        "import time:       500 |        620 |   pydantic\n"
+        "import time:        80 |        700 | config\n"
+    )
+
+    assert [record.module for record in records] == ['pydantic.fields', 'pydantic', 'config']
+    assert records[-1].cumulative == pytest.approx(0.0007)
+    assert top_packages(records, 1) == [('pydantic', pytest.approx(0.00062))]
+
+
+def test_handlers_import_needs_no_secrets_and_builds_no_clients():
+    result = run_python(
+        "import gc, handlers, llm_client\n"
+        "print(sum(isinstance(item, llm_client.LLMClient) for item in gc.get_objects()))"
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "0"
+
+
+def test_light_modules_import_fast_without_aiogram():
+    result = run_python(f"import sys, {LIGHT_MODULES}\nprint('aiogram' in sys.modules)")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "False"
+
+
+def test_bot_import_pulls_in_no_new_heavy_packages():
+    # Проверка без замера времени: тяжелый пакет в импорте бота виден по составу, а не по секундомеру
+    packages = third_party_packages(measure_import('bot'))
+
+    assert 'aiogram' in packages
+    assert packages <= STARTUP_PACKAGES, f"Новые пакеты при запуске: {sorted(packages - STARTUP_PACKAGES)}"
+
+
+def test_third_party_packages_skip_stdlib_and_own_modules():
+    records = parse_importtime(
+        "import time:       100 |        100 |   json.decoder\n"
+        "import time:        50 |         50 |   _distutils_hack\n"
+        "import time:       300 |        300 |     pydantic.fields\n"
+        "import time:        80 |        700 | config\n"
+    )
+
+    assert third_party_packages(records) == {'pydantic'}
+
+
+def test_dispatcher_is_created_in_clean_environment():
+    # Время импорта и создания диспетчера показывает benchmarks/bench_startup.py
+    timings = measure_dispatcher()
+
+    assert set(timings) == {'import', 'dispatcher'}
+
+
+def test_config_is_cached_until_environment_changes(monkeypatch):
+    first = get_config()
+    assert get_config() is first
+
+    monkeypatch.setenv('LLM_MAX_TOKENS', '123')
+    changed = get_config()
+
+    assert changed is not first
+    assert changed['LLM_MAX_TOKENS'] == 123
+    assert get_config() is changed
+
+
+def test_validation_is_deferred_to_startup(monkeypatch):
+    monkeypatch.delenv('TELEGRAM_BOT_TOKEN', raising=False)
+    monkeypatch.setenv('OPENROUTER_API_KEY', 'test')
+    config = read_config()
+
+    with pytest.raises(ValueError, match="TELEGRAM_BOT_TOKEN"):
+        validate_config(config)
+
+    monkeypatch.setenv('TELEGRAM_BOT_TOKEN', '123456:TEST')
+    validate_config(read_config())
@@ -0,0 +1,158 @@
+"""
+Тесты потокового вывода ответа LLM правками сообщения.
+"""
+import sys
+import os
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fake_openrouter import run_fake_openrouter
+from stream_reply import StreamingReply, split_message, stream_to_message
+
+
+class FakeMessage:
+    """Сообщение Telegram, запоминающее ответы и правки."""
+    
+    def __init__(self, text: str = ""):
+        self.text = text
+        self.edits = []
+        self.replies = []
+        self.deleted = False
+    
+    async def edit_text(self, text: str):
+        self.edits.append(text)
+        self.text = text
+    
+    async def reply(self, text: str):
+        message = FakeMessage(text)
+        self.replies.append(message)
+        return message
+    
+    async def delete(self):
+        self.deleted = True
+
+
+async def chunks_of(parts):
+    for part in parts:
+        yield part
+
+
+def test_split_message_prefers_word_boundary():
+    head, tail = split_message("раз два три четыре", 12)
+    assert head == "раз два три"
+    assert tail == "четыре"
+
+
+def test_split_message_hard_cut_without_spaces():
+    head, tail = split_message("а" * 25, 10)
+    assert head == "а" * 10
+    assert tail == "а" * 15
+
+
+def test_edits_are_coalesced_by_interval():
+    user_message = FakeMessage("вопрос")
+    placeholder = FakeMessage("Думаю...")
+    reply = StreamingReply(user_message, placeholder, edit_interval=60, max_length=4000)
+    
+    answer = asyncio.run(stream_to_message(chunks_of(["При", "вет", "!"]), reply))
+    
+    assert answer == "Привет!"
+    # Первая правка сразу, остальные объединены в финальную
+    assert placeholder.edits == ["При", "Привет!"]
+
+
+def test_long_answer_rolls_over_to_new_message():
+    user_message = FakeMessage("вопрос")
+    placeholder = FakeMessage("Думаю...")
+    reply = StreamingReply(user_message, placeholder, edit_interval=0, max_length=20)
+    words = [f"слово{i} " for i in range(8)]
+    
+    answer = asyncio.run(stream_to_message(chunks_of(words), reply))
+    
+    assert answer == "".join(words)
+    shown = [placeholder.text] + [message.text for message in user_message.replies]
+    assert all(len(text) <= 20 for text in shown)
+    assert " ".join(shown).split() == answer.split()
+
+
+def test_discard_deletes_every_message_of_rolled_over_answer():
+    user_message = FakeMessage("вопрос")
+    placeholder = FakeMessage("Думаю...")
+    reply = StreamingReply(user_message, placeholder, edit_interval=0, max_length=20)
+    
+    async def scenario():
+        for index in range(8):
+            await reply.push(f"слово{index} ")
+        await reply.discard()
+    
+    asyncio.run(scenario())
+    
+    assert len(user_message.replies) >= 2
+    assert placeholder.deleted
+    assert all(message.deleted for message in user_message.replies)
+
+
+def test_empty_stream_returns_empty_answer():
+    placeholder = FakeMessage("Думаю...")
+    reply = StreamingReply(FakeMessage(), placeholder, edit_interval=0, max_length=4000)
+    
+    assert asyncio.run(stream_to_message(chunks_of([]), reply)) == ""
+    assert placeholder.edits == []
+
+
+def test_ask_stream_yields_chunks_from_server(monkeypatch):
+    async def scenario():
+        async with run_fake_openrouter(answer="Добрый день, чем помочь?") as server:
+            monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+            monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+            monkeypatch.setenv('OPENROUTER_API_URL', server.base_url)
+            from llm_client import LLMClient
+            client = LLMClient()
+            chunks = [chunk async for chunk in client.ask_stream("Привет")]
+            await client.close()
+            return chunks, server.requests
+    
+    chunks, requests = asyncio.run(scenario())
+    
+    assert len(chunks) > 1
+    assert "".join(chunks) == "Добрый день, чем помочь?"
+    assert requests[0]["stream"] is True
+
+
+def test_abort_appends_error_note_to_shown_text():
+    placeholder = FakeMessage("Думаю...")
+    reply = StreamingReply(FakeMessage(), placeholder, edit_interval=60, max_length=4000)
+    
+    async def scenario():
+        await reply.push("Начало ответа")
+        await reply.abort("Ответ прерван.")
+    
+    asyncio.run(scenario())
+    
+    assert placeholder.text == "Начало ответа\n\nОтвет прерван."
+
+
+def test_ask_stream_raises_when_stream_breaks_after_first_chunk(monkeypatch):
+    async def scenario():
+        async with run_fake_openrouter(answer="Добрый день, чем помочь?", stream_cut_after=2) as server:
+            monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+            monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+            monkeypatch.setenv('OPENROUTER_API_URL', server.base_url)
+            from llm_client import LLMClient, StreamInterrupted
+            client = LLMClient()
+            chunks = []
+            try:
+                async for chunk in client.ask_stream("Привет"):
+                    chunks.append(chunk)
+            except StreamInterrupted:
+                interrupted = True
+            else:
+                interrupted = False
+            await client.close()
+            return chunks, interrupted
+    
+    chunks, interrupted = asyncio.run(scenario())
+    
+    assert interrupted
+    assert "".join(chunks) == "Добрый день,"
@@ -0,0 +1,137 @@
+"""
+Тесты многопроцессного режима: распределение по чатам, обработка и перезапуск процессов.
+"""
+import sys
+import os
+import time
+import signal
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fake_openrouter import run_fake_openrouter
+from fake_telegram import make_message_update, run_fake_telegram
+from supervisor import Supervisor, serve_supervisor
+from worker import shard_index, update_chat_id
+
+
+def set_worker_environment(monkeypatch, tmp_path, telegram_url: str, openrouter_url: str):
+    monkeypatch.setenv('TELEGRAM_BOT_TOKEN', '123456:TEST')
+    monkeypatch.setenv('OPENROUTER_API_KEY', 'test_api_key')
+    monkeypatch.setenv('TELEGRAM_API_URL', telegram_url)
+    monkeypatch.setenv('OPENROUTER_API_URL', openrouter_url)
+    monkeypatch.setenv('BOT_WORKERS', '2')
+    monkeypatch.setenv('CHAT_DEBOUNCE_SECONDS', '0')
+    monkeypatch.setenv('METRICS_ENABLED', 'false')
+    monkeypatch.setenv('LOG_FILE', str(tmp_path / 'bot.log'))
+    monkeypatch.setenv('WORKER_HEARTBEAT_INTERVAL', '0.1')
+
+
+async def wait_for(condition, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "условие не выполнилось за отведенное время"
+        await asyncio.sleep(0.05)
+
+
+def test_updates_of_one_chat_go_to_one_worker():
+    update = make_message_update(7, 1001, "привет")
+
+    assert update_chat_id(update) == 1001
+    assert shard_index(update, 4) == 1001 % 4
+    assert {shard_index(make_message_update(number, 1001, "еще"), 4) for number in range(10)} == {1001 % 4}
+    # Обновление без чата распределяется по update_id
+    assert shard_index({'update_id': 5, 'poll': {'id': 'x'}}, 4) == 1
+
+
+def test_workers_answer_all_chats_and_drain_on_stop(monkeypatch, tmp_path):
+    updates = [make_message_update(number, 100 + number, f"вопрос {number}") for number in range(8)]
+
+    async def scenario():
+        async with run_fake_openrouter() as llm, run_fake_telegram(updates) as telegram:
+            set_worker_environment(monkeypatch, tmp_path, telegram.base_url, llm.base_url)
+            from config import get_config
+            config = get_config()
+            supervisor = Supervisor(config, config['BOT_WORKERS'])
+            stop = asyncio.Event()
+            serving = asyncio.create_task(serve_supervisor(supervisor, config, stop))
+
+            await wait_for(lambda: len(telegram.answers) == len(updates))
+            stop.set()
+            await serving
+            return telegram.answers, supervisor.health()
+
+    answers, health = asyncio.run(scenario())
+
+    assert sorted(int(answer['chat_id']) for answer in answers) == list(range(100, 108))
+    assert all(answer['text'] == "Ответ заглушки" for answer in answers)
+    # Четные чаты достаются первому процессу, нечетные - второму
+    assert [worker['dispatched'] for worker in health['workers']] == [4, 4]
+    assert health['alive'] == 0
+
+
+def test_idle_worker_killed_in_queue_read_is_restarted_and_answers(monkeypatch, tmp_path):
+    async def scenario():
+        async with run_fake_openrouter() as llm, run_fake_telegram() as telegram:
+            set_worker_environment(monkeypatch, tmp_path, telegram.base_url, llm.base_url)
+            from config import get_config
+            supervisor = Supervisor(get_config(), 2)
+            supervisor.start()
+            monitor = asyncio.create_task(supervisor.monitor())
+            try:
+                # После ответа процесс простаивает в чтении очереди - его и убиваем
+                supervisor.dispatch(make_message_update(1, 100, "до перезапуска"))
+                await wait_for(lambda: len(telegram.answers) == 1)
+                await asyncio.sleep(0.3)
+                first_pid = supervisor.workers[0].process.pid
+                os.kill(first_pid, signal.SIGKILL)
+                await wait_for(lambda: supervisor.workers[0].restarts == 1)
+
+                # Чат 102 обслуживает тот же процесс, что и чат 100
+                supervisor.dispatch(make_message_update(2, 102, "после перезапуска"))
+                await wait_for(lambda: len(telegram.answers) == 2)
+                return first_pid, supervisor.workers[0].process.pid, telegram.answers
+            finally:
+                monitor.cancel()
+                await supervisor.stop()
+
+    first_pid, new_pid, answers = asyncio.run(scenario())
+
+    assert new_pid != first_pid
+    assert [int(answer['chat_id']) for answer in answers] == [100, 102]
+
+
+def test_hung_worker_is_replaced_and_gets_unconfirmed_updates(monkeypatch, tmp_path):
+    async def scenario():
+        async with run_fake_openrouter() as llm, run_fake_telegram() as telegram:
+            set_worker_environment(monkeypatch, tmp_path, telegram.base_url, llm.base_url)
+            monkeypatch.setenv('WORKER_HEARTBEAT_TIMEOUT', '5')
+            from config import get_config
+            supervisor = Supervisor(get_config(), 2)
+            supervisor.start()
+            monitor = asyncio.create_task(supervisor.monitor())
+            try:
+                supervisor.dispatch(make_message_update(1, 100, "до зависания"))
+                await wait_for(lambda: len(telegram.answers) == 1)
+                first_pid = supervisor.workers[0].process.pid
+
+                # SIGTERM группе процессов обрабатывает только супервизор
+                os.kill(first_pid, signal.SIGTERM)
+                await asyncio.sleep(0.3)
+                survived_sigterm = supervisor.workers[0].process.is_alive()
+
+                # Зависший процесс не получит обновление - его получит процесс, запущенный вместо него
+                os.kill(first_pid, signal.SIGSTOP)
+                supervisor.dispatch(make_message_update(2, 102, "во время зависания"))
+                await wait_for(lambda: len(telegram.answers) == 2)
+                return survived_sigterm, supervisor.workers[0].restarts, telegram.answers
+            finally:
+                monitor.cancel()
+                await supervisor.stop()
+
+    survived_sigterm, restarts, answers = asyncio.run(scenario())
+
+    assert survived_sigterm
+    assert restarts == 1
+    assert [answer['text'] for answer in answers] == ["Ответ заглушки", "Ответ заглушки"]
+    assert int(answers[1]['chat_id']) == 102
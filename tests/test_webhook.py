@@ -0,0 +1,82 @@
+"""
+Тесты приема обновлений через webhook.
+"""
+import sys
+import os
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from aiogram import Bot, Dispatcher, Router, types
+from aiohttp.test_utils import TestClient, TestServer
+
+from fake_telegram import make_message_update
+from webhook import create_webhook_app
+
+WEBHOOK_CONFIG = {'WEBHOOK_SECRET': 'test_secret', 'WEBHOOK_PATH': '/webhook'}
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def make_app(handled: list, delay: float = 0.0):
+    router = Router()
+    
+    @router.message()
+    async def record_message(message: types.Message):
+        await asyncio.sleep(delay)
+        handled.append(message.text)
+    
+    async def on_shutdown():
+        handled.append("остановка диспетчера")
+    
+    dp = Dispatcher()
+    dp.include_router(router)
+    dp.shutdown.register(on_shutdown)
+    bot = Bot(token='123456:TEST')
+    close_session = bot.session.close
+    
+    async def record_session_close():
+        handled.append("сессия закрыта")
+        await close_session()
+    
+    bot.session.close = record_session_close
+    return create_webhook_app(bot, dp, WEBHOOK_CONFIG)
+
+
+def test_rejects_wrong_secret_and_handles_valid_update():
+    handled = []
+    
+    async def scenario():
+        async with TestClient(TestServer(make_app(handled))) as client:
+            rejected = await client.post('/webhook', json=make_message_update(1, 10, "чужой"),
+                                         headers={SECRET_HEADER: 'wrong'})
+            accepted = await client.post('/webhook', json=make_message_update(2, 10, "привет"),
+                                         headers={SECRET_HEADER: 'test_secret'})
+            await asyncio.sleep(0.05)
+            return rejected.status, accepted.status
+    
+    rejected_status, accepted_status = asyncio.run(scenario())
+    
+    assert rejected_status == 401
+    assert accepted_status == 200
+    assert handled == ["привет", "остановка диспетчера", "сессия закрыта"]
+
+
+def test_ack_does_not_wait_for_handler_and_shutdown_drains():
+    handled = []
+    
+    async def scenario():
+        client = TestClient(TestServer(make_app(handled, delay=0.3)))
+        await client.start_server()
+        started = asyncio.get_running_loop().time()
+        response = await client.post('/webhook', json=make_message_update(1, 10, "долгий"),
+                                     headers={SECRET_HEADER: 'test_secret'})
+        ack_time = asyncio.get_running_loop().time() - started
+        await client.close()
+        return response.status, ack_time
+    
+    status, ack_time = asyncio.run(scenario())
+    
+    assert status == 200
+    assert ack_time < 0.2
+    # Остановка сервера дождалась обработчика, затем остановила диспетчер и только потом закрыла сессию бота
+    assert handled == ["долгий", "остановка диспетчера", "сессия закрыта"]